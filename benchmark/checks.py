@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#
+# migration runs for situations which the synthetic benchmark does not cover
+#
+# every scenario migrates a small generated blog (see generate.py) in a new
+# process, and checks the log output and the result:
+#  - deleted-posting: a posting is deleted between the query for the
+#    postings and the query for the bodies (a live blog), the posting is
+#    skipped and counted as ignored
+#  - spawn-verbose: --jobs with worker processes which are started with
+#    'spawn' instead of 'fork' (default on macOS and Windows), the workers
+#    log with the level from -v
+#
+# usage:
+#   checks.py [--scenario deleted-posting] [--scenario spawn-verbose] [--keep]
+
+import os
+import sys
+import shutil
+import logging
+import argparse
+import multiprocessing
+import tempfile
+import subprocess
+import importlib.util
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ['deleted-posting', 'spawn-verbose']
+
+# the posting which is deleted in the deleted-posting scenario
+DELETED_ENTRY_ID = 7
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Run s9y-to-hugo.py in situations which the benchmark does not cover')
+    parser.add_argument('--scenario', dest = 'scenarios', action = 'append', choices = SCENARIOS, help = 'run only this scenario, can be specified multiple times (default: all)')
+    parser.add_argument('--posts', default = 40, type = int, dest = 'posts', help = 'number of postings in the generated blog (default: 40)')
+    parser.add_argument('--keep', default = False, dest = 'keep', action = 'store_true', help = 'keep the working directory')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+    parser.add_argument('--run-scenario', default = '', dest = 'run_scenario', help = argparse.SUPPRESS)
+    parser.add_argument('--workdir', default = '', dest = 'workdir', help = argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if (args.scenarios is None):
+        args.scenarios = SCENARIOS
+    if (args.posts <= DELETED_ENTRY_ID):
+        print("Error: posts must be larger than {i}".format(i = DELETED_ENTRY_ID))
+        sys.exit(1)
+
+    return args
+
+
+# load_migration_module()
+#
+# load s9y-to-hugo.py as module, the filename is not a valid module name
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+# return:
+#  - module
+def load_migration_module(path):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', path)
+    module = importlib.util.module_from_spec(spec)
+    # the worker processes of --jobs find their functions by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# migration_arguments()
+#
+# command line for a migration of the generated blog
+#
+# parameter:
+#  - working directory
+# return:
+#  - list with arguments
+def migration_arguments(workdir):
+    return ['s9y-to-hugo.py',
+            '--dbtype', 'snapshot',
+            '--dbname', os.path.join(workdir, 'blog.sqlite'),
+            '--dbprefix', 'serendipity',
+            '--imagedir', os.path.join(workdir, 'images'),
+            '--targetdir', os.path.join(workdir, 'site'),
+            '--hugo-bin', os.path.join(BENCHMARK_DIR, 'hugo-stub'),
+            '--oldwebprefix', '/blog',
+            '--rewritefile', os.path.join(workdir, 'redirect.txt'),
+            '--rewritetype', 'apache2']
+
+
+def scenario_deleted_posting(args):
+    module = load_migration_module(args.script)
+    entry_bodies = module.DatabaseSnapshot.entry_bodies
+
+    # the posting is gone when the bodies are loaded
+    def entry_bodies_after_delete(self, ids):
+        return [b for b in entry_bodies(self, ids) if (b['id'] != DELETED_ENTRY_ID)]
+
+    module.DatabaseSnapshot.entry_bodies = entry_bodies_after_delete
+    sys.argv = migration_arguments(args.workdir)
+    module.main()
+
+
+def check_deleted_posting(output, workdir):
+    errors = []
+    if ("Posting was deleted during the migration" not in output):
+        errors.append("no warning for the deleted posting")
+    if ("INFO: 1 postings ignored" not in output):
+        errors.append("deleted posting is not counted as ignored")
+
+    return errors
+
+
+def scenario_spawn_verbose(args):
+    multiprocessing.set_start_method('spawn')
+    sys.argv = migration_arguments(args.workdir) + ['--jobs', '3', '-v']
+    # run like 'python s9y-to-hugo.py': the spawned workers import the script
+    # again by path, as '__mp_main__', and the results refer to that name
+    spec = importlib.util.spec_from_file_location('__main__', args.script)
+    module = importlib.util.module_from_spec(spec)
+    module.__spec__ = None
+    sys.modules['__main__'] = module
+    sys.modules['__mp_main__'] = module
+    spec.loader.exec_module(module)
+
+
+def check_spawn_verbose(output, workdir):
+    errors = []
+    # the images are placed while the postings are converted, in the workers
+    moved = len([l for l in output.splitlines() if (l.startswith('DEBUG: Move image'))])
+    if (moved == 0):
+        errors.append("no debug messages from the worker processes")
+
+    return errors
+
+
+SCENARIO_FUNCTIONS = {'deleted-posting': (scenario_deleted_posting, check_deleted_posting),
+                      'spawn-verbose': (scenario_spawn_verbose, check_spawn_verbose)}
+
+
+def prepare_site(workdir):
+    site = os.path.join(workdir, 'site')
+    if (os.path.exists(site)):
+        shutil.rmtree(site)
+    if (os.path.exists(os.path.join(workdir, 'redirect.txt'))):
+        os.remove(os.path.join(workdir, 'redirect.txt'))
+    os.makedirs(os.path.join(site, 'content'))
+    os.makedirs(os.path.join(site, 'archetypes'))
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+
+    if (args.run_scenario != ''):
+        SCENARIO_FUNCTIONS[args.run_scenario][0](args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix = 's9y-checks-')
+    failed = []
+    try:
+        p = subprocess.run([sys.executable, os.path.join(BENCHMARK_DIR, 'generate.py'),
+                            '--output', os.path.join(workdir, 'blog.sqlite'),
+                            '--imagedir', os.path.join(workdir, 'images'),
+                            '--posts', str(args.posts),
+                            '--script', args.script])
+        if (p.returncode != 0):
+            logging.error("Generating the blog failed, RC: {rc}".format(rc = p.returncode))
+            sys.exit(1)
+
+        for scenario in args.scenarios:
+            prepare_site(workdir)
+            p = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                '--script', os.path.abspath(args.script),
+                                '--workdir', workdir,
+                                '--run-scenario', scenario],
+                               stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+            errors = []
+            if (p.returncode != 0):
+                errors.append("migration failed, RC: {rc}".format(rc = p.returncode))
+            errors += SCENARIO_FUNCTIONS[scenario][1](p.stdout, workdir)
+            if (len(errors) == 0):
+                logging.info("{s}: ok".format(s = scenario))
+                continue
+            for error in errors:
+                logging.error("{s}: {e}".format(s = scenario, e = error))
+            print(p.stdout, end = '')
+            failed.append(scenario)
+    finally:
+        if (args.keep):
+            logging.info("Working directory: {w}".format(w = workdir))
+        else:
+            shutil.rmtree(workdir)
+
+    if (len(failed) > 0):
+        logging.error("{n} scenarios failed: {s}".format(n = len(failed), s = ', '.join(failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+#
+# conformance of the database backends (DatabasePG, DatabaseMySQL)
+#
+# starts a PostgreSQL and a MySQL/MariaDB container, creates the S9y tables
+# (with the column types S9y uses on every database), and loads the same blog
+# into both: a snapshot from generate.py, plus rows which the migration must
+# filter or keep apart (permalinks of categories, per-author settings, tags
+# which only differ in case, non-ASCII text)
+# every method the migration reads with is called on both databases, and the
+# result, including the types and the row order, is compared against the
+# snapshot (DatabaseSnapshot), and both databases are exported into a
+# snapshot with --export-snapshot and compared table by table
+# the rows must come in the order of the ORDER BY column, rows with the
+# same value in that column can come in any order
+# a small --db-itersize makes the streaming queries fetch many batches
+#
+# usage:
+#   conformance.py [--snapshot blog.sqlite] [--container-tool docker] [--check] [--keep]
+
+import os
+import sys
+import time
+import types
+import shutil
+import sqlite3
+import logging
+import argparse
+import subprocess
+import importlib.util
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DBNAME = 'blog'
+DBUSER = 'blog'
+DBPASS = 's9y-conformance'
+DBPREFIX = 'serendipity'
+
+# S9y tables as created by S9y, with more columns than the migration reads
+SCHEMA = {
+    'pg': [
+        'CREATE TABLE "{p}_authors" (authorid SERIAL PRIMARY KEY, realname VARCHAR(255) NOT NULL DEFAULT \'\', username VARCHAR(32), password VARCHAR(64), email VARCHAR(128) NOT NULL DEFAULT \'\')',
+        'CREATE TABLE "{p}_category" (categoryid SERIAL PRIMARY KEY, category_name VARCHAR(255), category_description TEXT, parentid INT NOT NULL DEFAULT 0)',
+        'CREATE TABLE "{p}_entrycat" (entryid INT NOT NULL, categoryid INT NOT NULL)',
+        'CREATE TABLE "{p}_entrytags" (entryid INT NOT NULL DEFAULT 0, tag VARCHAR(50) NOT NULL DEFAULT \'\', PRIMARY KEY (entryid, tag))',
+        'CREATE TABLE "{p}_references" (id SERIAL PRIMARY KEY, entry_id INT NOT NULL DEFAULT 0, link TEXT, name TEXT, type VARCHAR(128) NOT NULL DEFAULT \'\')',
+        'CREATE TABLE "{p}_permalinks" (permalink VARCHAR(255) NOT NULL, entry_id INT NOT NULL, type VARCHAR(200) NOT NULL, data TEXT)',
+        'CREATE TABLE "{p}_entries" (id SERIAL PRIMARY KEY, title VARCHAR(200), timestamp INT, body TEXT, comments INT DEFAULT 0, extended TEXT, author VARCHAR(20), authorid INT, isdraft BOOLEAN NOT NULL DEFAULT true, last_modified INT)',
+        'CREATE TABLE "{p}_config" (name VARCHAR(255) NOT NULL, value TEXT NOT NULL, authorid INT DEFAULT 0)',
+    ],
+    'mysql': [
+        'CREATE TABLE `{p}_authors` (authorid INT(11) NOT NULL AUTO_INCREMENT PRIMARY KEY, realname VARCHAR(255) NOT NULL DEFAULT \'\', username VARCHAR(32), password VARCHAR(64), email VARCHAR(128) NOT NULL DEFAULT \'\') DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_category` (categoryid INT(11) NOT NULL AUTO_INCREMENT PRIMARY KEY, category_name VARCHAR(255), category_description TEXT, parentid INT(11) NOT NULL DEFAULT 0) DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_entrycat` (entryid INT(11) NOT NULL, categoryid INT(11) NOT NULL) DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_entrytags` (entryid INT(10) UNSIGNED NOT NULL DEFAULT 0, tag VARCHAR(50) NOT NULL DEFAULT \'\', PRIMARY KEY (entryid, tag)) DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_references` (id INT(11) NOT NULL AUTO_INCREMENT PRIMARY KEY, entry_id INT(10) UNSIGNED NOT NULL DEFAULT 0, link TEXT, name TEXT, type VARCHAR(128) NOT NULL DEFAULT \'\') DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_permalinks` (permalink VARCHAR(255) NOT NULL, entry_id INT(10) UNSIGNED NOT NULL, type VARCHAR(200) NOT NULL, data TEXT) DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_entries` (id INT(11) NOT NULL AUTO_INCREMENT PRIMARY KEY, title VARCHAR(200), timestamp INT(10) UNSIGNED, body LONGTEXT, comments INT(4) UNSIGNED DEFAULT 0, extended LONGTEXT, author VARCHAR(20), authorid INT(11), isdraft ENUM(\'true\', \'false\') NOT NULL DEFAULT \'true\', last_modified INT(10) UNSIGNED) DEFAULT CHARSET = utf8mb4',
+        'CREATE TABLE `{p}_config` (name VARCHAR(255) NOT NULL, value TEXT NOT NULL, authorid INT(11) DEFAULT 0) DEFAULT CHARSET = utf8mb4',
+    ],
+}
+
+# rows which are added to the generated blog, (table, row)
+EXTRA_ROWS = [
+    # only permalinks of the type 'entry' are read
+    ('permalinks', {'entry_id': 1, 'permalink': 'categories/1-Category.html', 'type': 'category'}),
+    ('permalinks', {'entry_id': 2, 'permalink': 'authors/2-Author.html', 'type': 'author'}),
+    # only global settings (authorid = 0) are read
+    ('config', {'name': 'fetchLimit', 'value': '99', 'authorid': 1}),
+    ('config', {'name': 'blogTitle', 'value': 'Conformance', 'authorid': 0}),
+    # tags which only differ in case are different tags, and have separate counts
+    # (the MySQL collation is case insensitive, the same posting can't have both)
+    ('entrytags', {'entryid': 1, 'tag': 'Linux'}),
+    ('entrytags', {'entryid': 2, 'tag': 'linux'}),
+    ('entrytags', {'entryid': 3, 'tag': 'linux'}),
+    ('entrytags', {'entryid': 2, 'tag': 'Über Dinge'}),
+    ('entrytags', {'entryid': 3, 'tag': 'über dinge'}),
+    ('category', {'categoryid': 1000, 'category_name': 'Größe & Maße / 🇩🇪'}),
+    ('entrycat', {'entryid': 3, 'categoryid': 1000}),
+    ('references', {'id': 1000000, 'entry_id': 3, 'link': 'https://example.org/ümlaut?a=1&b=2'}),
+]
+
+# methods of Database which return rows, and the ORDER BY column
+ROW_METHODS = [('authors', 'authorid'),
+               ('categories', 'categoryid'),
+               ('entry_categories', 'entryid'),
+               ('tags', 'entryid'),
+               ('exits', 'id'),
+               ('entry_permalinks', 'entry_id'),
+               ('entries', 'id'),
+               ('config_entries', None)]
+# methods of Database which return a dictionary
+COUNT_METHODS = ['count_entries_by_author', 'count_entries_by_category', 'count_entries_by_tag']
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Compare the PostgreSQL and MySQL backends of s9y-to-hugo.py')
+    parser.add_argument('--snapshot', default = '', dest = 'snapshot', help = 'blog to load into the databases (default: generate one with generate.py)')
+    parser.add_argument('--posts', default = 300, type = int, dest = 'posts', help = 'number of postings for the generated blog (default: 300)')
+    parser.add_argument('--workdir', default = os.path.join(BENCHMARK_DIR, 'work', 'conformance'), dest = 'workdir', help = 'directory for the snapshots (removed before every run)')
+    parser.add_argument('--container-tool', default = 'docker', dest = 'container_tool', help = 'docker or podman (default: docker)')
+    parser.add_argument('--pg-image', default = 'postgres:16', dest = 'pg_image', help = 'PostgreSQL image (default: postgres:16)')
+    parser.add_argument('--mysql-image', default = 'mariadb:11', dest = 'mysql_image', help = 'MySQL or MariaDB image, for example mysql:8.4 (default: mariadb:11)')
+    parser.add_argument('--db-itersize', default = 7, type = int, dest = 'db_itersize', help = 'number of rows fetched at once when streaming (default: 7)')
+    parser.add_argument('--timeout', default = 180, type = int, dest = 'timeout', help = 'seconds to wait for the databases to start (default: 180)')
+    parser.add_argument('--keep', default = False, dest = 'keep', action = 'store_true', help = 'keep the containers running')
+    parser.add_argument('--check', default = False, dest = 'check', action = 'store_true', help = 'fail if a backend differs from the snapshot')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+
+    args = parser.parse_args()
+    if (args.db_itersize < 1):
+        print("Error: db-itersize must be at least 1")
+        sys.exit(1)
+    if (shutil.which(args.container_tool) is None):
+        print("Error: {t} not found".format(t = args.container_tool))
+        sys.exit(1)
+
+    return args
+
+
+# load_migration_module()
+#
+# load s9y-to-hugo.py as module, the filename is not a valid module name
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+# return:
+#  - module
+def load_migration_module(path):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# start_container()
+#
+# start a database container, the port is published on a random local port
+#
+# parameter:
+#  - arguments
+#  - dbtype
+# return:
+#  - container id
+#  - local port
+def start_container(args, dbtype):
+    if (dbtype == 'pg'):
+        image = args.pg_image
+        port = '5432'
+        environment = {'POSTGRES_DB': DBNAME, 'POSTGRES_USER': DBUSER, 'POSTGRES_PASSWORD': DBPASS}
+    else:
+        image = args.mysql_image
+        port = '3306'
+        # the MySQL and the MariaDB images use different variables
+        environment = {'MYSQL_DATABASE': DBNAME, 'MYSQL_USER': DBUSER, 'MYSQL_PASSWORD': DBPASS, 'MYSQL_RANDOM_ROOT_PASSWORD': '1',
+                       'MARIADB_DATABASE': DBNAME, 'MARIADB_USER': DBUSER, 'MARIADB_PASSWORD': DBPASS, 'MARIADB_RANDOM_ROOT_PASSWORD': '1'}
+
+    command = [args.container_tool, 'run', '--detach', '--publish', '127.0.0.1::{p}'.format(p = port)]
+    for name, value in environment.items():
+        command += ['--env', '{n}={v}'.format(n = name, v = value)]
+    command.append(image)
+    logging.info("Starting {i}".format(i = image))
+    container = subprocess.run(command, check = True, capture_output = True, text = True).stdout.strip()
+    mapping = subprocess.run([args.container_tool, 'port', container, '{p}/tcp'.format(p = port)], check = True, capture_output = True, text = True).stdout
+    # 127.0.0.1:49153
+    local_port = mapping.splitlines()[0].rsplit(':', 1)[1]
+
+    return container, local_port
+
+
+def stop_container(args, container):
+    subprocess.run([args.container_tool, 'rm', '--force', '--volumes', container], capture_output = True)
+
+
+# connect()
+#
+# connect to the database with the driver the migration uses,
+# retry until the database accepts connections
+#
+# parameter:
+#  - dbtype
+#  - local port
+#  - timeout in seconds
+# return:
+#  - connection
+def connect(dbtype, port, timeout):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            if (dbtype == 'pg'):
+                import psycopg2
+                conn = psycopg2.connect(host = '127.0.0.1', port = port, dbname = DBNAME, user = DBUSER, password = DBPASS)
+            else:
+                import mysql.connector
+                conn = mysql.connector.connect(host = '127.0.0.1', port = port, database = DBNAME, user = DBUSER, password = DBPASS, charset = 'utf8mb4')
+            return conn
+        except Exception as e:
+            if (time.time() > deadline):
+                logging.error("Database {d} did not start: {e}".format(d = dbtype, e = e))
+                raise
+            time.sleep(2)
+
+
+# load_blog()
+#
+# create the S9y tables, and copy the blog from the snapshot into the database
+#
+# parameter:
+#  - module
+#  - dbtype
+#  - connection
+#  - snapshot file
+# return:
+#  none
+def load_blog(module, dbtype, conn, snapshot):
+    cursor = conn.cursor()
+    for statement in SCHEMA[dbtype]:
+        cursor.execute(statement.format(p = DBPREFIX))
+
+    reference = open_snapshot(module, snapshot)
+    for table, (columns, order_by, where) in module.DatabaseSnapshot.snapshot_tables.items():
+        if (dbtype == 'pg'):
+            identifiers = ['"{c}"'.format(c = c) for c in columns]
+            insert = 'INSERT INTO "{p}_{t}" ({c}) VALUES ({v})'
+        else:
+            identifiers = ['`{c}`'.format(c = c) for c in columns]
+            insert = 'INSERT INTO `{p}_{t}` ({c}) VALUES ({v})'
+        insert = insert.format(p = DBPREFIX, t = table, c = ', '.join(identifiers), v = ', '.join(['%s'] * len(columns)))
+        rows = []
+        # all rows, in the order of the snapshot, also the ones the migration does not read
+        for row in reference.iterate_table(table, None, columns):
+            values = [row[c] for c in columns]
+            if (dbtype == 'mysql'):
+                values = [('true' if v else 'false') if isinstance(v, bool) else v for v in values]
+            rows.append(values)
+        cursor.executemany(insert, rows)
+        logging.info("{d}: {n} rows in {t}".format(d = dbtype, n = len(rows), t = table))
+    conn.commit()
+    conn.close()
+
+
+# prepare_snapshot()
+#
+# generate the blog (or copy the given snapshot), and add the extra rows
+#
+# parameter:
+#  - arguments
+# return:
+#  - snapshot file
+def prepare_snapshot(args):
+    snapshot = os.path.join(args.workdir, 'blog.sqlite')
+    if (args.snapshot != ''):
+        shutil.copyfile(args.snapshot, snapshot)
+    else:
+        subprocess.run([sys.executable, os.path.join(BENCHMARK_DIR, 'generate.py'),
+                        '--output', snapshot,
+                        '--imagedir', os.path.join(args.workdir, 'images'),
+                        '--posts', str(args.posts),
+                        '--images', '0',
+                        '--script', args.script], check = True)
+
+    conn = sqlite3.connect(snapshot)
+    for table, row in EXTRA_ROWS:
+        conn.execute('INSERT INTO "{t}" ({c}) VALUES ({v})'.format(t = table,
+                                                                   c = ', '.join(['"{c}"'.format(c = c) for c in row]),
+                                                                   v = ', '.join(['?'] * len(row))),
+                     list(row.values()))
+    conn.commit()
+    conn.close()
+
+    return snapshot
+
+
+def open_snapshot(module, snapshot):
+    return module.DatabaseSnapshot(types.SimpleNamespace(arguments = types.SimpleNamespace(dbname = snapshot)))
+
+
+# open_database()
+#
+# open the database like the migration does, with the command line options
+#
+# parameter:
+#  - module
+#  - dbtype
+#  - local port
+#  - arguments
+#  - snapshot file for --export-snapshot
+# return:
+#  - Database
+def open_database(module, dbtype, port, args, export_file):
+    sys.argv = ['s9y-to-hugo.py',
+                '--dbtype', dbtype,
+                '--dbhost', '127.0.0.1',
+                '--dbport', port,
+                '--dbuser', DBUSER,
+                '--dbpass', DBPASS,
+                '--dbname', DBNAME,
+                '--dbprefix', DBPREFIX,
+                '--db-itersize', str(args.db_itersize),
+                '--export-snapshot', export_file]
+    config = module.Config()
+    config.parse_parameters()
+
+    return module.Database(config)
+
+
+# normalize()
+#
+# rows as lists of (column, type, value), the types must be the same as well
+#
+# parameter:
+#  - rows
+# return:
+#  - list
+def normalize(rows):
+    return [sorted([(k, type(v).__name__, v) for k, v in dict(row).items()]) for row in rows]
+
+
+# compare()
+#
+# compare a result against the reference
+#
+# parameter:
+#  - expected rows
+#  - rows
+#  - ORDER BY column (None: the order is not defined)
+# return:
+#  - None if identical, otherwise a description of the difference
+def compare(expected, result, order_by):
+    expected = [dict(row) for row in expected]
+    result = [dict(row) for row in result]
+    if (len(expected) != len(result)):
+        return "{r} rows, expected {e}".format(r = len(result), e = len(expected))
+    if (order_by is not None):
+        for n, (e, r) in enumerate(zip(expected, result)):
+            if (e[order_by] != r[order_by]):
+                return "wrong order at row {n}: {o} = {r}, expected {e}".format(n = n, o = order_by, r = r[order_by], e = e[order_by])
+    # the order within the same ORDER BY value is not defined
+    expected = sorted(normalize(expected))
+    result = sorted(normalize(result))
+    for e, r in zip(expected, result):
+        if (e != r):
+            return "{r}, expected {e}".format(r = r, e = e)
+
+    return None
+
+
+# run_checks()
+#
+# call the methods of the migration on the database, and compare them against the reference
+#
+# parameter:
+#  - module
+#  - Database
+#  - reference (DatabaseSnapshot)
+#  - snapshot exported from the database
+#  - snapshot file for the export
+# return:
+#  - dictionary with check -> difference (None if identical)
+def run_checks(module, database, reference, export_file):
+    results = {}
+    for method, order_by in ROW_METHODS:
+        results[method] = compare(getattr(reference, method)(), getattr(database, method)(), order_by)
+    for method in COUNT_METHODS:
+        results[method] = compare([{'key': k, 'count': v} for k, v in getattr(reference, method)().items()],
+                                  [{'key': k, 'count': v} for k, v in getattr(database, method)().items()], None)
+    results['oldest_entry_timestamp'] = compare([{'timestamp': reference.oldest_entry_timestamp()}],
+                                                [{'timestamp': database.oldest_entry_timestamp()}], None)
+    ids = [e['id'] for e in reference.entries()][::3]
+    # the order of the bodies is not defined
+    results['entry_bodies'] = compare(reference.entry_bodies(ids), database.entry_bodies(ids), None)
+
+    database.export_snapshot(export_file)
+    exported = open_snapshot(module, export_file)
+    for table, (columns, order_by, where) in module.DatabaseSnapshot.snapshot_tables.items():
+        results['export {t}'.format(t = table)] = compare(list(reference.iterate_table(table, order_by, columns, where)),
+                                                          list(exported.iterate_table(table, order_by, columns, where)),
+                                                          order_by)
+
+    return results
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    module = load_migration_module(args.script)
+    args.workdir = os.path.abspath(args.workdir)
+    if (os.path.exists(args.workdir)):
+        shutil.rmtree(args.workdir)
+    os.makedirs(args.workdir)
+
+    snapshot = prepare_snapshot(args)
+    reference = open_snapshot(module, snapshot)
+
+    containers = []
+    results = {}
+    try:
+        ports = {}
+        for dbtype in ('pg', 'mysql'):
+            container, ports[dbtype] = start_container(args, dbtype)
+            containers.append(container)
+        for dbtype in ('pg', 'mysql'):
+            load_blog(module, dbtype, connect(dbtype, ports[dbtype], args.timeout), snapshot)
+            database = open_database(module, dbtype, ports[dbtype], args, os.path.join(args.workdir, 'export-{d}.sqlite'.format(d = dbtype)))
+            results[dbtype] = run_checks(module, database, reference, os.path.join(args.workdir, 'export-{d}.sqlite'.format(d = dbtype)))
+    finally:
+        if (args.keep):
+            logging.info("Containers are still running: {c}".format(c = ' '.join(containers)))
+        else:
+            for container in containers:
+                stop_container(args, container)
+
+    failed = False
+    print("{c:<32}{p:<12}{m:<12}".format(c = 'check', p = 'pg', m = 'mysql'))
+    for check in results['pg']:
+        print("{c:<32}{p:<12}{m:<12}".format(c = check,
+                                             p = 'identical' if (results['pg'][check] is None) else 'DIFFERS',
+                                             m = 'identical' if (results['mysql'][check] is None) else 'DIFFERS'))
+    for dbtype in ('pg', 'mysql'):
+        for check, difference in results[dbtype].items():
+            if (difference is not None):
+                failed = True
+                logging.warning("{d} {c}: {x}".format(d = dbtype, c = check, x = difference))
+
+    if (failed and args.check):
+        logging.error("The database backends differ from the snapshot")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
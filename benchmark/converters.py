@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#
+# conformance and throughput of the HTML converters (see --html-converter)
+#
+# converts every document of the corpus (html-corpus/, plus the postings of
+# a snapshot with --snapshot) with every converter, compares the result
+# against the reference (markdownify with html.parser), and measures the
+# throughput
+#
+# usage:
+#   converters.py [--snapshot blog.sqlite] [--repeat 3] [--diff] [--check]
+
+import os
+import sys
+import glob
+import time
+import types
+import difflib
+import logging
+import argparse
+import importlib.util
+import sqlite3
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# converter name -> (--html-converter, --html-parser)
+CONVERTERS = {'markdownify': ('markdownify', 'html.parser'),
+              'markdownify-lxml': ('markdownify', 'lxml'),
+              'streaming': ('streaming', 'html.parser')}
+REFERENCE = 'markdownify'
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Compare the HTML converters of s9y-to-hugo.py')
+    parser.add_argument('--corpus', default = os.path.join(BENCHMARK_DIR, 'html-corpus'), dest = 'corpus', help = 'directory with the HTML documents (default: html-corpus)')
+    parser.add_argument('--snapshot', default = '', dest = 'snapshot', help = 'also convert the postings from this snapshot (see generate.py and --export-snapshot)')
+    parser.add_argument('--converter', dest = 'converters', action = 'append', choices = list(CONVERTERS), help = 'only test this converter (can be specified multiple times, default: all)')
+    parser.add_argument('--repeat', default = 3, type = int, dest = 'repeat', help = 'number of runs for the throughput, the fastest run is reported (default: 3)')
+    parser.add_argument('--diff', default = False, dest = 'diff', action = 'store_true', help = 'show the differences to the reference converter')
+    parser.add_argument('--check', default = False, dest = 'check', action = 'store_true', help = 'fail if a converter differs from the reference on the corpus')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+
+    args = parser.parse_args()
+    if (args.repeat < 1):
+        print("Error: repeat must be at least 1")
+        sys.exit(1)
+    if (args.converters is None):
+        args.converters = list(CONVERTERS)
+    if (REFERENCE not in args.converters):
+        args.converters.insert(0, REFERENCE)
+
+    return args
+
+
+# load_migration_module()
+#
+# load s9y-to-hugo.py as module, the filename is not a valid module name
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+# return:
+#  - module
+def load_migration_module(path):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.import_conversion_modules()
+
+    return module
+
+
+# load_documents()
+#
+# load the corpus, and the postings from a snapshot
+#
+# parameter:
+#  - arguments
+# return:
+#  - list with (name, HTML, in corpus) tuples
+def load_documents(args):
+    documents = []
+    for f in sorted(glob.glob(os.path.join(args.corpus, '*.html'))):
+        with open(f) as fh:
+            documents.append((os.path.basename(f), fh.read(), True))
+
+    if (args.snapshot != ''):
+        conn = sqlite3.connect(args.snapshot)
+        for id, body, extended in conn.execute('SELECT id, body, extended FROM entries ORDER BY id'):
+            # the same as the migration does
+            documents.append(('posting {id}'.format(id = id), (body or '') + "\n\n" + (extended or ''), False))
+        conn.close()
+
+    return documents
+
+
+def create_converter(module, name):
+    converter, parser = CONVERTERS[name]
+    config = types.SimpleNamespace(arguments = types.SimpleNamespace(html_converter = converter,
+                                                                     html_parser = parser,
+                                                                     profile = False,
+                                                                     profile_json = ''))
+
+    return module.HtmlConverter(config, module.Profiler(config))
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    module = load_migration_module(args.script)
+    documents = load_documents(args)
+    if (len(documents) == 0):
+        logging.error("No documents found")
+        sys.exit(1)
+    total_bytes = sum([len(d[1].encode()) for d in documents])
+    logging.info("{n} documents, {b:.1f} MB".format(n = len(documents), b = total_bytes / 1024 / 1024))
+
+    reference = None
+    failed = False
+    print("{c:<20}{v:<32}{s:>12}{d:>12}{m:>10}{i:>14}".format(c = 'converter', v = 'version', s = 'seconds', d = 'docs/sec', m = 'MB/sec', i = 'identical'))
+    for name in args.converters:
+        try:
+            converter = create_converter(module, name)
+        except ImportError as e:
+            logging.warning("Skipping {c}: {e}".format(c = name, e = e))
+            continue
+
+        best = None
+        for n in range(args.repeat):
+            start = time.perf_counter()
+            results = [converter.convert(d[1])[0] for d in documents]
+            seconds = time.perf_counter() - start
+            if (best is None or seconds < best):
+                best = seconds
+
+        if (reference is None):
+            reference = results
+        identical = 0
+        for d, result, expected in zip(documents, results, reference):
+            if (result == expected):
+                identical += 1
+                continue
+            if (d[2] and args.check):
+                failed = True
+            if (args.diff):
+                print(''.join(difflib.unified_diff(expected.splitlines(True), result.splitlines(True),
+                                                   '{d} ({r})'.format(d = d[0], r = REFERENCE),
+                                                   '{d} ({c})'.format(d = d[0], c = name))))
+
+        print("{c:<20}{v:<32}{s:>12.3f}{d:>12.1f}{m:>10.2f}{i:>14}".format(c = name,
+                                                                          v = converter.version,
+                                                                          s = best,
+                                                                          d = len(documents) / best if (best > 0) else 0,
+                                                                          m = total_bytes / 1024 / 1024 / best if (best > 0) else 0,
+                                                                          i = '{i}/{n}'.format(i = identical, n = len(documents))))
+
+    if (failed):
+        logging.error("Converters differ from {r} on the corpus".format(r = REFERENCE))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+#
+# generate a synthetic S9y blog as snapshot file (see --export-snapshot),
+# plus a matching image directory
+#
+# the snapshot can be migrated with:
+#   s9y-to-hugo.py --dbtype snapshot --dbname <snapshot> --imagedir <imagedir> ...
+
+import os
+import sys
+import random
+import logging
+import argparse
+import importlib.util
+import sqlite3
+import json
+import time
+
+
+WORDS = ("PostgreSQL database blog Hugo migration query index table replication backup "
+         "performance server conference talk community release version feature upgrade "
+         "the a of and to in is for on with this that from by at as").split()
+
+
+# load_migration_module()
+#
+# load s9y-to-hugo.py as module, the filename is not a valid module name
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+# return:
+#  - module
+def load_migration_module(path):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Generate a synthetic S9y blog snapshot for benchmarking')
+    parser.add_argument('--output', required = True, dest = 'output', help = 'snapshot file (must not exist)')
+    parser.add_argument('--imagedir', required = True, dest = 'imagedir', help = 'directory for the images (created if missing)')
+    parser.add_argument('--posts', default = 1000, type = int, dest = 'posts', help = 'number of blog postings (default: 1000)')
+    parser.add_argument('--body-size', default = 4000, type = int, dest = 'body_size', help = 'approximate size of a posting body in bytes (default: 4000)')
+    parser.add_argument('--images', default = 200, type = int, dest = 'images', help = 'number of distinct images (default: 200)')
+    parser.add_argument('--image-size', default = 50000, type = int, dest = 'image_size', help = 'size of every image in bytes (default: 50000)')
+    parser.add_argument('--images-per-post', default = 2, type = int, dest = 'images_per_post', help = 'maximum number of images in a posting (default: 2)')
+    parser.add_argument('--tags', default = 100, type = int, dest = 'tags', help = 'number of distinct tags (default: 100)')
+    parser.add_argument('--tags-per-post', default = 3, type = int, dest = 'tags_per_post', help = 'maximum number of tags for a posting (default: 3)')
+    parser.add_argument('--categories', default = 20, type = int, dest = 'categories', help = 'number of categories (default: 20)')
+    parser.add_argument('--references', default = 3, type = int, dest = 'references', help = 'maximum number of exit links in a posting (default: 3)')
+    parser.add_argument('--authors', default = 3, type = int, dest = 'authors', help = 'number of authors (default: 3)')
+    parser.add_argument('--fetch-limit', default = 15, type = int, dest = 'fetch_limit', help = 'S9y fetchLimit setting (default: 15)')
+    parser.add_argument('--seed', default = 42, type = int, dest = 'seed', help = 'random seed, the same seed generates the same blog (default: 42)')
+    parser.add_argument('--script', default = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+
+    args = parser.parse_args()
+
+    if (os.path.exists(args.output)):
+        print("Error: output must not exist")
+        sys.exit(1)
+
+    return args
+
+
+# title_slug()
+#
+# S9y style filename for a title
+#
+# parameter:
+#  - title
+# return:
+#  - slug
+def title_slug(title):
+    return '-'.join([w.capitalize() for w in title.split()])
+
+
+def sentence(rnd, min_words, max_words):
+    return ' '.join([rnd.choice(WORDS) for _ in range(rnd.randint(min_words, max_words))])
+
+
+# html_body()
+#
+# generate a S9y posting body with the usual constructs:
+# paragraphs, links, images with s9ymdb comments, unsupported tags, quotes and shortcode braces
+#
+# parameter:
+#  - random generator
+#  - approximate size in bytes
+#  - list with image paths (relative to imagedir)
+#  - maximum number of images
+# return:
+#  - HTML body
+def html_body(rnd, size, images, images_per_post):
+    parts = []
+    length = 0
+    number_images = rnd.randint(0, images_per_post) if len(images) > 0 else 0
+    while (length < size):
+        p = sentence(rnd, 20, 80)
+        r = rnd.random()
+        if (r < 0.15):
+            p += ' <b>bold *stars*</b> and <em>emphasis</em>'
+        elif (r < 0.25):
+            p += ' <a href="https://www.example.org/{w}">{w}</a>'.format(w = rnd.choice(WORDS))
+        elif (r < 0.30):
+            p += ' <u>underlined</u> <strike>old</strike>'
+        elif (r < 0.35):
+            p += ' "quoted" text with {{ braces }}'
+        elif (r < 0.40):
+            p = '<pre>SELECT * FROM {w} WHERE id = 1;</pre>'.format(w = rnd.choice(WORDS))
+        part = '<p>{p}</p>\n'.format(p = p)
+        if (number_images > 0 and rnd.random() < 0.3):
+            number_images -= 1
+            img = rnd.choice(images)
+            part += '<!-- s9ymdb:{id} --><img class="serendipity_image_center" src="/uploads/{img}" alt="{alt}" title="{alt}" />\n'.format(id = rnd.randint(1, 100000),
+                                                                                                                                            img = img,
+                                                                                                                                            alt = sentence(rnd, 1, 4))
+        parts.append(part)
+        length += len(part)
+
+    return ''.join(parts)
+
+
+def generate_images(args, rnd):
+    images = []
+    for i in range(args.images):
+        subdir = 'dir{d:02d}'.format(d = i % 10)
+        name = '{subdir}/image-{i}.jpg'.format(subdir = subdir, i = i)
+        path = os.path.join(args.imagedir, 'uploads', name)
+        images.append(name)
+        if (os.path.exists(path) and os.path.getsize(path) == args.image_size):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wb') as f:
+            # unique content for every image, for the content-addressed store
+            header = 'image {i}\n'.format(i = i).encode()
+            f.write(header + bytes(rnd.getrandbits(8) for _ in range(min(64, args.image_size))) + b'\0' * max(0, args.image_size - len(header) - 64))
+
+    return images
+
+
+def generate_tables(args, rnd, images):
+    tables = {t: [] for t in ['authors', 'category', 'entrycat', 'entrytags', 'references', 'permalinks', 'entries', 'config']}
+
+    for a in range(1, args.authors + 1):
+        tables['authors'].append({'authorid': a, 'username': 'author{a}'.format(a = a), 'realname': 'Author Number {a}'.format(a = a)})
+    for c in range(1, args.categories + 1):
+        tables['category'].append({'categoryid': c, 'category_name': 'Category {c} {w}'.format(c = c, w = rnd.choice(WORDS))})
+    tag_names = ['tag{t} {w}'.format(t = t, w = rnd.choice(WORDS)) for t in range(args.tags)]
+
+    timestamp = 1104537600
+    reference_id = 0
+    for i in range(1, args.posts + 1):
+        # a posting every few days
+        timestamp += rnd.randint(3600, 5 * 86400)
+        title = '{s} {i}'.format(s = sentence(rnd, 2, 6), i = i)
+        tables['entries'].append({'id': i,
+                                  'title': title,
+                                  'timestamp': timestamp,
+                                  'body': html_body(rnd, args.body_size, images, args.images_per_post),
+                                  'extended': html_body(rnd, args.body_size // 2, images, 1) if rnd.random() < 0.3 else '',
+                                  'authorid': rnd.randint(1, args.authors),
+                                  'isdraft': rnd.random() < 0.02,
+                                  'last_modified': timestamp + rnd.randint(0, 86400)})
+        tables['permalinks'].append({'entry_id': i, 'permalink': 'archives/{i}-{s}.html'.format(i = i, s = title_slug(title)), 'type': 'entry'})
+        if (args.categories > 0):
+            tables['entrycat'].append({'entryid': i, 'categoryid': rnd.randint(1, args.categories)})
+        if (args.tags > 0):
+            for t in rnd.sample(tag_names, rnd.randint(0, min(args.tags_per_post, args.tags))):
+                tables['entrytags'].append({'entryid': i, 'tag': t})
+        for r in range(rnd.randint(0, args.references)):
+            reference_id += 1
+            tables['references'].append({'id': reference_id, 'entry_id': i, 'link': 'http://www.example.org/{w}?id={r}&amp;x=1'.format(w = rnd.choice(WORDS), r = reference_id)})
+
+    tables['config'] = [{'name': 'fetchLimit', 'value': str(args.fetch_limit), 'authorid': 0},
+                        {'name': 'useServerOffset', 'value': 'false', 'authorid': 0},
+                        {'name': 'serverOffsetHours', 'value': '0', 'authorid': 0}]
+
+    return tables
+
+
+# write_snapshot()
+#
+# write the tables in the format of DatabaseSnapshot
+#
+# parameter:
+#  - DatabaseSnapshot class
+#  - snapshot filename
+#  - dictionary with table -> list of rows
+#  - generator parameters, stored in the snapshot
+# return:
+#  none
+def write_snapshot(snapshot_class, output, tables, parameters):
+    conn = sqlite3.connect(output)
+    conn.execute('CREATE TABLE snapshot_info (name TEXT PRIMARY KEY, value TEXT)')
+    conn.execute('CREATE TABLE snapshot_columns (table_name TEXT, column_name TEXT, type TEXT)')
+    conn.executemany('INSERT INTO snapshot_info (name, value) VALUES (?, ?)',
+                     [('version', str(snapshot_class.snapshot_version)),
+                      ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                      ('dbtype', 'synthetic'),
+                      ('dbprefix', 'serendipity'),
+                      ('generator', json.dumps(parameters, sort_keys = True))])
+    conn.execute("INSERT INTO snapshot_columns (table_name, column_name, type) VALUES ('entries', 'isdraft', 'bool')")
+
+    for table, (columns, order_by, where) in snapshot_class.snapshot_tables.items():
+        conn.execute('CREATE TABLE "{t}" ({c})'.format(t = table, c = ', '.join(['"{c}"'.format(c = c) for c in columns])))
+        conn.executemany('INSERT INTO "{t}" VALUES ({v})'.format(t = table, v = ', '.join(['?'] * len(columns))),
+                         [[row[c] for c in columns] for row in tables[table]])
+        if (order_by is not None):
+            conn.execute('CREATE INDEX "{t}_{o}" ON "{t}" ("{o}")'.format(t = table, o = order_by))
+        logging.info("{t}: {n} rows".format(t = table, n = len(tables[table])))
+
+    conn.commit()
+    conn.close()
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    module = load_migration_module(args.script)
+    rnd = random.Random(args.seed)
+
+    start = time.time()
+    images = generate_images(args, rnd)
+    tables = generate_tables(args, rnd, images)
+    parameters = {k: v for k, v in vars(args).items() if k not in ['output', 'imagedir', 'script']}
+    write_snapshot(module.DatabaseSnapshot, args.output, tables, parameters)
+    logging.info("Snapshot {f} generated in {s:.1f}s".format(f = args.output, s = time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
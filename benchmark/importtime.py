@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+# check the startup imports of s9y-to-hugo.py against a budget
+#
+# runs s9y-to-hugo.py with "python -X importtime" for every scenario in the
+# budget file (--help, argument errors, ...) and fails if a forbidden module
+# is imported, or if the imports take longer than the budget
+#
+# usage:
+#   importtime.py [--budget importtime-budget.json] [--repeat 5] [--verbose]
+
+import os
+import sys
+import json
+import logging
+import argparse
+import subprocess
+import statistics
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Check the startup imports of s9y-to-hugo.py')
+    parser.add_argument('--budget', default = os.path.join(BENCHMARK_DIR, 'importtime-budget.json'), dest = 'budget', help = 'budget file (default: importtime-budget.json)')
+    parser.add_argument('--repeat', default = 5, type = int, dest = 'repeat', help = 'number of runs per scenario, the median is checked (default: 5)')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+    parser.add_argument('--verbose', default = False, action = 'store_true', dest = 'verbose', help = 'show the slowest imports of every scenario')
+
+    args = parser.parse_args()
+    if (args.repeat < 1):
+        print("Error: repeat must be at least 1")
+        sys.exit(1)
+
+    return args
+
+
+# parse_importtime()
+#
+# parse the "-X importtime" output
+#
+# parameter:
+#  - stderr of the Python process
+# return:
+#  - dictionary with module -> cumulative time in microseconds
+#  - total time of all top-level imports in microseconds
+def parse_importtime(output):
+    modules = {}
+    total = 0
+    for line in output.splitlines():
+        if (not line.startswith('import time:')):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if (len(fields) != 3 or not fields[1].strip().isdigit()):
+            # header line
+            continue
+        cumulative = int(fields[1])
+        name = fields[2].rstrip()
+        # nested imports are indented, top-level imports have a single space
+        if (not name.startswith('  ')):
+            total += cumulative
+        modules[name.strip()] = cumulative
+
+    return modules, total
+
+
+# run_scenario()
+#
+# run s9y-to-hugo.py once with import timing
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+#  - list with arguments
+# return:
+#  - dictionary with module -> cumulative time in microseconds
+#  - total time of all top-level imports in microseconds
+def run_scenario(script, arguments):
+    command = [sys.executable, '-X', 'importtime', script] + arguments
+    env = dict(os.environ)
+    # the import times must not include writing bytecode
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    p = subprocess.run(command, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, text = True, env = env)
+
+    return parse_importtime(p.stderr)
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+
+    with open(args.budget) as f:
+        budget = json.load(f)
+
+    failed = False
+    for scenario in budget['scenarios']:
+        totals = []
+        for n in range(args.repeat):
+            modules, total = run_scenario(args.script, scenario['arguments'])
+            totals.append(total)
+        total_ms = statistics.median(totals) / 1000
+
+        forbidden = sorted([m for m in budget['forbidden'] if m in modules])
+        if (len(forbidden) > 0):
+            logging.error("{s}: forbidden modules imported: {m}".format(s = scenario['name'], m = ', '.join(forbidden)))
+            failed = True
+        if (total_ms > scenario['budget_ms']):
+            logging.error("{s}: imports took {t:.1f}ms, budget is {b}ms".format(s = scenario['name'], t = total_ms, b = scenario['budget_ms']))
+            failed = True
+        else:
+            logging.info("{s}: imports took {t:.1f}ms (budget: {b}ms)".format(s = scenario['name'], t = total_ms, b = scenario['budget_ms']))
+
+        if (args.verbose):
+            for m, t in sorted(modules.items(), key = lambda x: x[1], reverse = True)[:10]:
+                logging.info("    {t:>8.1f}ms  {m}".format(t = t / 1000, m = m))
+
+    if (failed):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
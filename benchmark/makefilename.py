@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+#
+# conformance and throughput of _serendipity_makeFilename()
+#
+# the old URLs of authors, categories and tags are built with
+# _serendipity_makeFilename(), every difference breaks the redirects
+# the names in makefilename-corpus.json (umlauts, accents, emoji flag
+# letters, '&', '%', '/', quotes, ...) are converted, and compared against
+# the output of the previous implementation (three replacement passes,
+# kept below as reference), which is stored in the corpus
+# --random also compares random strings against the reference
+#
+# usage:
+#   makefilename.py [--snapshot blog.sqlite] [--random 50000] [--repeat 3] [--check]
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import importlib.util
+import sqlite3
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# characters for the random strings, the replaced characters are over-represented
+RANDOM_CHARACTERS = ("abcXYZ09 -_.&%/'\"?#+~"
+                     "ÄäÖöÜüßéèêíìîáàâåóòôõúùûçÇñý"
+                     "øãëÿæœÉÀ€©"
+                     "🇦🇧🇨🇩🇪🇫🇬🇭🇮🇯🇰🇱🇲🇳🇴🇵🇶🇷🇸🇹🇺🇻🇼🇽🇾🇿"
+                     "日本語中文́‍😀")
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Compare _serendipity_makeFilename() of s9y-to-hugo.py against the previous implementation')
+    parser.add_argument('--corpus', default = os.path.join(BENCHMARK_DIR, 'makefilename-corpus.json'), dest = 'corpus', help = 'file with the names and the expected results (default: makefilename-corpus.json)')
+    parser.add_argument('--snapshot', default = '', dest = 'snapshot', help = 'also convert the author, category and tag names from this snapshot (see generate.py and --export-snapshot)')
+    parser.add_argument('--random', default = 0, type = int, dest = 'random', help = 'also compare this number of random strings against the reference')
+    parser.add_argument('--seed', default = 1, type = int, dest = 'seed', help = 'seed for the random strings (default: 1)')
+    parser.add_argument('--repeat', default = 3, type = int, dest = 'repeat', help = 'number of runs for the throughput, the fastest run is reported (default: 3)')
+    parser.add_argument('--check', default = False, dest = 'check', action = 'store_true', help = 'fail if a result differs from the corpus or the reference')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+
+    args = parser.parse_args()
+    if (args.repeat < 1):
+        print("Error: repeat must be at least 1")
+        sys.exit(1)
+    if (args.random < 0):
+        print("Error: random must not be negative")
+        sys.exit(1)
+
+    return args
+
+
+# reference_makeFilename()
+#
+# the previous implementation of _serendipity_makeFilename(), unchanged
+#
+# parameter:
+#  - string
+# return:
+#  - filename
+def reference_makeFilename(string):
+    replacements = {'🇦': 'A',
+                    '🇧': 'B',
+                    '🇨': 'C',
+                    '🇩': 'D',
+                    '🇪': 'E',
+                    '🇫': 'F',
+                    '🇬': 'G',
+                    '🇭': 'H',
+                    '🇮': 'I',
+                    '🇯': 'J',
+                    '🇰': 'K',
+                    '🇱': 'L',
+                    '🇲': 'M',
+                    '🇳': 'N',
+                    '🇴': 'O',
+                    '🇵': 'P',
+                    '🇶': 'Q',
+                    '🇷': 'R',
+                    '🇸': 'S',
+                    '🇹': 'T',
+                    '🇺': 'U',
+                    '🇻': 'V',
+                    '🇼': 'W',
+                    '🇽': 'X',
+                    '🇾': 'Y',
+                    '🇿': 'Z'}
+    replaced = [replacements.get(char, char) for char in str(string)]
+    string = ''.join(replaced)
+
+    replacements = {' ': '-',
+                    '%': '%25',
+                    'Ä': 'AE',
+                    'ä': 'ae',
+                    'Ö': 'OE',
+                    'ö': 'oe',
+                    'Ü': 'UE',
+                    'ü': 'ue',
+                    'ß': 'ss',
+                    'é': 'e',
+                    'è': 'e',
+                    'ê': 'e',
+                    'í': 'i',
+                    'ì': 'i',
+                    'î': 'i',
+                    'á': 'a',
+                    'à': 'a',
+                    'â': 'a',
+                    'å': 'a',
+                    'ó': 'o',
+                    'ò': 'o',
+                    'ô': 'o',
+                    'õ': 'o',
+                    'ú': 'u',
+                    'ù': 'u',
+                    'û': 'u',
+                    'ç': 'c',
+                    'Ç': 'C',
+                    'ñ': 'n',
+                    'ý': 'y'}
+    replaced = [replacements.get(char, char) for char in string]
+    string = ''.join(replaced)
+
+    replacements = {' ': '_',
+                    '&': '%25',
+                    'Ä': 'AE',
+                    'ä': 'ae',
+                    'Ö': 'OE',
+                    'ö': 'oe',
+                    'Ü': 'UE',
+                    'ü': 'ue',
+                    'ß': 'ss',
+                    'é': 'e',
+                    'è': 'e',
+                    'ê': 'e',
+                    'í': 'i',
+                    'ì': 'i',
+                    'î': 'i',
+                    'á': 'a',
+                    'à': 'a',
+                    'â': 'a',
+                    'å': 'a',
+                    'ó': 'o',
+                    'ò': 'o',
+                    'ô': 'o',
+                    'õ': 'o',
+                    'ú': 'u',
+                    'ù': 'u',
+                    'û': 'u',
+                    'ç': 'c',
+                    'Ç': 'C',
+                    'ñ': 'n',
+                    'ý': 'y',
+                    '/': ''}
+    replaced = [replacements.get(char, char) for char in string]
+    string = ''.join(replaced)
+
+    string = string.replace("'", "")
+
+    return string
+
+
+# load_migration_module()
+#
+# load s9y-to-hugo.py as module, the filename is not a valid module name
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+# return:
+#  - module
+def load_migration_module(path):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# load_names()
+#
+# load the names from the snapshot, the same names the migration converts
+#
+# parameter:
+#  - snapshot file
+# return:
+#  - list with names
+def load_names(snapshot):
+    conn = sqlite3.connect(snapshot)
+    names = [r[0] for r in conn.execute('SELECT realname FROM authors ORDER BY authorid')]
+    names += [r[0] for r in conn.execute('SELECT category_name FROM category ORDER BY categoryid')]
+    # every tag is converted once for the main URL, and once for every listing page
+    names += [r[0] for r in conn.execute('SELECT tag FROM entrytags ORDER BY entryid, tag')]
+    conn.close()
+
+    return names
+
+
+def random_names(number, seed):
+    generator = random.Random(seed)
+    return [''.join(generator.choice(RANDOM_CHARACTERS) for n in range(generator.randint(0, 24))) for n in range(number)]
+
+
+# measure()
+#
+# convert all names, the fastest of several runs counts
+#
+# parameter:
+#  - function
+#  - list with names
+#  - number of runs
+#  - function which is called before every run (optional)
+# return:
+#  - seconds
+def measure(function, names, repeat, before = None):
+    best = None
+    for n in range(repeat):
+        if (before is not None):
+            before()
+        start = time.perf_counter()
+        for name in names:
+            function(name)
+        seconds = time.perf_counter() - start
+        if (best is None or seconds < best):
+            best = seconds
+
+    return best
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    module = load_migration_module(args.script)
+    # _serendipity_makeFilename() does not use the state of the migration
+    migration = object.__new__(module.Migration)
+    makeFilename = migration._serendipity_makeFilename
+
+    with open(args.corpus, encoding = 'utf8') as f:
+        corpus = json.load(f)
+    failed = False
+    for name, expected in corpus:
+        reference = reference_makeFilename(name)
+        result = makeFilename(name)
+        if (reference != expected):
+            # the corpus was not written by the reference
+            logging.error("Corpus differs from the reference: {n!r} -> {e!r}, reference: {r!r}".format(n = name, e = expected, r = reference))
+            failed = True
+        if (result != expected):
+            logging.error("Result differs from the corpus: {n!r} -> {r!r}, expected: {e!r}".format(n = name, r = result, e = expected))
+            failed = True
+    logging.info("{n} names in the corpus".format(n = len(corpus)))
+
+    names = [c[0] for c in corpus]
+    if (args.snapshot != ''):
+        names += load_names(args.snapshot)
+    if (args.random > 0):
+        names += random_names(args.random, args.seed)
+    differences = 0
+    for name in names:
+        if (makeFilename(name) != reference_makeFilename(name)):
+            differences += 1
+            if (differences <= 10):
+                logging.error("Result differs from the reference: {n!r} -> {r!r}, reference: {e!r}".format(n = name,
+                                                                                                           r = makeFilename(name),
+                                                                                                           e = reference_makeFilename(name)))
+    if (differences > 0):
+        failed = True
+    logging.info("{n} names compared against the reference, {d} differences".format(n = len(names), d = differences))
+
+    # the names repeat in a migration, which is what the cache is for
+    runs = [('reference', reference_makeFilename, None),
+            ('uncached', module.Migration._makeFilename.__wrapped__, None),
+            ('cached (cold)', makeFilename, module.Migration._makeFilename.cache_clear),
+            ('cached (warm)', makeFilename, None)]
+    reference_seconds = None
+    print("{f:<20}{s:>12}{n:>14}{c:>10}".format(f = 'implementation', s = 'seconds', n = 'names/sec', c = 'speedup'))
+    for title, function, before in runs:
+        seconds = measure(function, names, args.repeat, before)
+        if (reference_seconds is None):
+            reference_seconds = seconds
+        print("{f:<20}{s:>12.4f}{n:>14.0f}{c:>9.1f}x".format(f = title,
+                                                             s = seconds,
+                                                             n = len(names) / seconds if (seconds > 0) else 0,
+                                                             c = reference_seconds / seconds if (seconds > 0) else 0))
+
+    if (failed and args.check):
+        logging.error("_serendipity_makeFilename() differs from the previous implementation")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#
+# conformance of the Markdown fixes (see Migration._fix_markdown())
+#
+# the documents in markdown-corpus/ are Markdown as it comes out of the
+# HTML converter, every document is fixed like the migration does it
+# (blank lines, image comments, image paths and placement, missing pictures,
+# '\*', '{{ }}'), and the result is compared against the expected output
+# next to it (<name>.expected.md), cases.json has the options for every
+# document, and the placed images and the image redirects
+# the expected output was written by the implementation before the single
+# pass rewrite, --update writes it with the current implementation
+#
+# usage:
+#   markdown.py [--diff] [--check] [--update]
+
+import os
+import sys
+import json
+import types
+import shutil
+import difflib
+import logging
+import argparse
+import tempfile
+import importlib.util
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OLD_WEBPREFIX = '/blog/'
+NEW_WEBPREFIX = '/'
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Compare the Markdown fixes of s9y-to-hugo.py against the expected output')
+    parser.add_argument('--corpus', default = os.path.join(BENCHMARK_DIR, 'markdown-corpus'), dest = 'corpus', help = 'directory with the Markdown documents (default: markdown-corpus)')
+    parser.add_argument('--diff', default = False, dest = 'diff', action = 'store_true', help = 'show the differences to the expected output')
+    parser.add_argument('--check', default = False, dest = 'check', action = 'store_true', help = 'fail if a document differs from the expected output')
+    parser.add_argument('--update', default = False, dest = 'update', action = 'store_true', help = 'write the expected output with the current implementation')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+
+    return parser.parse_args()
+
+
+# load_migration_module()
+#
+# load s9y-to-hugo.py as module, the filename is not a valid module name
+#
+# parameter:
+#  - path to s9y-to-hugo.py
+# return:
+#  - module
+def load_migration_module(path):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# records the images instead of copying them
+class RecordingPlacer:
+    def __init__(self, targetdir):
+        self.targetdir = targetdir
+        self.placed = []
+
+
+    def place(self, source, target):
+        self.placed.append([os.path.basename(source), os.path.relpath(target, self.targetdir)])
+
+
+# records the image redirects instead of writing them
+class RecordingRedirects:
+    def __init__(self):
+        self.rules = []
+
+
+    def add(self, old_url, new_url, **kwargs):
+        self.rules.append([old_url, new_url])
+
+
+# fix_document()
+#
+# fix a single document, like Migration._rewrite_html() does
+#
+# parameter:
+#  - module
+#  - Markdown
+#  - options for the document
+#  - directory with the images
+#  - working directory
+# return:
+#  - dictionary with the Markdown, the quotes flag, the placed images and the redirects
+def fix_document(module, md, case, imagedir, workdir):
+    targetdir = os.path.join(workdir, 'site')
+    link = "{owp}archives/1-posting.html".format(owp = OLD_WEBPREFIX)
+    new_link = "{nwp}2023/01/posting/".format(nwp = NEW_WEBPREFIX)
+    if (case['use_bundles']):
+        new_full_file = os.path.join(targetdir, 'content', '2023', '01', 'posting', 'index.md')
+    else:
+        new_full_file = os.path.join(targetdir, 'content', '2023', '01', 'posting.md')
+    arguments = types.SimpleNamespace(imagedir = imagedir,
+                                      targetdir = targetdir,
+                                      oldwebprefix = OLD_WEBPREFIX,
+                                      webprefix = NEW_WEBPREFIX,
+                                      use_bundles = case['use_bundles'],
+                                      ignore_picture_errors = [link] if (case['ignore_picture_errors']) else None)
+
+    # only the attributes which are used for fixing the Markdown
+    migration = object.__new__(module.Migration)
+    migration.config = types.SimpleNamespace(arguments = arguments)
+    migration.images = None
+    migration.existing_images = set()
+    migration.image_placer = RecordingPlacer(targetdir)
+    redirects = RecordingRedirects()
+
+    md, quotes_changed = migration._fix_markdown(md, link, new_link, new_full_file, redirects)
+    md = "{md}\n".format(md = md.strip())
+
+    return {'markdown': md,
+            'quotes_changed': quotes_changed,
+            'images': migration.image_placer.placed,
+            'redirects': redirects.rules}
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    module = load_migration_module(args.script)
+    cases_file = os.path.join(args.corpus, 'cases.json')
+    with open(cases_file, encoding = 'utf8') as f:
+        cases = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix = 's9y-markdown-')
+    identical = 0
+    try:
+        for name, case in cases.items():
+            with open(os.path.join(args.corpus, name + '.md'), encoding = 'utf8') as f:
+                result = fix_document(module, f.read(), case, os.path.join(args.corpus, 'images'), workdir)
+            expected_file = os.path.join(args.corpus, name + '.expected.md')
+
+            if (args.update):
+                with open(expected_file, 'w', encoding = 'utf8') as f:
+                    f.write(result['markdown'])
+                for key in ('quotes_changed', 'images', 'redirects'):
+                    case[key] = result[key]
+                continue
+
+            with open(expected_file, encoding = 'utf8') as f:
+                expected = f.read()
+            differences = []
+            if (result['markdown'] != expected):
+                differences.append('Markdown')
+            for key in ('quotes_changed', 'images', 'redirects'):
+                if (result[key] != case[key]):
+                    differences.append(key)
+            if (len(differences) == 0):
+                identical += 1
+                continue
+
+            logging.warning("{n}: differs in {d}".format(n = name, d = ', '.join(differences)))
+            if (args.diff):
+                print(''.join(difflib.unified_diff(expected.splitlines(True), result['markdown'].splitlines(True),
+                                                   '{n} (expected)'.format(n = name),
+                                                   '{n} (result)'.format(n = name))), end = '')
+                for key in ('quotes_changed', 'images', 'redirects'):
+                    if (result[key] != case[key]):
+                        print("{k}: expected {e}, result {r}".format(k = key, e = case[key], r = result[key]))
+    finally:
+        shutil.rmtree(workdir)
+
+    if (args.update):
+        with open(cases_file, 'w', encoding = 'utf8') as f:
+            # one line for every document
+            f.write("{\n" + ",\n".join(['  {n}: {c}'.format(n = json.dumps(name), c = json.dumps(case, ensure_ascii = False)) for name, case in cases.items()]) + "\n}\n")
+        logging.info("Expected output written for {n} documents".format(n = len(cases)))
+        return
+
+    logging.info("{i}/{n} documents identical".format(i = identical, n = len(cases)))
+    if (identical != len(cases) and args.check):
+        logging.error("Markdown fixes differ from the expected output")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
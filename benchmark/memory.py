@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+# memory usage of the data which the migration keeps for the blog
+#
+# runs the migration phases against a snapshot (see generate.py) with
+# tracemalloc, and reports for every phase the memory which is still
+# allocated after the phase (authors, categories, tags, permalinks, ... are
+# kept until the end of the migration), and the peak within the phase
+# the entries phase converts every posting and is slow with tracemalloc,
+# it only runs with --entries
+#
+# every script runs in a new process, with several --script options the
+# first one is the baseline, and the others are compared against it
+#
+# usage:
+#   memory.py --snapshot blog.sqlite [--script old.py --script new.py] [--entries] [-- <s9y-to-hugo options>]
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import subprocess
+import importlib.util
+import tracemalloc
+
+
+# the migration phases, in the order main() runs them
+PHASES = ['archive', 'authors', 'categories', 'entry_categories', 'tags', 'permalinks', 'exits', 'entries']
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Measure the memory usage of s9y-to-hugo.py against a snapshot')
+    parser.add_argument('--snapshot', required = True, dest = 'snapshot', help = 'snapshot file (see generate.py)')
+    parser.add_argument('--imagedir', default = '', dest = 'imagedir', help = 'image directory of the snapshot')
+    parser.add_argument('--workdir', default = os.path.join(BENCHMARK_DIR, 'work', 'memory'), dest = 'workdir', help = 'directory for the Hugo site (removed before every run)')
+    parser.add_argument('--script', dest = 'scripts', action = 'append', help = 'path to s9y-to-hugo.py, can be specified multiple times, the first one is the baseline (default: ../s9y-to-hugo.py)')
+    parser.add_argument('--entries', default = False, dest = 'entries', action = 'store_true', help = 'also run the entries phase (converts every posting, slow)')
+    parser.add_argument('--output', default = '', dest = 'output', help = 'write the results as JSON into this file')
+    parser.add_argument('--run-once', default = '', dest = 'run_once', help = argparse.SUPPRESS)
+    parser.add_argument('options', nargs = '*', help = 'additional options for s9y-to-hugo.py (after --)')
+
+    args = parser.parse_args()
+    if (args.scripts is None):
+        args.scripts = [os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py')]
+    if (args.entries and args.imagedir == ''):
+        print("Error: --entries requires --imagedir")
+        sys.exit(1)
+
+    return args
+
+
+# run_once()
+#
+# run the migration phases once, in this process, and write the results
+#
+# parameter:
+#  - arguments
+# return:
+#  none
+def run_once(args):
+    script = args.scripts[0]
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', script)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    sitedir = os.path.join(args.workdir, 'site')
+    sys.argv = ['s9y-to-hugo.py',
+                '--dbtype', 'snapshot',
+                '--dbname', args.snapshot,
+                '--dbprefix', 'serendipity',
+                '--targetdir', sitedir,
+                '--hugo-bin', os.path.join(BENCHMARK_DIR, 'hugo-stub'),
+                '--oldwebprefix', '/blog',
+                '--rewritefile', os.path.join(args.workdir, 'redirect.txt'),
+                '--rewritetype', 'apache2',
+                '--quiet']
+    if (args.imagedir != ''):
+        sys.argv += ['--imagedir', args.imagedir]
+    sys.argv += args.options
+
+    config = module.Config()
+    config.parse_parameters()
+    database = module.Database(config)
+    migration = module.Migration(config, database)
+
+    results = {'script': script, 'phases': {}}
+    # only the memory allocated by the migration phases is counted
+    tracemalloc.start()
+    try:
+        for phase in PHASES:
+            if (phase == 'entries' and not args.entries):
+                continue
+            tracemalloc.reset_peak()
+            getattr(migration, phase)()
+            current, peak = tracemalloc.get_traced_memory()
+            results['phases'][phase] = {'retained': current, 'peak': peak}
+    finally:
+        migration.redirects.close()
+    tracemalloc.stop()
+
+    with open(args.run_once, 'w') as f:
+        json.dump(results, f)
+
+
+def prepare_site(workdir):
+    if (os.path.exists(workdir)):
+        shutil.rmtree(workdir)
+    os.makedirs(os.path.join(workdir, 'site', 'content'))
+    os.makedirs(os.path.join(workdir, 'site', 'archetypes'))
+
+
+def print_results(runs):
+    baseline = runs[0]
+    print("{p:<18}".format(p = 'retained (MB)') + ''.join(["{s:>14}".format(s = 'script {n}'.format(n = n + 1)) for n in range(len(runs))]) + "{c:>10}".format(c = 'change'))
+    for phase in baseline['phases']:
+        line = "{p:<18}".format(p = phase)
+        for r in runs:
+            line += "{v:>14.1f}".format(v = r['phases'][phase]['retained'] / 1024 / 1024)
+        old = baseline['phases'][phase]['retained']
+        new = runs[-1]['phases'][phase]['retained']
+        if (len(runs) > 1 and old > 0):
+            line += "{c:>+9.1f}%".format(c = (new - old) * 100 / old)
+        print(line)
+    print("")
+    print("{p:<18}".format(p = 'peak (MB)') + ''.join(["{s:>14}".format(s = 'script {n}'.format(n = n + 1)) for n in range(len(runs))]))
+    for phase in baseline['phases']:
+        line = "{p:<18}".format(p = phase)
+        for r in runs:
+            line += "{v:>14.1f}".format(v = r['phases'][phase]['peak'] / 1024 / 1024)
+        print(line)
+    print("")
+    for n, r in enumerate(runs):
+        print("script {n}: {s}".format(n = n + 1, s = r['script']))
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    args.snapshot = os.path.abspath(args.snapshot)
+    args.workdir = os.path.abspath(args.workdir)
+    if (args.imagedir != ''):
+        args.imagedir = os.path.abspath(args.imagedir)
+
+    if (args.run_once != ''):
+        run_once(args)
+        return
+
+    runs = []
+    for script in args.scripts:
+        prepare_site(args.workdir)
+        result_file = os.path.join(args.workdir, 'result.json')
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--snapshot', args.snapshot,
+                   '--imagedir', args.imagedir,
+                   '--workdir', args.workdir,
+                   '--script', os.path.abspath(script),
+                   '--run-once', result_file]
+        if (args.entries):
+            command.append('--entries')
+        command += ['--'] + args.options
+        logging.info("Measuring {s}".format(s = script))
+        p = subprocess.run(command)
+        if (p.returncode != 0):
+            logging.error("Benchmark run failed, RC: {rc}".format(rc = p.returncode))
+            sys.exit(1)
+        with open(result_file) as f:
+            runs.append(json.load(f))
+
+    print_results(runs)
+
+    if (args.output != ''):
+        with open(args.output, 'w') as f:
+            json.dump(runs, f, indent = 2, sort_keys = True)
+        logging.info("Results written to {f}".format(f = args.output))
+
+
+if __name__ == '__main__':
+    main()
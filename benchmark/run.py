@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+#
+# end-to-end benchmark for s9y-to-hugo.py
+#
+# migrates a snapshot (see generate.py) into a new Hugo directory, using
+# benchmark/hugo-stub as Hugo binary, and measures every migration phase:
+# wall time, CPU time, peak RSS, syscalls and I/O (from /proc/self/io, Linux only)
+#
+# every repetition runs in a new process, the results are written as JSON
+# and can be compared against an earlier run with --compare
+#
+# usage:
+#   run.py --snapshot blog.sqlite --imagedir images --output result.json [--compare old.json] [-- <s9y-to-hugo options>]
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import subprocess
+import importlib.util
+import sqlite3
+import statistics
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# the migration phases, in the order main() runs them
+PHASES = ['archive', 'authors', 'categories', 'entry_categories', 'tags', 'permalinks', 'exits', 'entries']
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_parameters():
+    parser = argparse.ArgumentParser(description = 'Benchmark s9y-to-hugo.py against a snapshot')
+    parser.add_argument('--snapshot', required = True, dest = 'snapshot', help = 'snapshot file (see generate.py)')
+    parser.add_argument('--imagedir', default = '', dest = 'imagedir', help = 'image directory of the snapshot')
+    parser.add_argument('--workdir', default = os.path.join(BENCHMARK_DIR, 'work'), dest = 'workdir', help = 'directory for the Hugo site (removed before every run)')
+    parser.add_argument('--output', default = '', dest = 'output', help = 'write the results as JSON into this file')
+    parser.add_argument('--compare', default = '', dest = 'compare', help = 'compare the results against this JSON file')
+    parser.add_argument('--repeat', default = 1, type = int, dest = 'repeat', help = 'number of runs, the median is reported (default: 1)')
+    parser.add_argument('--script', default = os.path.join(BENCHMARK_DIR, '..', 's9y-to-hugo.py'), dest = 'script', help = 'path to s9y-to-hugo.py')
+    parser.add_argument('--run-once', default = '', dest = 'run_once', help = argparse.SUPPRESS)
+    parser.add_argument('options', nargs = '*', help = 'additional options for s9y-to-hugo.py (after --)')
+
+    args = parser.parse_args()
+    if (args.repeat < 1):
+        print("Error: repeat must be at least 1")
+        sys.exit(1)
+
+    return args
+
+
+# proc_io()
+#
+# I/O counters of this process
+#
+# parameter:
+#  none
+# return:
+#  - dictionary with syscr, syscw, rchar, wchar, read_bytes, write_bytes (empty if not available)
+def proc_io():
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                k, v = line.split(':', 1)
+                counters[k.strip()] = int(v)
+    except OSError:
+        pass
+
+    return counters
+
+
+def rusage():
+    if (resource is None):
+        return {}
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    factor = 1024 * 1024 if (sys.platform == 'darwin') else 1024
+
+    return {'cpu': self_usage.ru_utime + self_usage.ru_stime,
+            'cpu_children': children_usage.ru_utime + children_usage.ru_stime,
+            'maxrss_mb': self_usage.ru_maxrss / factor,
+            'maxrss_children_mb': children_usage.ru_maxrss / factor,
+            'voluntary_context_switches': self_usage.ru_nvcsw,
+            'involuntary_context_switches': self_usage.ru_nivcsw}
+
+
+def measure():
+    m = {'wall': time.perf_counter()}
+    m.update(rusage())
+    m.update(proc_io())
+
+    return m
+
+
+# delta()
+#
+# difference between two measurements, peak values are taken from the end
+#
+# parameter:
+#  - measurement at the start
+#  - measurement at the end
+# return:
+#  - dictionary with the differences
+def delta(start, end):
+    result = {}
+    for k, v in end.items():
+        if (k.startswith('maxrss')):
+            result[k] = round(v, 1)
+        elif (k in start):
+            result[k] = round(v - start[k], 4) if (isinstance(v, float)) else v - start[k]
+
+    return result
+
+
+# run_once()
+#
+# run the migration once, in this process, and write the results
+#
+# parameter:
+#  - arguments
+# return:
+#  none
+def run_once(args):
+    spec = importlib.util.spec_from_file_location('s9y_to_hugo', args.script)
+    module = importlib.util.module_from_spec(spec)
+    # the worker processes of --jobs find their functions by module name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    sitedir = os.path.join(args.workdir, 'site')
+    sys.argv = ['s9y-to-hugo.py',
+                '--dbtype', 'snapshot',
+                '--dbname', args.snapshot,
+                '--dbprefix', 'serendipity',
+                '--targetdir', sitedir,
+                '--hugo-bin', os.path.join(BENCHMARK_DIR, 'hugo-stub'),
+                '--oldwebprefix', '/blog',
+                '--rewritefile', os.path.join(args.workdir, 'redirect.txt'),
+                '--rewritetype', 'apache2',
+                '--quiet']
+    if (args.imagedir != ''):
+        sys.argv += ['--imagedir', args.imagedir]
+    sys.argv += args.options
+
+    results = {'phases': {}}
+    total_start = measure()
+
+    config = module.Config()
+    config.parse_parameters()
+    database = module.Database(config)
+    migration = module.Migration(config, database)
+    results['phases']['setup'] = delta(total_start, measure())
+
+    try:
+        for phase in PHASES:
+            start = measure()
+            getattr(migration, phase)()
+            results['phases'][phase] = delta(start, measure())
+    finally:
+        start = measure()
+        migration.redirects.close()
+        results['phases']['close'] = delta(start, measure())
+
+    results['total'] = delta(total_start, measure())
+    with open(args.run_once, 'w') as f:
+        json.dump(results, f)
+
+
+def prepare_site(workdir):
+    if (os.path.exists(workdir)):
+        shutil.rmtree(workdir)
+    os.makedirs(os.path.join(workdir, 'site', 'content'))
+    os.makedirs(os.path.join(workdir, 'site', 'archetypes'))
+
+
+def snapshot_details(snapshot):
+    conn = sqlite3.connect(snapshot)
+    details = dict(conn.execute('SELECT name, value FROM snapshot_info').fetchall())
+    details['posts'] = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+    details['body_bytes'] = conn.execute('SELECT SUM(LENGTH(body) + LENGTH(extended)) FROM entries').fetchone()[0] or 0
+    conn.close()
+
+    return details
+
+
+# median_results()
+#
+# combine the results of several runs, every value is the median
+#
+# parameter:
+#  - list with results from run_once()
+# return:
+#  - combined results
+def median_results(runs):
+    combined = {'phases': {}}
+    for phase in runs[0]['phases']:
+        combined['phases'][phase] = {k: statistics.median([r['phases'][phase][k] for r in runs])
+                                     for k in runs[0]['phases'][phase]}
+    combined['total'] = {k: statistics.median([r['total'][k] for r in runs]) for k in runs[0]['total']}
+
+    return combined
+
+
+def print_results(results):
+    columns = ['wall', 'cpu', 'cpu_children', 'maxrss_mb', 'syscr', 'syscw', 'rchar', 'wchar']
+    print("{p:<18}".format(p = 'phase') + ''.join(["{c:>14}".format(c = c) for c in columns]))
+    for phase, values in list(results['phases'].items()) + [('total', results['total'])]:
+        line = "{p:<18}".format(p = phase)
+        for c in columns:
+            v = values.get(c)
+            if (v is None):
+                line += "{v:>14}".format(v = '-')
+            elif (isinstance(v, float)):
+                line += "{v:>14.3f}".format(v = v)
+            else:
+                line += "{v:>14}".format(v = v)
+        print(line)
+    print("")
+    print("posts/sec: {p:.1f}".format(p = results['posts_per_sec']))
+
+
+def print_comparison(old, new):
+    print("")
+    print("{p:<18}{o:>12}{n:>12}{d:>10}".format(p = 'wall time', o = 'old', n = 'new', d = 'change'))
+    for phase in list(new['phases']) + ['total']:
+        new_values = new['total'] if (phase == 'total') else new['phases'][phase]
+        old_values = old['total'] if (phase == 'total') else old['phases'].get(phase)
+        if (old_values is None):
+            print("{p:<18}{o:>12}{n:>12.3f}{d:>10}".format(p = phase, o = '-', n = new_values['wall'], d = '-'))
+            continue
+        if (old_values['wall'] > 0):
+            change = "{c:+.1f}%".format(c = (new_values['wall'] - old_values['wall']) * 100 / old_values['wall'])
+        else:
+            change = '-'
+        print("{p:<18}{o:>12.3f}{n:>12.3f}{d:>10}".format(p = phase, o = old_values['wall'], n = new_values['wall'], d = change))
+    print("{p:<18}{o:>12.1f}{n:>12.1f}".format(p = 'posts/sec', o = old['posts_per_sec'], n = new['posts_per_sec']))
+    print("{p:<18}{o:>12.1f}{n:>12.1f}".format(p = 'peak RSS (MB)', o = old['total'].get('maxrss_mb', 0), n = new['total'].get('maxrss_mb', 0)))
+
+
+def main():
+    logging.basicConfig(level = logging.INFO, format = '%(levelname)s: %(message)s')
+    args = parse_parameters()
+    args.snapshot = os.path.abspath(args.snapshot)
+    args.workdir = os.path.abspath(args.workdir)
+    if (args.imagedir != ''):
+        args.imagedir = os.path.abspath(args.imagedir)
+
+    if (args.run_once != ''):
+        run_once(args)
+        return
+
+    runs = []
+    for n in range(args.repeat):
+        prepare_site(args.workdir)
+        result_file = os.path.join(args.workdir, 'result.json')
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--snapshot', args.snapshot,
+                   '--imagedir', args.imagedir,
+                   '--workdir', args.workdir,
+                   '--script', args.script,
+                   '--run-once', result_file, '--'] + args.options
+        logging.info("Run {n} of {r}".format(n = n + 1, r = args.repeat))
+        p = subprocess.run(command)
+        if (p.returncode != 0):
+            logging.error("Benchmark run failed, RC: {rc}".format(rc = p.returncode))
+            sys.exit(1)
+        with open(result_file) as f:
+            runs.append(json.load(f))
+
+    results = median_results(runs)
+    details = snapshot_details(args.snapshot)
+    results['snapshot'] = details
+    results['options'] = args.options
+    results['repeat'] = args.repeat
+    results['python'] = platform.python_version()
+    results['platform'] = platform.platform()
+    results['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results['posts_per_sec'] = details['posts'] / results['total']['wall'] if (results['total']['wall'] > 0) else 0
+
+    print_results(results)
+
+    if (args.output != ''):
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+        logging.info("Results written to {f}".format(f = args.output))
+
+    if (args.compare != ''):
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,18 +8,38 @@ import shutil
 import logging
 import argparse
 from datetime import datetime
-from dateutil import tz
-from dateutil.tz import *
 import time
-# https://github.com/matthewwithanm/python-markdownify
-import markdownify
 import subprocess
-import frontmatter
-from pprint import pprint
 import io
-from bs4 import BeautifulSoup
 import urllib.parse
-
+import threading
+import queue
+import copy
+import collections
+import functools
+import json
+import hashlib
+import contextlib
+import heapq
+try:
+    # only available on Unix, used for reflinks of images
+    import fcntl
+except ImportError:
+    fcntl = None
+import concurrent.futures
+try:
+    # not available on Windows, only used for reporting the memory usage
+    import resource
+except ImportError:
+    resource = None
+
+# the conversion libraries are loaded by import_conversion_modules(), when
+# a migration starts: --help, argument errors and --export-snapshot don't need them
+# https://github.com/matthewwithanm/python-markdownify
+markdownify = None
+frontmatter = None
+BeautifulSoup = None
+gettz = None
 
 # start with 'info', can be overriden by '-q' later on
 logging.basicConfig(level = logging.INFO,
@@ -49,6 +69,13 @@ class Config:
             sys.exit(1)
 
 
+    # the argument parser can't be copied into worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['argument_parser'] = False
+        return state
+
+
     # config_help()
     #
     # flag if help shall be printed
@@ -93,12 +120,15 @@ class Config:
                                          add_help = False)
         self.argument_parser = parser
         parser.add_argument('--help', default = False, dest = 'help', action = 'store_true', help = 'show this help')
-        parser.add_argument('--dbtype', dest = 'dbtype', choices=['pg', 'mysql'], help = 'type of database (pg for PostgreSQL, mysql for MySQL/MariaDB)')
+        parser.add_argument('--dbtype', dest = 'dbtype', choices=['pg', 'mysql', 'snapshot'], help = 'type of database (pg for PostgreSQL, mysql for MySQL/MariaDB, snapshot for a file written by --export-snapshot), mysql reads with two connections, which can see changes on a live blog at slightly different times')
         parser.add_argument('--dbhost', default = '', dest = 'dbhost', help = 'database host')
         parser.add_argument('--dbuser', default = '', dest = 'dbuser', help = 'database user')
         parser.add_argument('--dbpass', default = '', dest = 'dbpass', help = 'database pass')
-        parser.add_argument('--dbname', default = '', dest = 'dbname', help = 'database name')
+        parser.add_argument('--dbname', default = '', dest = 'dbname', help = 'database name (snapshot file for --dbtype snapshot)')
         parser.add_argument('--dbport', default = '', dest = 'dbport', help = 'database port')
+        parser.add_argument('--db-itersize', default = 500, type = int, dest = 'db_itersize', help = 'number of rows fetched at once when streaming the blog postings (default: 500)')
+        parser.add_argument('--pg-copy', default = False, dest = 'pg_copy', action = 'store_true', help = 'read the blog postings with COPY instead of a cursor (PostgreSQL only)')
+        parser.add_argument('--export-snapshot', default = '', dest = 'export_snapshot', help = 'export the S9y tables into this snapshot file and exit (use with --dbtype snapshot later)')
         parser.add_argument('--dbprefix', default = '', dest = 'dbprefix', help = 'S9Y database prefix', required = True)
         # run Hugo from subdirectory: https://discourse.gohugo.io/t/make-home-to-be-subdirectory/4345/6
         parser.add_argument('--webprefix', default = '/', dest = 'webprefix', help = 'Hugo web prefix')
@@ -107,21 +137,35 @@ class Config:
         parser.add_argument('--imagedir', default = '', dest = 'imagedir', help = 'base directory with images from old blog (must match path in blog postings)')
         # avoid using Hugo aliases, which generate clutter
         # https://gohugo.io/content-management/urls/#aliases
+        parser.add_argument('--image-index', default = '', dest = 'image_index', help = 'file for keeping an index of the images between runs (only changed directories are scanned again)')
         parser.add_argument('--rewritefile', default = '', dest = 'rewritefile', help = 'file for adding URL rewrites from old to new postings')
-        parser.add_argument('--rewritetype', default = '', choices=['apache2'], dest = 'rewritetype', help = 'type of rewrite file (currently only Apache2 is supported)')
+        parser.add_argument('--rewritetype', default = '', choices=['apache2', 'apache2-map', 'apache2-dbm', 'nginx', 'netlify'], dest = 'rewritetype', help = 'type of rewrite file: apache2 (Redirect 301 lines), apache2-map (RewriteMap txt), apache2-dbm (RewriteMap dbm hash), nginx (map), netlify (_redirects)')
+        parser.add_argument('--compact-redirects', default = False, dest = 'compact_redirects', action = 'store_true', help = 'write regex rules for families of similar URLs (archive months, listing pages) instead of one rule per URL (apache2 and nginx only)')
         parser.add_argument('--rewritejson', default = '', dest = 'rewritejson', help = 'JSON file for adding a list of old and new URLs (mainly for use in scripts)')
         parser.add_argument('--httpsexitlist', default = '', dest = 'httpsexitlist', help = 'list with domain names for exit.php transformation which will made https')
         # https://gohugo.io/content-management/organization/
         parser.add_argument('--use-bundles', default = False, dest = 'use_bundles', action = 'store_true', help = 'use Hugo bundles instead of single Markdown files')
+        parser.add_argument('--image-link-mode', default = 'copy', choices=['copy', 'hardlink', 'reflink', 'symlink'], dest = 'image_link_mode', help = 'how images are placed in the Hugo directory, all modes except "copy" store identical images only once (default: copy)')
         parser.add_argument('--remove-s9y-id', default = False, dest = 'remove_s9y_id', action = 'store_true', help = 'remove the S9Y id from URL')
         parser.add_argument('--add-date-to-url', default = False, dest = 'add_date_to_url', action = 'store_true', help = 'add the posting date to the URL')
         parser.add_argument('--ignore-post', dest = 'ignore_post', action = 'append', help = 'ignore this posting (URL) during migration (can be specified multiple times)')
         parser.add_argument('--ignore-picture-errors', dest = 'ignore_picture_errors', action = 'append', help = 'ignore picture errors in this posting (URL) during migration (can be specified multiple times)')
         parser.add_argument('--use-utc', default = False, dest = 'use_utc', action = 'store_true', help = 'use UTC time instead of local time')
+        parser.add_argument('--incremental', default = False, dest = 'incremental', action = 'store_true', help = 'skip postings which did not change since the last run (state is kept in the target directory)')
         parser.add_argument('--write-html', default = False, dest = 'write_html', action = 'store_true', help = 'write a copy of the original HTML to a .html file')
+        parser.add_argument('--html-parser', default = 'html.parser', choices=['html.parser', 'lxml'], dest = 'html_parser', help = 'HTML parser for the blog postings, lxml is faster but must be installed (default: html.parser)')
+        parser.add_argument('--html-converter', default = 'markdownify', choices=['markdownify', 'streaming'], dest = 'html_converter', help = 'markdownify: convert the HTML with markdownify (uses --html-parser), streaming: convert the HTML while parsing, faster, with small differences in the output (default: markdownify)')
+        parser.add_argument('--conversion-cache', default = False, dest = 'conversion_cache', action = 'store_true', help = 'keep the converted Markdown of the postings in a cache in the target directory, and use it again in later runs')
+        parser.add_argument('--conversion-cache-size', default = 256, type = int, dest = 'conversion_cache_size', help = 'maximum size of the conversion cache in MB, the least recently used results are removed (default: 256)')
         parser.add_argument('--archive-link', default = '', dest = 'archive_link', help = 'use this link for archive redirects (othewise webprefix is used)')
         parser.add_argument('--add-year-link-to-archive', default = False, dest = 'add_year_link_to_archive', action = 'store_true', help = 'add redirects to a specific year for the archive links')
+        parser.add_argument('--hugo-config-mode', default = 'auto', choices=['auto', 'native', 'hugo'], dest = 'hugo_config_mode', help = 'auto: read the Hugo configuration files directly, and use "hugo config" only when necessary (themes, modules), native: never run "hugo config", hugo: always run "hugo config" (default: auto)')
         parser.add_argument('--hugo-bin', default = '', dest = 'hugo_bin', help = 'use this binary as Hugo binary (otherwise auto-detected)')
+        parser.add_argument('--jobs', default = 1, type = int, dest = 'jobs', help = 'number of worker processes for converting the postings (default: 1)')
+        parser.add_argument('--archetype-mode', default = 'template', choices=['template', 'hugo'], dest = 'archetype_mode', help = 'template: run "hugo new" once and render new postings in-process, hugo: run "hugo new" for every new posting')
+        parser.add_argument('--profile', default = False, dest = 'profile', action = 'store_true', help = 'print the time spent in every migration phase, and in every stage of the posting conversion')
+        parser.add_argument('--profile-json', default = '', dest = 'profile_json', help = 'write the profile as JSON into this file (implies --profile)')
+        parser.add_argument('--profile-top', default = 10, type = int, dest = 'profile_top', help = 'number of slowest postings in the profile (default: 10)')
         # store_true: store "True" if specified, otherwise store "False"
         # store_false: store "False" if specified, otherwise store "True"
         parser.add_argument('-v', '--verbose', default = False, dest = 'verbose', action = 'store_true', help = 'be more verbose')
@@ -153,6 +197,43 @@ class Config:
             if (args.dbtype == "mysql"):
                 args.dbport = "3306"
 
+        if (args.db_itersize < 1):
+            self.print_help()
+            print("")
+            print("Error: db-itersize must be at least 1")
+            sys.exit(1)
+
+        if (args.pg_copy is True and args.dbtype != "pg"):
+            self.print_help()
+            print("")
+            print("Error: pg-copy requires dbtype pg")
+            sys.exit(1)
+
+        if (args.dbtype == "snapshot"):
+            if (args.export_snapshot != ""):
+                self.print_help()
+                print("")
+                print("Error: export-snapshot requires dbtype pg or mysql")
+                sys.exit(1)
+            if (not os.path.isfile(args.dbname)):
+                self.print_help()
+                print("")
+                print("Error: dbname must be an existing snapshot file for dbtype snapshot")
+                sys.exit(1)
+
+        if (args.export_snapshot != ""):
+            if (os.path.exists(args.export_snapshot)):
+                self.print_help()
+                print("")
+                print("Error: export-snapshot must not exist")
+                sys.exit(1)
+            # nothing else is needed for exporting the snapshot
+            self.__cmdline_read = 1
+            self.arguments = args
+            logging.debug("Commandline arguments successfuly parsed")
+
+            return
+
         if (args.targetdir == ""):
             self.print_help()
             print("")
@@ -191,6 +272,18 @@ class Config:
                 print("Error: rewritetype must be specified when rewritefile is selected")
                 sys.exit(1)
 
+            if (args.compact_redirects is True and args.rewritetype not in ['apache2', 'nginx']):
+                self.print_help()
+                print("")
+                print("Error: compact-redirects requires rewritetype apache2 or nginx")
+                sys.exit(1)
+
+            if (args.rewritetype == 'apache2-dbm' and dbm_module() is None):
+                self.print_help()
+                print("")
+                print("Error: rewritetype apache2-dbm requires the dbm.gnu or dbm.ndbm module")
+                sys.exit(1)
+
         if (args.rewritejson != ""):
             if (os.path.exists(args.rewritejson)):
                 self.print_help()
@@ -216,6 +309,12 @@ class Config:
                 args.imagedir = os.path.realpath(args.imagedir)
                 logging.debug("Setting image dir to absolute path: " + args.imagedir)
 
+        if (args.image_index != "" and args.imagedir == ""):
+            self.print_help()
+            print("")
+            print("Error: image-index requires imagedir")
+            sys.exit(1)
+
         if (args.webprefix[-1] != '/'):
             args.webprefix += '/'
             logging.debug("Add / suffix for web prefix, now: " + args.webprefix)
@@ -246,6 +345,33 @@ class Config:
             args.hugo_bin = hugo
             logging.debug("Choosing {bin} as Hugo executable".format(bin = hugo))
 
+        if (args.html_parser == 'lxml'):
+            try:
+                import lxml
+            except ImportError:
+                self.print_help()
+                print("")
+                print("Error: html-parser lxml requires the lxml module")
+                sys.exit(1)
+
+        if (args.jobs < 1):
+            self.print_help()
+            print("")
+            print("Error: jobs must be at least 1")
+            sys.exit(1)
+
+        if (args.conversion_cache_size < 1):
+            self.print_help()
+            print("")
+            print("Error: conversion-cache-size must be at least 1")
+            sys.exit(1)
+
+        if (args.profile_top < 0):
+            self.print_help()
+            print("")
+            print("Error: profile-top must not be negative")
+            sys.exit(1)
+
         if (args.archive_link == ""):
             if (args.add_year_link_to_archive is True):
                 print("Can't use --add-year-link-to-archive without --archive-link")
@@ -268,14 +394,20 @@ class Config:
 # DatabasePG class
 
 class DatabasePG:
-    # avoid importing the module in the global class space
-    # this way, it's only loaded if someone selects the PostgreSQL driver
-    # otherwise it must be installed all the time, even if someone doesn't need it
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
+    # backslash sequences in the COPY text format
+    copy_unescape_re = re.compile(r'\\(.)')
+    copy_escapes = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
 
 
     def __init__(self, config):
+        # avoid importing the module in the global space
+        # this way, it's only loaded if someone selects the PostgreSQL driver
+        # otherwise it must be installed all the time, even if someone doesn't need it
+        import psycopg2
+        import psycopg2.extras
+        import psycopg2.extensions
+        self.psycopg2 = psycopg2
+
         self.config = config
         self.dbprefix = self.config.arguments.dbprefix
 
@@ -301,11 +433,17 @@ class DatabasePG:
 
             # the self.psycopg2 is required, because the module lives only in this class
             conn = self.psycopg2.connect(connect_string)
+            # all phases run in one read-only transaction, and see the same data
+            conn.set_session(isolation_level = 'REPEATABLE READ', readonly = True)
         except self.psycopg2.DatabaseError as e:
             print('Error %s' % e) 
             sys.exit(1)
 
         self.connection = conn
+        self.connect_string = connect_string
+        self.copy_connection = None
+        self.encoding = self.psycopg2.extensions.encodings[conn.encoding]
+        self.cursor_number = 0
 
 
     # run_query()
@@ -320,7 +458,6 @@ class DatabasePG:
     def run_query(self, query):
         cur = self.connection.cursor()
         cur.execute(query)
-        self.connection.commit()
 
 
     # execute_one()
@@ -339,7 +476,6 @@ class DatabasePG:
         cur.execute(query, param)
         result = cur.fetchone()
 
-        self.connection.commit()
         return result
 
 
@@ -359,87 +495,275 @@ class DatabasePG:
         cur.execute(query, param)
         result = cur.fetchall()
 
-        self.connection.commit()
         return result
 
 
-    def fetch_table(self, table, order_by = None):
-        query = 'SELECT * FROM "{p}_{t}"'.format(p = self.dbprefix, t = table)
+    # iterate_query()
+    #
+    # execute a database query with parameters, return an iterator over the result set
+    # a server-side (named) cursor is used, only 'itersize' rows are transferred
+    # and held in memory at a time
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - list with parameters
+    # return:
+    #  - iterator over the result set
+    def iterate_query(self, query, param):
+        if (self.config.arguments.pg_copy is True):
+            yield from self.copy_query(query, param, self._copy_connection())
+            return
+
+        self.cursor_number += 1
+        # the cursor lives in the read-only transaction, which is never committed
+        cur = self.connection.cursor(name = 's9y_to_hugo_{n}'.format(n = self.cursor_number),
+                                     cursor_factory = self.psycopg2.extras.DictCursor)
+        cur.itersize = self.config.arguments.db_itersize
+
+        try:
+            cur.execute(query, param)
+            for row in cur:
+                yield row
+        finally:
+            cur.close()
+
+
+    # _copy_connection()
+    #
+    # a COPY blocks the connection until all rows are read, streaming COPY
+    # queries use a second connection, which imports the snapshot of the
+    # read-only transaction and sees the same data
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - connection
+    def _copy_connection(self):
+        if (self.copy_connection is not None):
+            return self.copy_connection
+
+        try:
+            cur = self.connection.cursor()
+            cur.execute('SELECT pg_export_snapshot()')
+            snapshot = cur.fetchone()[0]
+            cur.close()
+
+            conn = self.psycopg2.connect(self.connect_string)
+            conn.set_session(isolation_level = 'REPEATABLE READ', readonly = True)
+            # must be the first query in the transaction
+            conn.cursor().execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+        except self.psycopg2.DatabaseError as e:
+            print('Error %s' % e)
+            sys.exit(1)
+        self.copy_connection = conn
+
+        return conn
+
+
+    # copy_query()
+    #
+    # execute a database query with parameters, using COPY ... TO STDOUT
+    # the COPY data is read in a separate thread, and decoded row by row
+    # while it arrives (see CopyLineQueue)
+    # the values are converted with the same type casters psycopg2 uses for queries
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - list with parameters
+    #  - connection (default: the connection of the read-only transaction)
+    # return:
+    #  - iterator over the result set, rows are dictionaries
+    def copy_query(self, query, param, connection = None):
+        if (connection is None):
+            connection = self.connection
+        cur = connection.cursor()
+        lines = None
+        try:
+            query = cur.mogrify(query, param).decode(self.encoding)
+
+            # COPY returns only text, the column types are taken from an empty result
+            cur.execute('SELECT * FROM ({q}) AS copy_query LIMIT 0'.format(q = query))
+            names = [d.name for d in cur.description]
+            casters = [self.psycopg2.extensions.string_types.get(d.type_code) for d in cur.description]
+
+            # text format: one line per row, tab separated, special characters escaped
+            lines = CopyLineQueue().lines(cur, 'COPY ({q}) TO STDOUT'.format(q = query))
+            for line in lines:
+                row = {}
+                for name, caster, value in zip(names, casters, line.decode(self.encoding).split('\t')):
+                    if (value == '\\N'):
+                        row[name] = None
+                        continue
+                    value = self.copy_unescape_re.sub(self._copy_unescape, value)
+                    if (caster is not None):
+                        value = caster(value, cur)
+                    row[name] = value
+                yield row
+        finally:
+            if (lines is not None):
+                # waits for the end of the COPY
+                lines.close()
+            cur.close()
+
+
+    @staticmethod
+    def _copy_unescape(m):
+        return DatabasePG.copy_escapes.get(m.group(1), m.group(1))
+
+
+    # table_query()
+    #
+    # build a query for a S9y table, only with the columns which are needed
+    #
+    # parameter:
+    #  - self
+    #  - table name (without prefix)
+    #  - list with columns (None: all columns)
+    #  - WHERE condition (optional)
+    #  - column for ORDER BY (optional)
+    # return:
+    #  - query
+    def table_query(self, table, columns = None, where = None, order_by = None):
+        if (columns is None):
+            select = '*'
+        else:
+            select = ', '.join(['"{c}"'.format(c = c) for c in columns])
+        query = 'SELECT {s} FROM "{p}_{t}"'.format(s = select, p = self.dbprefix, t = table)
+        if (where is not None):
+            query += ' WHERE {w}'.format(w = where)
         if (order_by is not None):
             query += ' ORDER BY "{o}"'.format(o = order_by)
         #print(query)
 
-        return self.execute_query(query, [])
+        return query
+
+
+    def fetch_table(self, table, order_by = None, columns = None, where = None):
+        return self.execute_query(self.table_query(table, columns, where, order_by), [])
+
+
+    def iterate_table(self, table, order_by = None, columns = None, where = None):
+        return self.iterate_query(self.table_query(table, columns, where, order_by), [])
 
 
     def authors(self):
-        authors = self.fetch_table('authors', 'authorid')
+        authors = self.fetch_table('authors', 'authorid', ['authorid', 'username', 'realname'])
 
         return authors
 
 
     def categories(self):
-        categories = self.fetch_table('category', 'categoryid')
+        categories = self.fetch_table('category', 'categoryid', ['categoryid', 'category_name'])
 
         return categories
 
 
     def entry_categories(self):
-        entry_categories = self.fetch_table('entrycat', 'entryid')
+        # one row for every category of every blog posting, stream it
+        entry_categories = self.iterate_table('entrycat', 'entryid', ['entryid', 'categoryid'])
 
         return entry_categories
 
 
     def tags(self):
-        tags = self.fetch_table('entrytags', 'entryid')
+        # one row for every tag of every blog posting, stream it
+        tags = self.iterate_table('entrytags', 'entryid', ['entryid', 'tag'])
 
         return tags
 
 
     def exits(self):
-        exits = self.fetch_table('references', 'id')
+        # one row for every link in every blog posting, stream it
+        exits = self.iterate_table('references', 'id', ['id', 'entry_id', 'link'])
 
         return exits
 
 
-    def permalinks(self):
-        permalinks = self.fetch_table('permalinks', 'entry_id')
+    def entry_permalinks(self):
+        # only the permalinks for blog entries are used, stream them
+        permalinks = self.iterate_table('permalinks', 'entry_id', ['entry_id', 'permalink'], "type = 'entry'")
 
         return permalinks
 
 
     def entries(self):
-        entries = self.fetch_table('entries', 'id')
+        # the entries table holds all blog postings, stream it
+        # without the body columns, these are loaded by entry_bodies()
+        entries = self.iterate_table('entries', 'id', ['id', 'title', 'timestamp', 'authorid', 'isdraft', 'last_modified'])
 
         return entries
 
 
-    def number_entries_by_author(self, authorid):
-        query = 'SELECT COUNT(*) AS count FROM "{p}_entries" WHERE authorid = %s'.format(p = self.dbprefix)
-        result = self.execute_one(query, [str(authorid)])
+    # entry_bodies()
+    #
+    # load the body columns for a list of blog entries
+    #
+    # parameter:
+    #  - self
+    #  - list with entry ids
+    # return:
+    #  - result set with id, body and extended
+    def entry_bodies(self, ids):
+        query = self.table_query('entries', ['id', 'body', 'extended'], 'id = ANY(%s)')
+        if (self.config.arguments.pg_copy is True):
+            result = list(self.copy_query(query, [list(ids)]))
+        else:
+            result = self.execute_query(query, [list(ids)])
+
+        return result
+
 
-        return result[0]
+    def oldest_entry_timestamp(self):
+        query = 'SELECT MIN("timestamp") AS timestamp FROM "{p}_entries"'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
+        return result[0]['timestamp']
 
-    def number_entries_by_category(self, categoryid):
-        query = 'SELECT COUNT(*) AS count FROM "{p}_entrycat" WHERE categoryid = %s'.format(p = self.dbprefix)
-        result = self.execute_one(query, [str(categoryid)])
 
-        return result[0]
+    # count_entries_by_author()
+    #
+    # number of blog entries for every author, in a single query
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with authorid -> number of entries
+    def count_entries_by_author(self):
+        query = 'SELECT authorid, COUNT(*) AS count FROM "{p}_entries" GROUP BY authorid'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
+        return {r['authorid']: r['count'] for r in result}
 
-    def number_entries_by_tag(self, tag):
-        query = 'SELECT COUNT(*) AS count FROM "{p}_entrytags" WHERE tag = %s'.format(p = self.dbprefix)
-        result = self.execute_one(query, [str(tag)])
 
-        return result[0]
+    def count_entries_by_category(self):
+        query = 'SELECT categoryid, COUNT(*) AS count FROM "{p}_entrycat" GROUP BY categoryid'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
+        return {r['categoryid']: r['count'] for r in result}
 
-    def s9y_config_entry(self, entry):
-        query = "SELECT value FROM {p}_config where authorid = 0 and name = %s".format(p = self.dbprefix)
-        result = self.execute_one(query, [entry])
 
-        return result[0]
+    def count_entries_by_tag(self):
+        query = 'SELECT tag, COUNT(*) AS count FROM "{p}_entrytags" GROUP BY tag'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
+
+        return {r['tag']: r['count'] for r in result}
+
+
+    # config_entries()
+    #
+    # all global S9y settings (authorid = 0)
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - result set with name and value
+    def config_entries(self):
+        query = 'SELECT name, value FROM "{p}_config" WHERE authorid = 0'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
+
+        return result
 
 
 # end DatabasePG class
@@ -447,33 +771,155 @@ class DatabasePG:
 
 
 
+#######################################################################
+# CopyLineQueue class
+
+class CopyLineQueue:
+    # file-like target for copy_expert(), which runs in a reader thread
+    # the data is split into lines, and handed over in batches through a
+    # bounded queue, the consumer decodes the rows while the COPY runs
+    # if the consumer stops early, the rest of the data is read and dropped,
+    # the connection can only be used again after the end of the COPY
+
+    # size of a batch of lines, and number of batches in the queue
+    batch_size = 256 * 1024
+    queue_size = 16
+
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize = self.queue_size)
+        self.batch = []
+        self.batch_bytes = 0
+        self.partial = b''
+        self.stopped = False
+
+
+    # write()
+    #
+    # called by copy_expert() with the next chunk of data, usually one row
+    #
+    # parameter:
+    #  - self
+    #  - data (bytes)
+    # return:
+    #  none
+    def write(self, data):
+        if (self.stopped):
+            return
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        self.batch.extend(lines)
+        self.batch_bytes += len(data)
+        if (self.batch_bytes >= self.batch_size):
+            self._put_batch()
+
+
+    def _put_batch(self):
+        if (len(self.batch) > 0):
+            self.queue.put(self.batch)
+        self.batch = []
+        self.batch_bytes = 0
+
+
+    # _read()
+    #
+    # run the COPY, in the reader thread
+    # the end is marked with None, errors are handed over to the consumer
+    #
+    # parameter:
+    #  - self
+    #  - cursor
+    #  - COPY query
+    # return:
+    #  none
+    def _read(self, cur, query):
+        try:
+            cur.copy_expert(query, self)
+            if (len(self.partial) > 0):
+                self.batch.append(self.partial)
+            if (not self.stopped):
+                self._put_batch()
+            self.queue.put(None)
+        except Exception as e:
+            self.queue.put(e)
+
+
+    # lines()
+    #
+    # run the COPY, and return the lines while they arrive
+    #
+    # parameter:
+    #  - self
+    #  - cursor
+    #  - COPY query
+    # return:
+    #  - iterator over the lines (bytes, without newline)
+    def lines(self, cur, query):
+        reader = threading.Thread(target = self._read, args = (cur, query), daemon = True)
+        reader.start()
+        item = []
+        try:
+            while True:
+                item = self.queue.get()
+                if (item is None):
+                    break
+                if (isinstance(item, Exception)):
+                    raise item
+                yield from item
+        finally:
+            if (item is not None and not isinstance(item, Exception)):
+                # stopped early, unblock the reader and wait for the end of the COPY
+                self.stopped = True
+                while (item is not None and not isinstance(item, Exception)):
+                    item = self.queue.get()
+            reader.join()
+
+# end CopyLineQueue class
+#######################################################################
+
+
+
 #######################################################################
 # DatabaseMySQL class
 
 class DatabaseMySQL:
-    # avoid importing the module in the global class space
-    # this way, it's only loaded if someone selects the MySQL driver
-    # otherwise it must be installed all the time, even if someone doesn't need it
-    import mysql.connector
-    from psycopg2.extras import RealDictCursor
+    # S9y creates boolean columns as enum('true', 'false') in MySQL,
+    # the migration expects True/False like from PostgreSQL
+    boolean_columns = {'entries': ['isdraft']}
 
 
     def __init__(self, config):
+        # avoid importing the module in the global space
+        # this way, it's only loaded if someone selects the MySQL driver
+        # otherwise it must be installed all the time, even if someone doesn't need it
+        import mysql.connector
+        self.mysql = mysql
+
         self.config = config
         self.dbprefix = self.config.arguments.dbprefix
 
+        # every connection has its own snapshot, both are opened right after
+        # each other, a change in between is only seen by the stream connection
+        self.connection = self._connect()
+        self.stream_connection = self._connect()
+
+
+    def _connect(self):
         try:
             # the self.connector.connect is required, because the module lives only in this class
             conn = self.mysql.connector.connect(host = self.config.arguments.dbhost,
                                                 user = self.config.arguments.dbuser,
                                                 password = self.config.arguments.dbpass,
                                                 database = self.config.arguments.dbname,
-                                                port = self.config.arguments.dbport)
+                                                port = self.config.arguments.dbport,
+                                                autocommit = True)
+            # all phases run in one read-only transaction, and see the same data
+            conn.start_transaction(consistent_snapshot = True, isolation_level = 'REPEATABLE READ', readonly = True)
         except self.mysql.connector.Error as e:
             print('Error %s' % e)
             sys.exit(1)
 
-        self.connection = conn
+        return conn
 
 
     # run_query()
@@ -486,10 +932,8 @@ class DatabaseMySQL:
     # return:
     #  none
     def run_query(self, query):
-        self.connection.start_transaction()
-        with self.connection.cursor(buffered = True) as cursor:
+        with self.connection.cursor() as cursor:
             cursor.execute(query)
-        self.connection.commit()
 
 
     # execute_one()
@@ -503,11 +947,9 @@ class DatabaseMySQL:
     # return:
     #  - result
     def execute_one(self, query, param):
-        self.connection.start_transaction()
-        with self.connection.cursor(buffered = True, dictionary = True) as cursor:
+        with self.connection.cursor(dictionary = True) as cursor:
             cursor.execute(query, param)
             result = cursor.fetchall()
-        self.connection.commit()
 
         return result[0]
 
@@ -515,6 +957,7 @@ class DatabaseMySQL:
     # execute_query()
     #
     # execute a database query with parameters, return result set
+    # the cursor is unbuffered, the rows are only materialized once, in the result list
     #
     # parameter:
     #  - self
@@ -523,92 +966,208 @@ class DatabaseMySQL:
     # return:
     #  - result set
     def execute_query(self, query, param):
-        self.connection.start_transaction()
-        with self.connection.cursor(buffered = True, dictionary = True) as cursor:
+        with self.connection.cursor(dictionary = True) as cursor:
             cursor.execute(query, param)
             result = cursor.fetchall()
-        self.connection.commit()
 
         return result
 
 
-    def fetch_table(self, table, order_by = None):
-        query = 'SELECT * FROM {p}_{t}'.format(p = self.dbprefix, t = table)
+    # iterate_query()
+    #
+    # execute a database query with parameters, return an iterator over the result set
+    # an unbuffered cursor on a separate connection is used, only 'itersize'
+    # rows are held in memory at a time
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - list with parameters
+    # return:
+    #  - iterator over the result set
+    def iterate_query(self, query, param):
+        # an unbuffered cursor blocks the connection until all rows are read,
+        # use a separate connection for streaming
+        with self.stream_connection.cursor(buffered = False, dictionary = True) as cursor:
+            cursor.execute(query, param)
+            while True:
+                rows = cursor.fetchmany(self.config.arguments.db_itersize)
+                if (len(rows) == 0):
+                    break
+                for row in rows:
+                    yield row
+
+
+    # table_query()
+    #
+    # build a query for a S9y table, only with the columns which are needed
+    #
+    # parameter:
+    #  - self
+    #  - table name (without prefix)
+    #  - list with columns (None: all columns)
+    #  - WHERE condition (optional)
+    #  - column for ORDER BY (optional)
+    # return:
+    #  - query
+    def table_query(self, table, columns = None, where = None, order_by = None):
+        if (columns is None):
+            select = '*'
+        else:
+            select = ', '.join(['`{c}`'.format(c = c) for c in columns])
+        query = 'SELECT {s} FROM `{p}_{t}`'.format(s = select, p = self.dbprefix, t = table)
+        if (where is not None):
+            query += ' WHERE {w}'.format(w = where)
         if (order_by is not None):
-            query += ' ORDER BY "{o}"'.format(o = order_by)
+            # MySQL treats "..." as a string constant, unless ANSI_QUOTES is set
+            query += ' ORDER BY `{o}`'.format(o = order_by)
         #print(query)
 
-        return self.execute_query(query, [])
+        return query
+
+
+    def fetch_table(self, table, order_by = None, columns = None, where = None):
+        return list(self._convert_booleans(table, self.execute_query(self.table_query(table, columns, where, order_by), [])))
+
+
+    def iterate_table(self, table, order_by = None, columns = None, where = None):
+        return self._convert_booleans(table, self.iterate_query(self.table_query(table, columns, where, order_by), []))
+
+
+    # _convert_booleans()
+    #
+    # convert the enum('true', 'false') columns of a table into True/False
+    #
+    # parameter:
+    #  - self
+    #  - table name (without prefix)
+    #  - iterator over the result set
+    # return:
+    #  - iterator over the result set
+    def _convert_booleans(self, table, rows):
+        columns = self.boolean_columns.get(table, [])
+        for row in rows:
+            for c in columns:
+                if (row.get(c) in ('true', 'false')):
+                    row[c] = (row[c] == 'true')
+            yield row
 
 
     def authors(self):
-        authors = self.fetch_table('authors', 'authorid')
+        authors = self.fetch_table('authors', 'authorid', ['authorid', 'username', 'realname'])
 
         return authors
 
 
     def categories(self):
-        categories = self.fetch_table('category', 'categoryid')
+        categories = self.fetch_table('category', 'categoryid', ['categoryid', 'category_name'])
 
         return categories
 
 
     def entry_categories(self):
-        entry_categories = self.fetch_table('entrycat', 'entryid')
+        # one row for every category of every blog posting, stream it
+        entry_categories = self.iterate_table('entrycat', 'entryid', ['entryid', 'categoryid'])
 
         return entry_categories
 
 
     def tags(self):
-        tags = self.fetch_table('entrytags', 'entryid')
+        # one row for every tag of every blog posting, stream it
+        tags = self.iterate_table('entrytags', 'entryid', ['entryid', 'tag'])
 
         return tags
 
 
     def exits(self):
-        exits = self.fetch_table('references', 'id')
+        # one row for every link in every blog posting, stream it
+        exits = self.iterate_table('references', 'id', ['id', 'entry_id', 'link'])
 
         return exits
 
 
-    def permalinks(self):
-        permalinks = self.fetch_table('permalinks', 'entry_id')
+    def entry_permalinks(self):
+        # only the permalinks for blog entries are used, stream them
+        permalinks = self.iterate_table('permalinks', 'entry_id', ['entry_id', 'permalink'], "type = 'entry'")
 
         return permalinks
 
 
     def entries(self):
-        entries = self.fetch_table('entries', 'id')
+        # the entries table holds all blog postings, stream it
+        # without the body columns, these are loaded by entry_bodies()
+        entries = self.iterate_table('entries', 'id', ['id', 'title', 'timestamp', 'authorid', 'isdraft', 'last_modified'])
 
         return entries
 
 
-    def number_entries_by_author(self, authorid):
-        query = 'SELECT COUNT(*) AS count FROM {p}_entries WHERE authorid = %s'.format(p = self.dbprefix)
-        result = self.execute_one(query, [str(authorid)])
+    # entry_bodies()
+    #
+    # load the body columns for a list of blog entries
+    #
+    # parameter:
+    #  - self
+    #  - list with entry ids
+    # return:
+    #  - result set with id, body and extended
+    def entry_bodies(self, ids):
+        query = self.table_query('entries', ['id', 'body', 'extended'], 'id IN ({i})'.format(i = ', '.join(['%s'] * len(ids))))
+        result = self.execute_query(query, list(ids))
+
+        return result
+
+
+    def oldest_entry_timestamp(self):
+        query = 'SELECT MIN(timestamp) AS timestamp FROM {p}_entries'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
+
+        return result[0]['timestamp']
+
+
+    # count_entries_by_author()
+    #
+    # number of blog entries for every author, in a single query
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with authorid -> number of entries
+    def count_entries_by_author(self):
+        query = 'SELECT authorid, COUNT(*) AS count FROM {p}_entries GROUP BY authorid'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
-        return result['count']
+        return {r['authorid']: r['count'] for r in result}
 
 
-    def number_entries_by_category(self, categoryid):
-        query = 'SELECT COUNT(*) AS count FROM {p}_entrycat WHERE categoryid = %s'.format(p = self.dbprefix)
-        result = self.execute_one(query, [str(categoryid)])
+    def count_entries_by_category(self):
+        query = 'SELECT categoryid, COUNT(*) AS count FROM {p}_entrycat GROUP BY categoryid'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
-        return result['count']
+        return {r['categoryid']: r['count'] for r in result}
 
 
-    def number_entries_by_tag(self, tag):
-        query = 'SELECT COUNT(*) AS count FROM {p}_entrytags WHERE tag = %s'.format(p = self.dbprefix)
-        result = self.execute_one(query, [str(tag)])
+    def count_entries_by_tag(self):
+        # the default collation is case insensitive, and would merge "Linux" and "linux",
+        # group by the bytes, MIN() keeps the query valid with ONLY_FULL_GROUP_BY
+        query = 'SELECT MIN(tag) AS tag, COUNT(*) AS count FROM {p}_entrytags GROUP BY CAST(tag AS BINARY)'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
-        return result['count']
+        return {r['tag']: r['count'] for r in result}
 
 
-    def s9y_config_entry(self, entry):
-        query = "SELECT value FROM {p}_config where authorid = 0 and name = %s".format(p = self.dbprefix)
-        result = self.execute_one(query, [entry])
+    # config_entries()
+    #
+    # all global S9y settings (authorid = 0)
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - result set with name and value
+    def config_entries(self):
+        query = 'SELECT name, value FROM {p}_config WHERE authorid = 0'.format(p = self.dbprefix)
+        result = self.execute_query(query, [])
 
-        return result['value']
+        return result
 
 
 # end DatabaseMySQL class
@@ -617,40 +1176,352 @@ class DatabaseMySQL:
 
 
 #######################################################################
-# Database class
+# DatabaseSnapshot class
+
+class DatabaseSnapshot:
+    # tables and columns which are exported into a snapshot, the column for ORDER BY,
+    # and the WHERE condition
+    # only the columns and rows the migration needs are exported (no password hashes
+    # from authors, no plugin settings with API keys or mail credentials from config)
+    snapshot_tables = {
+        'authors': (['authorid', 'username', 'realname'], 'authorid', None),
+        'category': (['categoryid', 'category_name'], 'categoryid', None),
+        'entrycat': (['entryid', 'categoryid'], 'entryid', None),
+        'entrytags': (['entryid', 'tag'], 'entryid', None),
+        'references': (['id', 'entry_id', 'link'], 'id', None),
+        'permalinks': (['entry_id', 'permalink', 'type'], 'entry_id', None),
+        'entries': (['id', 'title', 'timestamp', 'body', 'extended', 'authorid', 'isdraft', 'last_modified'], 'id', None),
+        # the global settings which S9yConfig is asked for
+        'config': (['name', 'value', 'authorid'], None, "authorid = 0 AND name IN ('fetchLimit', 'useServerOffset', 'serverOffsetHours')"),
+    }
+    snapshot_version = 1
 
-class Database:
 
     def __init__(self, config):
+        # sqlite3 is part of Python, but only needed for snapshots
+        import sqlite3
+        self.sqlite3 = sqlite3
+
         self.config = config
-        self.dbtype = self.config.arguments.dbtype
 
-        if (self.dbtype == "pg"):
-            logging.debug("Selecting PostgreSQL driver")
-            self.connection = DatabasePG(config)
-        elif (self.dbtype == "mysql"):
-            logging.debug("Selecting MySQL driver")
-            self.connection = DatabaseMySQL(config)
-        else:
-            logging.error("Unknown database")
+        snapshot_file = self.config.arguments.dbname
+        try:
+            # the snapshot is never modified
+            conn = self.sqlite3.connect('file:{f}?mode=ro'.format(f = urllib.parse.quote(snapshot_file)), uri = True)
+            conn.execute('PRAGMA mmap_size = 268435456')
+            info = dict(conn.execute('SELECT name, value FROM snapshot_info').fetchall())
+            columns = conn.execute('SELECT table_name, column_name, type FROM snapshot_columns').fetchall()
+        except self.sqlite3.Error as e:
+            print('Error reading snapshot {f}: {e}'.format(f = snapshot_file, e = e))
             sys.exit(1)
 
+        if (info.get('version') != str(self.snapshot_version)):
+            logging.error("Unsupported snapshot version: {v}".format(v = info.get('version')))
+            sys.exit(1)
+        logging.debug("Using snapshot from {t} ({d} database, prefix {p})".format(t = info.get('created'), d = info.get('dbtype'), p = info.get('dbprefix')))
 
-    def test(self):
-        if (self.dbtype == "pg"):
-            self.connection.test()
-
-
-    def execute_query(self, query, param):
-        return self.connection.execute_query(query, param)
-
+        # SQLite has no boolean or timestamp types, the original types are restored when reading
+        self.converters = {}
+        for c in columns:
+            if (c[2] == 'bool'):
+                self.converters.setdefault(c[0], {})[c[1]] = bool
+            elif (c[2] == 'datetime'):
+                self.converters.setdefault(c[0], {})[c[1]] = datetime.fromisoformat
 
-    def authors(self):
-        return self.connection.authors()
+        self.connection = conn
 
 
-    def categories(self):
-        return self.connection.categories()
+    # export()
+    #
+    # copy the tables used by the migration into a new snapshot file
+    # the snapshot is written into a temporary file first, and renamed when complete
+    #
+    # parameter:
+    #  - database connection (DatabasePG or DatabaseMySQL)
+    #  - config
+    #  - snapshot filename
+    # return:
+    #  none
+    @staticmethod
+    def export(source, config, snapshot_file):
+        import sqlite3
+        tmp_file = snapshot_file + '.tmp'
+        if (os.path.exists(tmp_file)):
+            os.remove(tmp_file)
+
+        conn = sqlite3.connect(tmp_file)
+        # the file is only renamed after everything is written
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE snapshot_info (name TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('CREATE TABLE snapshot_columns (table_name TEXT, column_name TEXT, type TEXT)')
+        conn.executemany('INSERT INTO snapshot_info (name, value) VALUES (?, ?)',
+                         [('version', str(DatabaseSnapshot.snapshot_version)),
+                          ('created', datetime.now().isoformat()),
+                          ('dbtype', config.arguments.dbtype),
+                          ('dbprefix', config.arguments.dbprefix)])
+
+        for table, (columns, order_by, where) in DatabaseSnapshot.snapshot_tables.items():
+            start = time.time()
+            conn.execute('CREATE TABLE "{t}" ({c})'.format(t = table, c = ', '.join(['"{c}"'.format(c = c) for c in columns])))
+            insert = 'INSERT INTO "{t}" VALUES ({v})'.format(t = table, v = ', '.join(['?'] * len(columns)))
+
+            types = {}
+            number_rows = 0
+            batch = []
+            for row in source.iterate_table(table, order_by, columns, where):
+                values = []
+                for c in columns:
+                    v = row[c]
+                    if (isinstance(v, bool)):
+                        types.setdefault(c, 'bool')
+                        v = int(v)
+                    elif (isinstance(v, datetime)):
+                        types.setdefault(c, 'datetime')
+                        v = v.isoformat()
+                    elif (isinstance(v, bytearray)):
+                        v = bytes(v)
+                    values.append(v)
+                batch.append(values)
+                if (len(batch) >= config.arguments.db_itersize):
+                    conn.executemany(insert, batch)
+                    number_rows += len(batch)
+                    batch = []
+            if (len(batch) > 0):
+                conn.executemany(insert, batch)
+                number_rows += len(batch)
+
+            if (order_by is not None):
+                conn.execute('CREATE INDEX "{t}_{o}" ON "{t}" ("{o}")'.format(t = table, o = order_by))
+            conn.executemany('INSERT INTO snapshot_columns (table_name, column_name, type) VALUES (?, ?, ?)',
+                             [(table, c, t) for c, t in types.items()])
+            logging.info("Exported {n} rows from {t} in {s:.1f}s".format(n = number_rows, t = table, s = time.time() - start))
+
+        conn.commit()
+        conn.execute('ANALYZE')
+        conn.close()
+        os.replace(tmp_file, snapshot_file)
+
+
+    # execute_query()
+    #
+    # execute a database query with parameters, return result set
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - list with parameters
+    #  - table name, for restoring the column types (optional)
+    # return:
+    #  - result set
+    def execute_query(self, query, param, table = None):
+        return list(self.iterate_query(query, param, table))
+
+
+    # iterate_query()
+    #
+    # execute a database query with parameters, return an iterator over the result set
+    #
+    # parameter:
+    #  - self
+    #  - query
+    #  - list with parameters
+    #  - table name, for restoring the column types (optional)
+    # return:
+    #  - iterator over the result set
+    def iterate_query(self, query, param, table = None):
+        converters = self.converters.get(table, {})
+        cur = self.connection.execute(query, param)
+        names = [d[0] for d in cur.description]
+        for row in cur:
+            result = dict(zip(names, row))
+            for c, f in converters.items():
+                if (c in result and result[c] is not None):
+                    result[c] = f(result[c])
+            yield result
+
+
+    # table_query()
+    #
+    # build a query for a snapshot table, only with the columns which are needed
+    #
+    # parameter:
+    #  - self
+    #  - table name (without prefix)
+    #  - list with columns (None: all columns)
+    #  - WHERE condition (optional)
+    #  - column for ORDER BY (optional)
+    # return:
+    #  - query
+    def table_query(self, table, columns = None, where = None, order_by = None):
+        if (columns is None):
+            select = '*'
+        else:
+            select = ', '.join(['"{c}"'.format(c = c) for c in columns])
+        # the snapshot holds the tables without prefix
+        query = 'SELECT {s} FROM "{t}"'.format(s = select, t = table)
+        if (where is not None):
+            query += ' WHERE {w}'.format(w = where)
+        if (order_by is not None):
+            query += ' ORDER BY "{o}"'.format(o = order_by)
+        #print(query)
+
+        return query
+
+
+    def fetch_table(self, table, order_by = None, columns = None, where = None):
+        return self.execute_query(self.table_query(table, columns, where, order_by), [], table)
+
+
+    def iterate_table(self, table, order_by = None, columns = None, where = None):
+        return self.iterate_query(self.table_query(table, columns, where, order_by), [], table)
+
+
+    def authors(self):
+        authors = self.fetch_table('authors', 'authorid', ['authorid', 'username', 'realname'])
+
+        return authors
+
+
+    def categories(self):
+        categories = self.fetch_table('category', 'categoryid', ['categoryid', 'category_name'])
+
+        return categories
+
+
+    def entry_categories(self):
+        # one row for every category of every blog posting, stream it
+        entry_categories = self.iterate_table('entrycat', 'entryid', ['entryid', 'categoryid'])
+
+        return entry_categories
+
+
+    def tags(self):
+        # one row for every tag of every blog posting, stream it
+        tags = self.iterate_table('entrytags', 'entryid', ['entryid', 'tag'])
+
+        return tags
+
+
+    def exits(self):
+        exits = self.iterate_table('references', 'id', ['id', 'entry_id', 'link'])
+
+        return exits
+
+
+    def entry_permalinks(self):
+        # only the permalinks for blog entries are used, stream them
+        permalinks = self.iterate_table('permalinks', 'entry_id', ['entry_id', 'permalink'], "type = 'entry'")
+
+        return permalinks
+
+
+    def entries(self):
+        entries = self.iterate_table('entries', 'id', ['id', 'title', 'timestamp', 'authorid', 'isdraft', 'last_modified'])
+
+        return entries
+
+
+    # entry_bodies()
+    #
+    # load the body columns for a list of blog entries
+    #
+    # parameter:
+    #  - self
+    #  - list with entry ids
+    # return:
+    #  - result set with id, body and extended
+    def entry_bodies(self, ids):
+        # a JSON array avoids the limit for the number of SQL variables
+        query = self.table_query('entries', ['id', 'body', 'extended'], 'id IN (SELECT value FROM json_each(?))')
+        result = self.execute_query(query, [json.dumps(list(ids))], 'entries')
+
+        return result
+
+
+    def oldest_entry_timestamp(self):
+        query = 'SELECT MIN("timestamp") AS timestamp FROM "entries"'
+        result = self.execute_query(query, [])
+
+        return result[0]['timestamp']
+
+
+    def count_entries_by_author(self):
+        query = 'SELECT authorid, COUNT(*) AS count FROM "entries" GROUP BY authorid'
+        result = self.execute_query(query, [])
+
+        return {r['authorid']: r['count'] for r in result}
+
+
+    def count_entries_by_category(self):
+        query = 'SELECT categoryid, COUNT(*) AS count FROM "entrycat" GROUP BY categoryid'
+        result = self.execute_query(query, [])
+
+        return {r['categoryid']: r['count'] for r in result}
+
+
+    def count_entries_by_tag(self):
+        query = 'SELECT tag, COUNT(*) AS count FROM "entrytags" GROUP BY tag'
+        result = self.execute_query(query, [])
+
+        return {r['tag']: r['count'] for r in result}
+
+
+    def config_entries(self):
+        query = 'SELECT name, value FROM "config" WHERE authorid = 0'
+        result = self.execute_query(query, [])
+
+        return result
+
+
+# end DatabaseSnapshot class
+#######################################################################
+
+
+
+#######################################################################
+# Database class
+
+class Database:
+
+    def __init__(self, config):
+        self.config = config
+        self.dbtype = self.config.arguments.dbtype
+
+        if (self.dbtype == "pg"):
+            logging.debug("Selecting PostgreSQL driver")
+            self.connection = DatabasePG(config)
+        elif (self.dbtype == "mysql"):
+            logging.debug("Selecting MySQL driver")
+            self.connection = DatabaseMySQL(config)
+        elif (self.dbtype == "snapshot"):
+            logging.debug("Selecting snapshot driver")
+            self.connection = DatabaseSnapshot(config)
+        else:
+            logging.error("Unknown database")
+            sys.exit(1)
+
+
+    def test(self):
+        if (self.dbtype == "pg"):
+            self.connection.test()
+
+
+    def execute_query(self, query, param):
+        return self.connection.execute_query(query, param)
+
+
+    def export_snapshot(self, snapshot_file):
+        logging.info("Exporting snapshot to {f}".format(f = snapshot_file))
+        DatabaseSnapshot.export(self.connection, self.config, snapshot_file)
+
+
+    def authors(self):
+        return self.connection.authors()
+
+
+    def categories(self):
+        return self.connection.categories()
 
 
     def entry_categories(self):
@@ -661,70 +1532,2692 @@ class Database:
         return self.connection.tags()
 
 
-    def exits(self):
-        return self.connection.exits()
+    def exits(self):
+        return self.connection.exits()
+
+
+    def entry_permalinks(self):
+        return self.connection.entry_permalinks()
+
+
+    def entries(self):
+        return self.connection.entries()
+
+
+    def entry_bodies(self, ids):
+        return self.connection.entry_bodies(ids)
+
+
+    def oldest_entry_timestamp(self):
+        return self.connection.oldest_entry_timestamp()
+
+
+    def count_entries_by_author(self):
+        return self.connection.count_entries_by_author()
+
+
+    def count_entries_by_category(self):
+        return self.connection.count_entries_by_category()
+
+
+    def count_entries_by_tag(self):
+        return self.connection.count_entries_by_tag()
+
+
+    def config_entries(self):
+        return self.connection.config_entries()
+
+
+# end Database class
+#######################################################################
+
+
+
+
+#######################################################################
+# RedirectWriter class
+
+class RedirectWriter:
+    # keeps the rewrite file and the rewrite JSON open for the whole run,
+    # buffers the formatted rules and writes them out in large chunks
+    # the migration generates many thousand redirects, opening the files
+    # for every single rule is a significant part of the runtime
+
+    # header and footer for the rewrite file, per rewritetype
+    rewrite_headers = {
+        'apache2-map': ("# RewriteMap for Apache2, use with:\n"
+                        "#   RewriteMap s9y \"txt:{file}\"\n"
+                        "#   # exit links, the key includes the query string\n"
+                        "#   RewriteCond %{{QUERY_STRING}} .\n"
+                        "#   RewriteCond ${{s9y:%{{REQUEST_URI}}?%{{QUERY_STRING}}}} !=\"\"\n"
+                        "#   RewriteRule ^ ${{s9y:%{{REQUEST_URI}}?%{{QUERY_STRING}}}} [R=301,L,NE,QSD]\n"
+                        "#   RewriteCond ${{s9y:%{{REQUEST_URI}}}} !=\"\"\n"
+                        "#   RewriteRule ^ ${{s9y:%{{REQUEST_URI}}}} [R=301,L,NE]\n"
+                        "# the keys are not URL encoded, Apache decodes %{{REQUEST_URI}}\n"),
+        'nginx': ("# map for nginx, use in the server block with:\n"
+                  "#   if ($s9y_redirect) {{\n"
+                  "#     return 301 $s9y_redirect;\n"
+                  "#   }}\n"
+                  "# large maps might require a larger map_hash_max_size\n"
+                  "map $request_uri $s9y_redirect {{\n"),
+    }
+    rewrite_footers = {
+        'nginx': "}\n",
+    }
+    # rewritetypes which are looked up with the decoded path, the keys are not URL encoded
+    decoded_key_types = ('apache2-map', 'apache2-dbm')
+
+
+    def __init__(self, config, flush_every = 10000):
+        self.config = config
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        # old URL -> new URL, used to only write the first redirect for an old URL
+        self.seen = {}
+        self.rewrite_buffer = []
+        self.json_buffer = []
+        self.rewrite_fh = None
+        self.rewrite_db = None
+        self.json_fh = None
+        self.rewritetype = self.config.arguments.rewritetype
+        self.number_rules = 0
+        self.rule_keys = set()
+        # with --compact-redirects, rules which belong to a family (same URL pattern)
+        # are collected, and written as a single regex rule at the end
+        # the explicit rules are kept for verifying the result
+        if (self.config.arguments.compact_redirects is True):
+            self.families = {}
+            self.explicit_rules = {}
+        else:
+            self.families = None
+            self.explicit_rules = None
+
+        if (self.config.arguments.rewritefile != ""):
+            if (self.rewritetype == 'apache2-dbm'):
+                # the hash file is written directly, Apache reads it with "dbm=<type>:<file>"
+                self.dbm_module, self.dbm_type = dbm_module()
+                self.rewrite_db = self.dbm_module.open(self.config.arguments.rewritefile, 'n')
+            else:
+                # the keys of the Apache2 maps are not URL encoded
+                self.rewrite_fh = open(self.config.arguments.rewritefile, 'a', encoding = 'utf8')
+                if (self.rewritetype in self.rewrite_headers):
+                    self.rewrite_fh.write(self.rewrite_headers[self.rewritetype].format(file = self.config.arguments.rewritefile))
+        if (self.config.arguments.rewritejson != ""):
+            self.json_fh = open(self.config.arguments.rewritejson, 'a')
+
+
+    # add()
+    #
+    # add a redirect rule, unless a rule for the old URL already exists
+    #
+    # parameter:
+    #  - self
+    #  - old URL
+    #  - new URL
+    #  - keep '#' in the new URL unquoted
+    #  - quote both URLs
+    #  - place both URLs in double quotes
+    #  - family of similar URLs, as tuple with (literal URL prefix, regex for the rest, new URL with $n for groups) (optional)
+    #  - the old URL is the base of a family, and must not match the longer family URLs (optional)
+    # return:
+    #  none
+    def add(self, old_url, new_url, keep_hashtag_in_new = False, quote_urls = True, place_in_quotes = False, family = None, family_base = False):
+        with self.lock:
+            if (old_url in self.seen):
+                # seen this URL before, don't write another entry
+                return
+            # store entry to avoid writing it again next time
+            self.seen[old_url] = new_url
+
+            if (place_in_quotes):
+                quotes = '"'
+            else:
+                quotes = ''
+
+            if (quote_urls):
+                # this is the default
+                old_entry = urllib.parse.quote(old_url)
+                new_entry = urllib.parse.quote(new_url)
+            else:
+                old_entry = old_url
+                new_entry = new_url
+            if (keep_hashtag_in_new):
+                # mainly used for archive links redirecting to the correct year
+                new_entry = new_entry.replace('%23', '#', 1)
+            if (self.rewritetype in self.decoded_key_types):
+                # RewriteMap is looked up with the decoded %{REQUEST_URI}
+                old_key = old_url
+            else:
+                old_key = old_entry
+
+            if (self.rewrite_fh is not None or self.rewrite_db is not None):
+                # all URLs are absolute, this allows placing the redirect
+                # file anywhere
+                # some search engines might come around with '+' when there was a space
+                old_key_plus = old_key.replace('-', '+')
+                if (family is not None and self.families is not None):
+                    members = self.families.setdefault(family + (keep_hashtag_in_new, quote_urls), [])
+                    members.append((old_key, new_entry, quotes))
+                    if (old_key_plus != old_key):
+                        members.append((old_key_plus, new_entry, quotes))
+                else:
+                    self._add_rule(old_key, new_entry, quotes, family_base)
+                    if (old_key_plus != old_key):
+                        self._add_rule(old_key_plus, new_entry, quotes, family_base)
+                logging.debug("Writing redirect: {old} -> {new}".format(old = old_entry,
+                                                                        new = new_entry))
+
+            if (self.json_fh is not None):
+                self.json_buffer.append("{{'orig': '{old}',\n 'replace': '{new}'}},\n".format(old = old_entry,
+                                                                                             new = new_entry))
+
+            if (len(self.rewrite_buffer) + len(self.json_buffer) >= self.flush_every):
+                self._flush()
+
+
+    def _add_rule(self, old_entry, new_entry, quotes, family_base = False):
+        # "Redirect" in Apache2 matches every URL below the old URL, the base URL of
+        # a family would catch the listing pages before the compacted regex rule
+        anchored = (family_base and self.families is not None and self.rewritetype == 'apache2')
+        if (self.rewritetype != 'apache2'):
+            # lookup tables need unique keys (nginx refuses to load duplicates),
+            # the '+' variant can collide with another old URL
+            if (old_entry in self.rule_keys):
+                return
+            self.rule_keys.add(old_entry)
+        if (self.explicit_rules is not None):
+            # the first rule for an URL wins, Apache2 uses the rules in file order
+            self.explicit_rules.setdefault(old_entry, (len(self.explicit_rules), new_entry, anchored))
+        if (anchored):
+            self.rewrite_buffer.append("RedirectMatch 301 {q}^{old}${q} {q}{new}{q}\n".format(old = re.escape(old_entry),
+                                                                                   new = new_entry,
+                                                                                   q = quotes))
+        else:
+            self.rewrite_buffer.append(self._format_rule(old_entry, new_entry, quotes))
+
+
+    # _compact_families()
+    #
+    # replace every family of rules with a single regex rule
+    # the regex rules are placed after all explicit rules, both Apache2 and nginx
+    # use the explicit rules first
+    # every original URL is resolved against the complete rule set, a family
+    # which does not resolve all its URLs to the same target is written as explicit rules
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def _compact_families(self):
+        patterns = []
+        for (literal, pattern, target, keep_hashtag_in_new, quote_urls), members in self.families.items():
+            if (len(members) < 2):
+                # nothing to gain
+                for old_entry, new_entry, quotes in members:
+                    self._add_rule(old_entry, new_entry, quotes)
+                continue
+            if (quote_urls):
+                literal = urllib.parse.quote(literal)
+                target = urllib.parse.quote(target, safe = '/$')
+            if (keep_hashtag_in_new):
+                target = target.replace('%23', '#', 1)
+            # the '+' variants of the URLs are matched by the same rule
+            regex = '^' + re.escape(literal).replace('\\-', '[-+]') + pattern + '$'
+            patterns.append([re.compile(regex), regex, target, members])
+
+        while True:
+            failed = None
+            for p in patterns:
+                for old_entry, new_entry, quotes in p[3]:
+                    if (self._resolve_compacted(old_entry, patterns) != new_entry):
+                        failed = p
+                        break
+                if (failed is not None):
+                    break
+            if (failed is None):
+                break
+            logging.warning("Can't compact redirects for {r}, writing {n} explicit rules".format(r = failed[1], n = len(failed[3])))
+            patterns.remove(failed)
+            for old_entry, new_entry, quotes in failed[3]:
+                self._add_rule(old_entry, new_entry, quotes)
+
+        number_members = 0
+        for compiled, regex, target, members in patterns:
+            number_members += len(members)
+            if (self.rewritetype == 'apache2'):
+                self.rewrite_buffer.append("RedirectMatch 301 {regex} {target}\n".format(regex = regex, target = target))
+            elif (self.rewritetype == 'nginx'):
+                self.rewrite_buffer.append('    "~{regex}" "{target}";\n'.format(regex = regex.replace('"', '\\"'),
+                                                                                 target = target.replace('"', '\\"')))
+        logging.info("Compacted {n} redirect rules into {p} regex rules".format(n = number_members, p = len(patterns)))
+        self.families = {}
+
+
+    # _resolve_compacted()
+    #
+    # find the target for an URL in the compacted rule set, like the web server does
+    # nginx looks up the exact URL in the map first, Apache2 uses the first
+    # "Redirect" in the file which is a prefix of the URL (up to a '/'), and
+    # appends the rest of the URL to the target, an anchored "RedirectMatch"
+    # for a family base only matches the URL itself
+    # the regex rules follow all explicit rules in both cases
+    #
+    # parameter:
+    #  - self
+    #  - old URL (already quoted)
+    #  - list with regex rules
+    # return:
+    #  - new URL, or None
+    def _resolve_compacted(self, old_entry, patterns):
+        if (self.rewritetype == 'apache2'):
+            # every prefix which ends before a '/', or with a '/'
+            match = None
+            for i in range(1, len(old_entry) + 1):
+                if (i < len(old_entry) and old_entry[i - 1] != '/' and old_entry[i] != '/'):
+                    continue
+                rule = self.explicit_rules.get(old_entry[:i])
+                if (rule is not None and rule[2] and i < len(old_entry)):
+                    continue
+                if (rule is not None and (match is None or rule[0] < match[0])):
+                    match = (rule[0], rule[1] + old_entry[i:])
+            if (match is not None):
+                return match[1]
+        elif (old_entry in self.explicit_rules):
+            return self.explicit_rules[old_entry][1]
+        for compiled, regex, target, members in patterns:
+            m = compiled.match(old_entry)
+            if (m is not None):
+                return re.sub(r'\$(\d)', lambda g: m.group(int(g.group(1))) or '', target)
+
+        return None
+
+
+    # _format_rule()
+    #
+    # format a single redirect rule for the rewritetype
+    #
+    # parameter:
+    #  - self
+    #  - old URL (already quoted)
+    #  - new URL (already quoted)
+    #  - quotes around the URLs (apache2 only)
+    # return:
+    #  - line for the rewrite file, or (key, value) for a hash file
+    def _format_rule(self, old_entry, new_entry, quotes):
+        if (self.rewritetype == 'apache2'):
+            return "Redirect 301 {q}{old}{q} {q}{new}{q}\n".format(old = old_entry,
+                                                                   new = new_entry,
+                                                                   q = quotes)
+
+        if (self.rewritetype == 'apache2-dbm'):
+            # keys and values in the hash file can have any characters
+            return (old_entry, new_entry.replace(' ', '%20'))
+
+        # the other formats separate key and value by whitespace, which must not appear in the URLs
+        old_entry = old_entry.replace(' ', '%20')
+        new_entry = new_entry.replace(' ', '%20')
+        if (self.rewritetype == 'apache2-map'):
+            return "{old} {new}\n".format(old = old_entry, new = new_entry)
+        if (self.rewritetype == 'nginx'):
+            return '    "{old}" "{new}";\n'.format(old = old_entry.replace('"', '\\"'),
+                                                   new = new_entry.replace('"', '\\"'))
+        if (self.rewritetype == 'netlify'):
+            # Netlify ignores a query string in the path, the parameters are
+            # matched with "name=value" fields after the path
+            path, sep, query = old_entry.partition('?')
+            if (query != ''):
+                return "{old} {params} {new} 301\n".format(old = path, params = query.replace('&', ' '), new = new_entry)
+            return "{old} {new} 301\n".format(old = old_entry, new = new_entry)
+
+
+    # shard()
+    #
+    # return an empty shard, which collects rules independently
+    # (for example in a worker) and is later merged back in order
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - RedirectShard
+    def shard(self):
+        return RedirectShard()
+
+
+    # merge()
+    #
+    # add all rules from a shard, in the order they were collected
+    #
+    # parameter:
+    #  - self
+    #  - RedirectShard
+    # return:
+    #  none
+    def merge(self, shard):
+        for old_url, new_url, options in shard.rules:
+            self.add(old_url, new_url, **options)
+
+
+    def _flush(self):
+        if (len(self.rewrite_buffer) > 0):
+            self.number_rules += len(self.rewrite_buffer)
+            if (self.rewrite_db is not None):
+                for key, value in self.rewrite_buffer:
+                    self.rewrite_db[key] = value
+            else:
+                self.rewrite_fh.write(''.join(self.rewrite_buffer))
+            self.rewrite_buffer = []
+        if (len(self.json_buffer) > 0):
+            self.json_fh.write(''.join(self.json_buffer))
+            self.json_buffer = []
+
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+
+    def close(self):
+        with self.lock:
+            if (self.families):
+                self._compact_families()
+            self._flush()
+            if (self.rewrite_fh is not None):
+                if (self.rewritetype in self.rewrite_footers):
+                    self.rewrite_fh.write(self.rewrite_footers[self.rewritetype])
+                self.rewrite_fh.close()
+                self.rewrite_fh = None
+                logging.info("{n} redirect rules written ({t})".format(n = self.number_rules, t = self.rewritetype))
+            if (self.rewrite_db is not None):
+                self.rewrite_db.close()
+                self.rewrite_db = None
+                logging.info("{n} redirect rules written ({t}, use with RewriteMap \"dbm={d}:{f}\")".format(n = self.number_rules,
+                                                                                                             t = self.rewritetype,
+                                                                                                             d = self.dbm_type,
+                                                                                                             f = self.config.arguments.rewritefile))
+            if (self.json_fh is not None):
+                self.json_fh.close()
+                self.json_fh = None
+
+
+# end RedirectWriter class
+#######################################################################
+
+
+
+#######################################################################
+# RedirectShard class
+
+class RedirectShard:
+    # collects redirect rules without writing them
+    # the rules are replayed into the RedirectWriter with merge()
+
+    def __init__(self):
+        self.rules = []
+
+
+    def add(self, old_url, new_url, **options):
+        self.rules.append((old_url, new_url, options))
+
+
+# end RedirectShard class
+#######################################################################
+
+
+
+
+#######################################################################
+# HugoArchetype class
+
+class HugoArchetype:
+    # creates the Frontmatter for new postings
+    # in 'template' mode "hugo new" runs only once, against a sentinel posting,
+    # and the result is used as template for all new postings
+    # in 'hugo' mode "hugo new" runs for every new posting
+
+    sentinel = 's9y-to-hugo-archetype-sentinel'
+    # the sentinel after template functions like humanize, title or upper
+    sentinel_re = re.compile(r's9y\W*to\W*hugo\W*archetype\W*sentinel', re.IGNORECASE)
+    # these fields are always overwritten by the migration
+    overwritten_fields = ('title', 'date')
+
+
+    def __init__(self, config):
+        self.config = config
+        self.mode = self.config.arguments.archetype_mode
+        self.template = None
+        self.template_text = None
+
+
+    # new_post()
+    #
+    # create the Frontmatter for a new posting
+    #
+    # parameter:
+    #  - self
+    #  - filename of the posting, relative to the content directory
+    #  - full filename of the posting
+    # return:
+    #  - Frontmatter Post
+    def new_post(self, new_file, new_full_file):
+        # can switch to 'hugo' mode, if the archetype can't be used as template
+        self.prepare()
+        if (self.mode == 'hugo'):
+            # use the Hugo binary to create this file
+            # this has the advantage that the full template can be used
+            # and we later fill in the details
+            # otherwise we have to fill in the file from scratch, and this
+            # might be plenty of migration work
+            self._generate_hugo_file(new_file, new_full_file)
+            return frontmatter.load(new_full_file)
+
+        logging.debug("Creating Hugo posting from archetype template: {f}".format(f = new_file))
+        os.makedirs(os.path.dirname(new_full_file), exist_ok = True)
+        if (self.sentinel in self.template_text):
+            # the archetype uses the name of the posting, render it again with the real name
+            return frontmatter.loads(self.template_text.replace(self.sentinel, self._content_base_name(new_file)))
+
+        return frontmatter.Post(self.template.content,
+                                handler = self.template.handler,
+                                **copy.deepcopy(self.template.metadata))
+
+
+    # prepare()
+    #
+    # render the archetype template, if not already done
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def prepare(self):
+        if (self.mode == 'template' and self.template is None):
+            self._load_template()
+
+
+    def _content_base_name(self, new_file):
+        if (self.config.arguments.use_bundles):
+            return os.path.basename(os.path.dirname(new_file))
+        return os.path.splitext(os.path.basename(new_file))[0]
+
+
+    # _load_template()
+    #
+    # run "hugo new" once for a sentinel posting, keep the result as template
+    # and remove the sentinel posting again
+    # falls back to 'hugo' mode if the archetype creates resource files in the
+    # bundle, or if the name of the posting is transformed in the Frontmatter
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def _load_template(self):
+        if (self.config.arguments.use_bundles):
+            new_file = os.path.join('post', self.sentinel, "index.md")
+        else:
+            new_file = os.path.join('post', self.sentinel + ".md")
+        new_full_file = os.path.join(self.config.arguments.targetdir, 'content', new_file)
+        bundle_dir = os.path.dirname(new_full_file)
+        # leftover from an aborted run
+        if (self.config.arguments.use_bundles):
+            if (os.path.exists(bundle_dir)):
+                shutil.rmtree(bundle_dir)
+        elif (os.path.exists(new_full_file)):
+            os.remove(new_full_file)
+
+        logging.debug("Rendering archetype template")
+        self._generate_hugo_file(new_file, new_full_file)
+        with open(new_full_file, 'r', encoding = 'utf8') as f:
+            self.template_text = f.read()
+        resources = []
+        if (self.config.arguments.use_bundles):
+            resources = [f for f in os.listdir(bundle_dir) if f != 'index.md']
+            shutil.rmtree(bundle_dir)
+        else:
+            os.remove(new_full_file)
+
+        self.template = frontmatter.loads(self.template_text)
+
+        if (len(resources) > 0):
+            # the resources must be in every bundle
+            logging.info("Archetype creates resource files in the bundle ({r}), using \"hugo new\" for every posting".format(r = ', '.join(sorted(resources))))
+            self.mode = 'hugo'
+            return
+        transformed = [k for k, v in self.template.metadata.items() if k not in self.overwritten_fields and self._has_transformed_sentinel(v)]
+        if (self._has_transformed_sentinel(self.template.content)):
+            transformed.append('content')
+        if (len(transformed) > 0):
+            # the name can only be replaced if it appears unchanged
+            logging.info("Archetype transforms the name of the posting ({f}), using \"hugo new\" for every posting".format(f = ', '.join(transformed)))
+            self.mode = 'hugo'
+
+
+    def _has_transformed_sentinel(self, value):
+        return self.sentinel_re.search(str(value).replace(self.sentinel, '')) is not None
+
+
+    def _generate_hugo_file(self, new_file, new_full_file):
+        logging.debug("Creating Hugo posting: {f}".format(f = new_file))
+        p = subprocess.Popen([self.config.arguments.hugo_bin, 'new', new_file],
+                             stdout = subprocess.PIPE,
+                             stderr = subprocess.PIPE,
+                             universal_newlines = True,
+                             cwd = self.config.arguments.targetdir)
+        stdout, stderr = p.communicate()
+
+        if (p.returncode != 0):
+            logging.error("Something went wrong creating the Hugo file")
+            logging.error("RC: {rc}".format(rc = p.returncode))
+            logging.error("stdout:\n{s}".format(s = stdout))
+            logging.error("stderr:\n{s}".format(s = stderr))
+            sys.exit(1)
+
+        # verify that the created name is indeed what we
+        # expect (second function parameter)
+        file_match = re.match(r'^Content "(.+)" created$', stdout)
+        if (not file_match):
+            logging.error("Can't find expected string in stdout!")
+            logging.error("stdout:\n{s}".format(s = stdout))
+            logging.error("stderr:\n{s}".format(s = stderr))
+            sys.exit(1)
+
+        if (file_match.group(1) != new_full_file):
+            logging.error("Expected file does not match created file!")
+            logging.error("Expected: {f}".format(f = new_full_file))
+            logging.error(" Created: {f}".format(f = file_match.group(1)))
+            sys.exit(1)
+
+
+# end HugoArchetype class
+#######################################################################
+
+
+
+#######################################################################
+# HugoConfig class
+
+class HugoConfig:
+    # reads the Hugo site configuration without running "hugo config"
+    # supports hugo.* and config.* (toml, yaml, json) in the site directory,
+    # the config/_default and config/<environment> directories, and the
+    # HUGO_* environment overrides
+    # the result is cached in the state directory, keyed by the modification
+    # times of all configuration files
+    # configurations which can't be resolved reliably (themes, modules,
+    # language specific files, parse errors) are read with "hugo config"
+
+    config_names = ['hugo', 'config']
+    config_extensions = ['toml', 'yaml', 'yml', 'json']
+    # these environment variables are settings for Hugo itself, not configuration keys
+    ignored_environment = ['HUGO_ENVIRONMENT', 'HUGO_ENV', 'HUGO_CACHEDIR', 'HUGO_NUMWORKERMULTIPLIER', 'HUGO_MEMORYLIMIT', 'HUGO_FILE_LOG_FORMAT']
+    # Hugo uses these taxonomies if none are configured
+    default_taxonomies = {'category': 'categories', 'tag': 'tags'}
+    cache_version = 1
+
+
+    def __init__(self, config, cache_file):
+        self.config = config
+        self.sitedir = config.arguments.targetdir
+        self.cache_file = cache_file
+
+
+    # load()
+    #
+    # read the configuration, natively if possible
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with the configuration (keys in lower case)
+    def load(self):
+        mode = self.config.arguments.hugo_config_mode
+        if (mode != 'hugo'):
+            try:
+                hugo_config = self._load_native()
+                if (hugo_config is not None):
+                    return hugo_config
+            except HugoConfigAmbiguous as e:
+                if (mode == 'native'):
+                    logging.error("Can't read the Hugo configuration: {e}".format(e = e))
+                    sys.exit(1)
+                logging.debug("Using \"hugo config\": {e}".format(e = e))
+
+        return self._load_hugo()
+
+
+    def environment(self):
+        return os.environ.get('HUGO_ENVIRONMENT', os.environ.get('HUGO_ENV', 'production'))
+
+
+    # config_files()
+    #
+    # find all configuration files, in the order they are merged
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - list with (filename, key), key is None for files with top level settings
+    def config_files(self):
+        files = []
+        for name in self.config_names:
+            for ext in self.config_extensions:
+                filename = os.path.join(self.sitedir, '{n}.{e}'.format(n = name, e = ext))
+                if (os.path.isfile(filename)):
+                    files.append((filename, None))
+                    break
+            if (len(files) > 0):
+                # hugo.* has precedence, config.* is ignored then
+                break
+
+        for env in ['_default', self.environment()]:
+            configdir = os.path.join(self.sitedir, 'config', env)
+            if (not os.path.isdir(configdir)):
+                continue
+            for entry in sorted(os.listdir(configdir)):
+                base, ext = os.path.splitext(entry)
+                if (ext[1:] not in self.config_extensions):
+                    continue
+                if ('.' in base):
+                    # language specific files, like menus.en.toml
+                    raise HugoConfigAmbiguous("language specific configuration file {f}".format(f = entry))
+                if (base in self.config_names):
+                    files.append((os.path.join(configdir, entry), None))
+                else:
+                    # the filename is the key, like params.toml
+                    files.append((os.path.join(configdir, entry), base.lower()))
+
+        return files
+
+
+    def _load_native(self):
+        files = self.config_files()
+        if (len(files) == 0):
+            raise HugoConfigAmbiguous("no configuration file found")
+
+        environment = {k: v for k, v in os.environ.items() if (k.startswith('HUGO') and k not in self.ignored_environment)}
+        fingerprint = {'version': self.cache_version,
+                       'files': [[f, k, os.stat(f).st_mtime_ns] for f, k in files],
+                       'environment': environment}
+        cached = self._read_cache(fingerprint)
+        if (cached is not None):
+            logging.debug("Using cached Hugo configuration")
+            return cached
+
+        hugo_config = {}
+        for filename, key in files:
+            data = self._parse_file(filename)
+            if (key is not None):
+                data = {key: data}
+            self._merge(hugo_config, self._lower_keys(data))
+
+        for name, value in environment.items():
+            self._apply_environment(hugo_config, name, value)
+
+        if (hugo_config.get('theme') or hugo_config.get('module', {}).get('imports')):
+            # themes and modules can add configuration
+            raise HugoConfigAmbiguous("site uses a theme or modules")
+
+        if ('taxonomies' not in hugo_config):
+            hugo_config['taxonomies'] = dict(self.default_taxonomies)
+
+        self._write_cache(fingerprint, hugo_config)
+        logging.debug("Read Hugo configuration from {n} files".format(n = len(files)))
+
+        return hugo_config
+
+
+    def _parse_file(self, filename):
+        ext = os.path.splitext(filename)[1][1:]
+        try:
+            with open(filename, 'rb') as f:
+                content = f.read()
+            if (ext == 'toml'):
+                return self._parse_toml(content.decode('utf-8'))
+            if (ext in ['yaml', 'yml']):
+                import yaml
+                return yaml.safe_load(content) or {}
+            return json.loads(content)
+        except Exception as e:
+            raise HugoConfigAmbiguous("can't parse {f}: {e}".format(f = filename, e = e))
+
+
+    def _parse_toml(self, text):
+        try:
+            import tomllib
+        except ImportError:
+            # Python before 3.11
+            import toml as tomllib
+        return tomllib.loads(text)
+
+
+    # _merge()
+    #
+    # merge a configuration into another, values from the second one win
+    #
+    # parameter:
+    #  - self
+    #  - configuration (is modified)
+    #  - configuration which is merged in
+    # return:
+    #  none
+    def _merge(self, target, source):
+        for key, value in source.items():
+            if (isinstance(value, dict) and isinstance(target.get(key), dict)):
+                self._merge(target[key], value)
+            else:
+                target[key] = value
+
+
+    def _lower_keys(self, data):
+        if (isinstance(data, dict)):
+            return {str(k).lower(): self._lower_keys(v) for k, v in data.items()}
+        return data
+
+
+    # _apply_environment()
+    #
+    # apply an override like HUGO_TITLE or HUGO_PARAMS_AUTHOR, or HUGOxPARAMSxAUTHOR
+    # with a custom delimiter (for keys with '_')
+    #
+    # parameter:
+    #  - self
+    #  - configuration (is modified)
+    #  - name of the environment variable
+    #  - value
+    # return:
+    #  none
+    def _apply_environment(self, hugo_config, name, value):
+        if (len(name) < 6):
+            return
+        delimiter = name[4]
+        keys = [k.lower() for k in name[5:].split(delimiter)]
+        if ('' in keys):
+            return
+        target = hugo_config
+        for key in keys[:-1]:
+            if (not isinstance(target.get(key), dict)):
+                target[key] = {}
+            target = target[key]
+        target[keys[-1]] = value
+
+
+    def _read_cache(self, fingerprint):
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (cache.get('fingerprint') != fingerprint):
+            return None
+
+        return cache['config']
+
+
+    def _write_cache(self, fingerprint, hugo_config):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok = True)
+            with open(self.cache_file + '.tmp', 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'config': hugo_config}, f, default = str)
+            os.replace(self.cache_file + '.tmp', self.cache_file)
+        except OSError as e:
+            logging.debug("Can't write Hugo configuration cache: {e}".format(e = e))
+
+
+    # _load_hugo()
+    #
+    # read the configuration with "hugo config"
+    # newer Hugo versions print TOML, older versions print 'key = value' lines
+    # with 'map[k:v ...]' for maps
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with the configuration (keys in lower case)
+    def _load_hugo(self):
+        logging.debug("Extracting Hugo configuration")
+        p = subprocess.Popen([self.config.arguments.hugo_bin, 'config'],
+                             stdout = subprocess.PIPE,
+                             stderr = subprocess.PIPE,
+                             universal_newlines = True,
+                             cwd = self.sitedir)
+        stdout, stderr = p.communicate()
+
+        if (p.returncode != 0):
+            logging.error("Something went wrong extracting the Hugo configuration")
+            logging.error("RC: {rc}".format(rc = p.returncode))
+            logging.error("stdout:\n{s}".format(s = stdout))
+            logging.error("stderr:\n{s}".format(s = stderr))
+            sys.exit(1)
+
+        try:
+            return self._lower_keys(self._parse_toml(stdout))
+        except Exception:
+            pass
+
+        hugo_config = {}
+        for l in stdout.splitlines():
+            if (' = ' not in l):
+                continue
+            k = l.split(' = ', 1)[0].lower()
+            v = l.split(' = ', 1)[1]
+            if (v.startswith('map[') and v.endswith(']')):
+                # Note: this only extracts the first level of maps
+                #       fields like 'params' have multiple levels
+                hugo_config[k] = dict([i.split(':', 1) for i in v[4:-1].split() if ':' in i])
+            else:
+                hugo_config[k] = v.strip('"')
+
+        return hugo_config
+
+
+# end HugoConfig class
+#######################################################################
+
+
+
+#######################################################################
+# HugoConfigAmbiguous class
+
+class HugoConfigAmbiguous(Exception):
+    # the configuration can't be read without Hugo
+    pass
+
+
+# end HugoConfigAmbiguous class
+#######################################################################
+
+
+
+#######################################################################
+# ImageIndex class
+
+class ImageIndex:
+    # in-memory index of all files in --imagedir
+    # the directory is scanned once, afterwards all existence checks and
+    # path resolutions are answered from memory, without syscalls
+    # the index can be stored in a file, on the next run only directories
+    # with a changed modification time are scanned again
+
+    index_version = 1
+
+
+    def __init__(self, imagedir, index_file = ''):
+        self.imagedir = imagedir
+        # directory -> {'mtime': ..., 'real': ..., 'files': {name: [size, mtime, inode, realpath]}, 'subdirs': [...]}
+        self.dirs = {}
+
+        if (index_file != '' and os.path.exists(index_file)):
+            self._load(index_file)
+        if (len(self.dirs) > 0):
+            self._refresh()
+        else:
+            self._scan(self.imagedir, os.path.realpath(self.imagedir), [])
+
+        number_files = sum([len(d['files']) for d in self.dirs.values()])
+        logging.debug("Image index: {f} files in {d} directories".format(f = number_files, d = len(self.dirs)))
+
+        if (index_file != ''):
+            self._save(index_file)
+
+
+    # resolve()
+    #
+    # resolve an image path (relative to the image directory) into the real path
+    #
+    # parameter:
+    #  - self
+    #  - path, relative to the image directory
+    # return:
+    #  - real path of the image, or None if the image does not exist
+    def resolve(self, path):
+        entry = self.lookup(path)
+        if (entry is None):
+            return None
+
+        return entry[3]
+
+
+    # lookup()
+    #
+    # find an image in the index
+    #
+    # parameter:
+    #  - self
+    #  - path, relative to the image directory
+    # return:
+    #  - [size, mtime, inode, realpath], or None if the image does not exist
+    def lookup(self, path):
+        full_path = os.path.normpath(os.path.join(self.imagedir, path))
+        directory = self.dirs.get(os.path.dirname(full_path))
+        if (directory is None):
+            return None
+
+        return directory['files'].get(os.path.basename(full_path))
+
+
+    def _scan(self, path, realdir, parents):
+        # symlinks can create loops, don't scan a directory inside itself
+        if (realdir in parents):
+            return
+        parents = parents + [realdir]
+
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = list(os.scandir(path))
+        except OSError as e:
+            logging.debug("Can't scan image directory: {d} ({e})".format(d = path, e = e))
+            return
+
+        directory = {'mtime': mtime, 'real': realdir, 'files': {}, 'subdirs': []}
+        self.dirs[path] = directory
+        for entry in entries:
+            try:
+                if (entry.is_dir()):
+                    if (entry.is_symlink()):
+                        subdir_real = os.path.realpath(entry.path)
+                    else:
+                        subdir_real = os.path.join(realdir, entry.name)
+                    directory['subdirs'].append(entry.name)
+                    self._scan(entry.path, subdir_real, parents)
+                elif (entry.is_file()):
+                    st = entry.stat()
+                    if (entry.is_symlink()):
+                        file_real = os.path.realpath(entry.path)
+                    else:
+                        file_real = os.path.join(realdir, entry.name)
+                    directory['files'][entry.name] = [st.st_size, st.st_mtime_ns, st.st_ino, file_real]
+            except OSError:
+                # dangling symlink, or the file was removed in between
+                continue
+
+
+    def _refresh(self):
+        # every directory is only scanned again if the modification time changed
+        for path in list(self.dirs.keys()):
+            if (path not in self.dirs):
+                # removed in the meantime, as subdirectory of a changed directory
+                continue
+            directory = self.dirs[path]
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if (mtime == directory['mtime']):
+                continue
+
+            logging.debug("Image directory changed: {d}".format(d = path))
+            self._remove(path)
+            if (mtime is not None):
+                self._scan(path, os.path.realpath(path), self._parents(path))
+
+
+    def _parents(self, path):
+        parents = []
+        while (path != self.imagedir and path != os.path.dirname(path)):
+            path = os.path.dirname(path)
+            if (path in self.dirs):
+                parents.insert(0, self.dirs[path]['real'])
+
+        return parents
+
+
+    def _remove(self, path):
+        directory = self.dirs.pop(path, None)
+        if (directory is None):
+            return
+        for subdir in directory['subdirs']:
+            self._remove(os.path.join(path, subdir))
+
+
+    def _load(self, index_file):
+        try:
+            with open(index_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.info("Can't read image index, scanning images again: {e}".format(e = e))
+            return
+
+        if (data.get('version') != self.index_version or data.get('imagedir') != self.imagedir):
+            logging.info("Image index is for a different image directory, scanning images again")
+            return
+
+        self.dirs = data['dirs']
+        logging.debug("Read image index: {f}".format(f = index_file))
+
+
+    def _save(self, index_file):
+        data = {'version': self.index_version,
+                'imagedir': self.imagedir,
+                'dirs': self.dirs}
+        index_file_tmp = index_file + ".tmp"
+        with open(index_file_tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(index_file_tmp, index_file)
+        logging.debug("Wrote image index: {f}".format(f = index_file))
+
+
+# end ImageIndex class
+#######################################################################
+
+
+
+#######################################################################
+# ImagePlacer class
+
+class ImagePlacer:
+    # places images from the old blog into the Hugo site
+    # 'copy' copies every image to every target
+    # all other modes store identical images only once, in a content-addressed
+    # store in the Hugo directory, and link every target to the stored file
+
+    # ioctl for reflinks (copy-on-write clones) on Linux
+    FICLONE = 0x40049409
+
+
+    def __init__(self, mode, store_dir):
+        self.mode = mode
+        self.store_dir = store_dir
+        # source path -> SHA-256 of the content
+        self.digests = {}
+        # stored files which are known to exist
+        self.stored = set()
+        self.fallback_warned = False
+        self.stats = self._empty_stats()
+
+
+    def _empty_stats(self):
+        return {'placed': 0, 'copied': 0, 'linked': 0, 'bytes_placed': 0, 'bytes_written': 0}
+
+
+    # place()
+    #
+    # place an image at the target path
+    #
+    # parameter:
+    #  - self
+    #  - source path
+    #  - target path
+    # return:
+    #  none
+    def place(self, source, target):
+        size = os.path.getsize(source)
+        self.stats['placed'] += 1
+        self.stats['bytes_placed'] += size
+
+        if (self.mode == 'copy'):
+            self._copy(source, target)
+            self.stats['copied'] += 1
+            self.stats['bytes_written'] += size
+            return
+
+        digest = self._digest(source)
+        stored = os.path.join(self.store_dir, digest[0:2], digest)
+        if (stored not in self.stored):
+            if (not os.path.exists(stored)):
+                os.makedirs(os.path.dirname(stored), exist_ok = True)
+                stored_tmp = "{s}.tmp-{pid}".format(s = stored, pid = os.getpid())
+                shutil.copyfile(source, stored_tmp)
+                try:
+                    os.link(stored_tmp, stored)
+                    self.stats['bytes_written'] += size
+                except FileExistsError:
+                    # another worker stored the same image in the meantime
+                    pass
+                os.remove(stored_tmp)
+            self.stored.add(stored)
+
+        if (self._link(stored, target)):
+            self.stats['linked'] += 1
+        else:
+            self.stats['copied'] += 1
+            self.stats['bytes_written'] += size
+
+
+    # take_stats()
+    #
+    # return the statistics since the last call, and reset them
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with statistics
+    def take_stats(self):
+        stats = self.stats
+        self.stats = self._empty_stats()
+
+        return stats
+
+
+    def add_stats(self, stats):
+        for k in stats:
+            self.stats[k] += stats[k]
+
+
+    def _digest(self, source):
+        if (source not in self.digests):
+            h = hashlib.sha256()
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+            self.digests[source] = h.hexdigest()
+
+        return self.digests[source]
+
+
+    def _copy(self, source, target):
+        # several workers might place the same image at the same time,
+        # write a temporary file first and then rename it
+        target_tmp = "{t}.tmp-{pid}".format(t = target, pid = os.getpid())
+        shutil.copyfile(source, target_tmp)
+        os.replace(target_tmp, target)
+
+
+    # _link()
+    #
+    # link the target to the stored image
+    #
+    # parameter:
+    #  - self
+    #  - path of the stored image
+    #  - target path
+    # return:
+    #  - True if the image is linked, False if it was copied
+    def _link(self, stored, target):
+        target_tmp = "{t}.tmp-{pid}".format(t = target, pid = os.getpid())
+        linked = True
+        try:
+            if (self.mode == 'hardlink'):
+                os.link(stored, target_tmp)
+            elif (self.mode == 'symlink'):
+                os.symlink(stored, target_tmp)
+            elif (self.mode == 'reflink'):
+                if (fcntl is None):
+                    raise OSError("reflinks are not supported on this platform")
+                with open(stored, 'rb') as src, open(target_tmp, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+        except OSError as e:
+            # filesystem does not support links of this kind
+            if (not self.fallback_warned):
+                logging.warning("Can't place image as {m}, copying instead: {e}".format(m = self.mode, e = e))
+                self.fallback_warned = True
+            shutil.copyfile(stored, target_tmp)
+            linked = False
+        os.replace(target_tmp, target)
+
+        return linked
+
+
+# end ImagePlacer class
+#######################################################################
+
+
+
+#######################################################################
+# MigrationState class
+
+class MigrationState:
+    # state manifest for incremental migrations
+    # records for every posting the inputs of the last conversion, and the
+    # results which are needed to rebuild the redirects and the summary
+    # without converting the posting again
+
+    state_version = 1
+
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.previous = {}
+        self.current = {}
+
+        if (os.path.exists(self.state_file)):
+            try:
+                with open(self.state_file, 'r') as f:
+                    data = json.load(f)
+                if (data.get('version') == self.state_version):
+                    self.previous = data['entries']
+                else:
+                    logging.info("State file is from a different version, migrating all postings")
+            except (OSError, ValueError) as e:
+                logging.info("Can't read state file, migrating all postings: {e}".format(e = e))
+        logging.debug("Read state for {n} postings".format(n = len(self.previous)))
+
+
+    # unchanged()
+    #
+    # find out if a posting was already converted with the same inputs
+    #
+    # parameter:
+    #  - self
+    #  - S9y ID of the posting
+    #  - fingerprint of the inputs
+    #  - full filename of the posting
+    # return:
+    #  - stored result of the last conversion, or None if the posting must be converted
+    def unchanged(self, id, fingerprint, new_full_file):
+        record = self.previous.get(str(id))
+        if (record is None or record['fingerprint'] != fingerprint):
+            return None
+        if (not os.path.exists(new_full_file)):
+            return None
+
+        result = dict(record['result'])
+        redirects = RedirectShard()
+        redirects.rules = [tuple(r) for r in result['redirects']]
+        result['redirects'] = redirects
+        # no images are placed for a posting which is not converted
+        result['images'] = {}
+
+        return result
+
+
+    # record()
+    #
+    # store the inputs and the result of a conversion
+    #
+    # parameter:
+    #  - self
+    #  - S9y ID of the posting
+    #  - fingerprint of the inputs
+    #  - result of the conversion
+    # return:
+    #  none
+    def record(self, id, fingerprint, result):
+        self.current[str(id)] = {'fingerprint': fingerprint,
+                                 'result': {'redirects': result['redirects'].rules,
+                                            'unsupported': result['unsupported'],
+                                            'quotes_changed': result['quotes_changed'],
+                                            'marked': result['marked']}}
+
+
+    def save(self):
+        # postings which are gone or ignored are dropped
+        data = {'version': self.state_version,
+                'entries': self.current}
+        os.makedirs(os.path.dirname(self.state_file), exist_ok = True)
+        state_file_tmp = self.state_file + ".tmp"
+        with open(state_file_tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(state_file_tmp, self.state_file)
+        logging.debug("Wrote state for {n} postings".format(n = len(self.current)))
+
+
+# end MigrationState class
+#######################################################################
+
+
+
+#######################################################################
+# ConversionCache class
+
+class ConversionCache:
+    # content-addressed cache for the Markdown of the postings, in SQLite
+    # the key is the SHA-256 of the converter version and the HTML, the
+    # Markdown is stored before the images and links are rewritten, the
+    # results can be used again with different URL options
+    # every process (main process and workers) opens its own connection,
+    # the least recently used results are removed when the cache is closed
+
+    cache_version = 1
+
+
+    def __init__(self, cache_file, max_size):
+        import sqlite3
+        self.sqlite3 = sqlite3
+
+        self.cache_file = cache_file
+        # in bytes
+        self.max_size = max_size
+        self.conn = None
+        self.conn_pid = None
+        self.failed = False
+        self.stats = self._empty_stats()
+
+
+    def _empty_stats(self):
+        return {'hits': 0, 'misses': 0, 'bytes_stored': 0}
+
+
+    # _connection()
+    #
+    # open the cache for this process, on first use
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - database connection, or None if the cache can't be used
+    def _connection(self):
+        if (self.failed):
+            return None
+        if (self.conn is not None and self.conn_pid == os.getpid()):
+            return self.conn
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok = True)
+            # autocommit, every result is written at once
+            conn = self.sqlite3.connect(self.cache_file, timeout = 60, isolation_level = None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # losing the last results on a crash is fine for a cache
+            conn.execute('PRAGMA synchronous = OFF')
+            if (conn.execute('PRAGMA user_version').fetchone()[0] != self.cache_version):
+                conn.execute('BEGIN IMMEDIATE')
+                # check again, another worker might have created the cache in the meantime
+                if (conn.execute('PRAGMA user_version').fetchone()[0] != self.cache_version):
+                    conn.execute('DROP TABLE IF EXISTS conversions')
+                    conn.execute('CREATE TABLE conversions (key BLOB PRIMARY KEY, markdown TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+                    conn.execute('CREATE INDEX conversions_last_used ON conversions (last_used)')
+                    conn.execute('PRAGMA user_version = {v}'.format(v = self.cache_version))
+                conn.execute('COMMIT')
+        except self.sqlite3.Error as e:
+            logging.warning("Can't use conversion cache {f}: {e}".format(f = self.cache_file, e = e))
+            self.failed = True
+            return None
+
+        self.conn = conn
+        self.conn_pid = os.getpid()
+
+        return self.conn
+
+
+    # key()
+    #
+    # cache key for a conversion
+    #
+    # parameter:
+    #  - self
+    #  - converter version (includes the converter options)
+    #  - HTML
+    # return:
+    #  - key
+    def key(self, version, body):
+        h = hashlib.sha256()
+        h.update(version.encode('utf-8'))
+        h.update(b'\0')
+        h.update(body.encode('utf-8'))
+
+        return h.digest()
+
+
+    # get()
+    #
+    # look up a conversion
+    #
+    # parameter:
+    #  - self
+    #  - key
+    # return:
+    #  - Markdown, or None if the HTML was not converted before
+    def get(self, key):
+        conn = self._connection()
+        if (conn is None):
+            self.stats['misses'] += 1
+            return None
+
+        try:
+            row = conn.execute('SELECT markdown FROM conversions WHERE key = ?', (key,)).fetchone()
+            if (row is not None):
+                conn.execute('UPDATE conversions SET last_used = ? WHERE key = ?', (time.time(), key))
+        except self.sqlite3.Error as e:
+            logging.warning("Can't read from conversion cache: {e}".format(e = e))
+            row = None
+        if (row is None):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+
+        return row[0]
+
+
+    def put(self, key, md):
+        conn = self._connection()
+        if (conn is None):
+            return
+
+        size = len(key) + len(md.encode('utf-8'))
+        try:
+            conn.execute('INSERT OR REPLACE INTO conversions (key, markdown, size, last_used) VALUES (?, ?, ?, ?)', (key, md, size, time.time()))
+        except self.sqlite3.Error as e:
+            logging.warning("Can't write to conversion cache: {e}".format(e = e))
+            return
+        self.stats['bytes_stored'] += size
+
+
+    # take_stats()
+    #
+    # return the statistics since the last call, and reset them
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with statistics
+    def take_stats(self):
+        stats = self.stats
+        self.stats = self._empty_stats()
+
+        return stats
+
+
+    def add_stats(self, stats):
+        for k in stats:
+            self.stats[k] += stats[k]
+
+
+    # close()
+    #
+    # remove the least recently used results if the cache is larger than
+    # the maximum size, and close the cache
+    # the cache is shrunk to 3/4 of the maximum size, it's not rewritten
+    # after every run
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - number of removed results
+    #  - size of the cache in bytes
+    def close(self):
+        conn = self._connection()
+        if (conn is None):
+            return 0, 0
+
+        removed = 0
+        size = 0
+        try:
+            size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM conversions').fetchone()[0]
+            if (size > self.max_size):
+                keys = []
+                for key, entry_size in conn.execute('SELECT key, size FROM conversions ORDER BY last_used'):
+                    keys.append((key,))
+                    size -= entry_size
+                    if (size <= self.max_size * 3 // 4):
+                        break
+                conn.execute('BEGIN')
+                conn.executemany('DELETE FROM conversions WHERE key = ?', keys)
+                conn.execute('COMMIT')
+                removed = len(keys)
+                logging.debug("Removed {n} results from the conversion cache".format(n = removed))
+                # give the space back
+                conn.execute('VACUUM')
+            conn.close()
+        except self.sqlite3.Error as e:
+            logging.warning("Can't clean up conversion cache: {e}".format(e = e))
+        self.conn = None
+
+        return removed, size
+
+
+    # the connection can't be copied into worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['sqlite3'] = None
+        state['conn'] = None
+        state['conn_pid'] = None
+        return state
+
+
+    def __setstate__(self, state):
+        import sqlite3
+        self.__dict__.update(state)
+        self.sqlite3 = sqlite3
+
+
+# end ConversionCache class
+#######################################################################
+
+
+
+
+#######################################################################
+# S9yConfig class
+
+class S9yConfig:
+    # the global S9y settings from the {prefix}_config table
+    # all settings are loaded once, at startup, every lookup is a dictionary access
+
+    def __init__(self, db):
+        self.settings = {}
+        for r in db.config_entries():
+            self.settings[r['name']] = r['value']
+        logging.debug("Read {n} S9y settings".format(n = len(self.settings)))
+
+
+    # get_str()
+    #
+    # return a S9y setting as string
+    #
+    # parameter:
+    #  - self
+    #  - name of the setting
+    #  - default value, if the setting does not exist (None: setting is required)
+    # return:
+    #  - value
+    def get_str(self, name, default = None):
+        if (name not in self.settings or self.settings[name] is None):
+            if (default is None):
+                logging.error("Setting '{n}' is missing in S9y configuration!".format(n = name))
+                sys.exit(1)
+            return default
+
+        return str(self.settings[name])
+
+
+    # get_int()
+    #
+    # return a S9y setting as integer
+    #
+    # parameter:
+    #  - self
+    #  - name of the setting
+    #  - default value, if the setting does not exist (None: setting is required)
+    #  - minimum allowed value (None: no minimum)
+    # return:
+    #  - value
+    def get_int(self, name, default = None, minimum = None):
+        value = self.get_str(name, default)
+        try:
+            value = int(value)
+        except ValueError:
+            logging.error("{n} in S9y is invalid!".format(n = name))
+            logging.error("Value: {v}".format(v = value))
+            sys.exit(1)
+
+        if (minimum is not None and value < minimum):
+            logging.error("{n} in S9y is invalid!".format(n = name))
+            logging.error("Value: {v}".format(v = value))
+            sys.exit(1)
+
+        return value
+
+
+    # get_bool()
+    #
+    # return a S9y setting as boolean
+    #
+    # parameter:
+    #  - self
+    #  - name of the setting
+    #  - default value, if the setting does not exist or is empty (None: setting is required)
+    # return:
+    #  - value
+    def get_bool(self, name, default = None):
+        value = self.get_str(name, default)
+        if (value is True or value is False):
+            # default value
+            return value
+
+        value = value.strip().lower()
+        if (value in ('true', '1', 'yes')):
+            return True
+        if (value in ('false', '0', 'no')):
+            return False
+        if (value == '' and default is not None):
+            return default
+
+        logging.error("{n} in S9y is invalid!".format(n = name))
+        logging.error("Value: {v}".format(v = value))
+        sys.exit(1)
+
+
+# end S9yConfig class
+#######################################################################
+
+
+
+
+#######################################################################
+# HtmlConverterMarkdownify class
+
+class HtmlConverterMarkdownify:
+    # converts the HTML with markdownify, on a BeautifulSoup tree
+    # the tree is built with html.parser or lxml (--html-parser)
+
+
+    def __init__(self, config, profiler):
+        self.config = config
+        self.profiler = profiler
+        self.parser = self.config.arguments.html_parser
+        self.converter = markdownify.MarkdownConverter()
+        self.version = 'markdownify {v} {p}'.format(v = package_version('markdownify'), p = self.parser)
+
+
+    # convert()
+    #
+    # convert HTML into Markdown
+    #
+    # parameter:
+    #  - self
+    #  - HTML
+    #  - flag if the prettified HTML is needed (--write-html)
+    # return:
+    #  - Markdown
+    #  - prettified HTML, or None
+    def convert(self, body, pretty = False):
+        # the HTML is parsed only once, the same tree is used for the
+        # Markdown conversion and for the --write-html output
+        with self.profiler.stage('parse html'):
+            soup = BeautifulSoup(body, self.parser)
+        pretty_body = None
+        if (pretty):
+            # older markdownify versions modify the tree during the conversion
+            with self.profiler.stage('prettify html'):
+                pretty_body = soup.prettify()
+        with self.profiler.stage('markdownify'):
+            md = self.converter.convert_soup(soup)
+
+        return md, pretty_body
+
+
+    # prettify()
+    #
+    # prettified HTML for --write-html, without converting the HTML
+    #
+    # parameter:
+    #  - self
+    #  - HTML
+    # return:
+    #  - prettified HTML
+    def prettify(self, body):
+        with self.profiler.stage('parse html'):
+            soup = BeautifulSoup(body, self.parser)
+        with self.profiler.stage('prettify html'):
+            return soup.prettify()
+
+
+# end HtmlConverterMarkdownify class
+#######################################################################
+
+
+
+
+#######################################################################
+# HtmlConverterStreaming class
+
+class HtmlConverterStreaming:
+    # converts the HTML while it is parsed, with the events from html.parser,
+    # without building a document tree
+    # every element is converted when it is closed, the open elements are
+    # kept on a stack: [name, attributes, children, parent tags for the children,
+    # parent tags, extra information for lists and tables]
+    # the children are (name, Markdown or text, deferred) tuples, text has the
+    # name '#text', comments and declarations '#comment'
+    #
+    # the tree building follows BeautifulSoup with html.parser, and the
+    # conversion follows markdownify (1.x, default options), the conformance
+    # corpus in benchmark/ shows the remaining differences
+    # known differences: multi-row <thead> with <td> cells, <thead> after <tbody>,
+    # and malformed character references
+
+    # increase if the output changes
+    converter_version = 1
+
+    # tags without content and without end tag (see BeautifulSoup)
+    empty_elements = frozenset(['area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed',
+                                'frame', 'hr', 'image', 'img', 'input', 'isindex', 'keygen', 'link',
+                                'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr'])
+    # whitespace is kept in these tags
+    preserve_whitespace = frozenset(['pre', 'textarea'])
+    # whitespace directly inside these tags is removed
+    block_elements = frozenset(['p', 'blockquote', 'article', 'div', 'section', 'ol', 'ul', 'li',
+                                'dl', 'dt', 'dd', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th',
+                                'h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+    # whitespace directly before and after these tags is removed
+    block_outside_elements = block_elements | frozenset(['pre'])
+    # the markup for inline tags
+    inline_markup = {'b': '**', 'strong': '**', 'em': '*', 'i': '*', 'del': '~~', 's': '~~', 'sub': '', 'sup': ''}
+    # tag -> conversion method, for all other tags only the content is used
+    convert_methods = {'a': '_convert_a', 'blockquote': '_convert_blockquote', 'br': '_convert_br',
+                       'code': '_convert_code', 'kbd': '_convert_code', 'samp': '_convert_code',
+                       'div': '_convert_div', 'article': '_convert_div', 'section': '_convert_div', 'dl': '_convert_div',
+                       'dd': '_convert_dd', 'dt': '_convert_dt', 'hr': '_convert_hr', 'img': '_convert_img',
+                       'video': '_convert_video', 'ul': '_convert_list', 'ol': '_convert_list', 'li': '_convert_li',
+                       'p': '_convert_p', 'pre': '_convert_pre', 'q': '_convert_q',
+                       'script': '_convert_script', 'style': '_convert_script',
+                       'table': '_convert_table', 'caption': '_convert_caption', 'figcaption': '_convert_figcaption',
+                       'td': '_convert_td', 'th': '_convert_td', 'tr': '_convert_tr'}
+    bullets = '*+-'
+
+    heading_re = re.compile(r'h(\d+)')
+    whitespace_re = re.compile(r'[\t ]+')
+    all_whitespace_re = re.compile(r'[\t \r\n]+')
+    newline_whitespace_re = re.compile(r'[\t \r\n]*[\r\n][\t \r\n]*')
+    line_with_content_re = re.compile(r'^(.*)', flags = re.MULTILINE)
+    pre_lstrip_re = re.compile(r'^[ \n]*\n')
+    pre_rstrip_re = re.compile(r'[ \n]*$')
+    backtick_runs_re = re.compile(r'`+')
+
+
+    def __init__(self, config, profiler):
+        self.config = config
+        self.profiler = profiler
+        self.version = 'streaming {v}'.format(v = self.converter_version)
+        # tag name -> conversion method, or None
+        self.convert_functions = {}
+        self.stack = None
+        self.data = None
+        self.preserve = 0
+        self.closed_empty_elements = None
+
+
+    # convert()
+    #
+    # convert HTML into Markdown
+    #
+    # parameter:
+    #  - self
+    #  - HTML
+    #  - flag if the prettified HTML is needed (--write-html)
+    # return:
+    #  - Markdown
+    #  - prettified HTML, or None
+    def convert(self, body, pretty = False):
+        import html.parser
+
+        with self.profiler.stage('convert html'):
+            parser = html.parser.HTMLParser(convert_charrefs = True)
+            parser.handle_starttag = self._start_tag
+            parser.handle_startendtag = self._start_end_tag
+            parser.handle_endtag = self._end_tag
+            parser.handle_data = self._data
+            parser.handle_comment = self._comment
+            parser.handle_decl = self._comment
+            parser.unknown_decl = self._special_text
+            parser.handle_pi = self._special_text
+
+            self.stack = [['[document]', {}, [], frozenset(['[document]']), frozenset(), None]]
+            self.data = []
+            self.preserve = 0
+            # empty elements without "/>", their end tags are ignored
+            self.closed_empty_elements = []
+            parser.feed(body)
+            parser.close()
+            self._end_data()
+            while (len(self.stack) > 1):
+                self._close_element()
+            md = self._children_text(self.stack.pop()).strip('\n')
+            self.stack = None
+            self.data = None
+            self.closed_empty_elements = None
+
+        pretty_body = None
+        if (pretty):
+            pretty_body = self.prettify(body)
+
+        return md, pretty_body
+
+
+    # prettify()
+    #
+    # prettified HTML for --write-html, the tree is built just for that
+    #
+    # parameter:
+    #  - self
+    #  - HTML
+    # return:
+    #  - prettified HTML
+    def prettify(self, body):
+        with self.profiler.stage('prettify html'):
+            return BeautifulSoup(body, 'html.parser').prettify()
+
+
+    def _data(self, data):
+        self.data.append(data)
+
+
+    # _end_data()
+    #
+    # add the collected text to the current element
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  none
+    def _end_data(self):
+        if (len(self.data) == 0):
+            return
+        text = ''.join(self.data)
+        self.data = []
+        # whitespace-only text is reduced to a single space or newline
+        if (self.preserve == 0 and text.strip(' \t\n\r\f') == ''):
+            text = '\n' if ('\n' in text) else ' '
+        self.stack[-1][2].append(('#text', text, False))
+
+
+    def _comment(self, data):
+        self._end_data()
+        self.stack[-1][2].append(('#comment', data, False))
+
+
+    # processing instructions and CDATA are text for markdownify
+    def _special_text(self, data):
+        self._end_data()
+        if (data.upper().startswith('CDATA[')):
+            data = data[6:]
+        self.data.append(data)
+        self._end_data()
+
+
+    def _start_tag(self, tag, attrs, closed = False):
+        self._end_data()
+        # the last value wins, attributes without value are empty
+        attributes = {}
+        for k, v in attrs:
+            attributes[k] = v if (v is not None) else ''
+
+        parent = self.stack[-1]
+        if (tag in self.empty_elements):
+            self._add_element(tag, attributes, [], parent)
+            if (not closed):
+                self.closed_empty_elements.append(tag)
+            return
+
+        tags = set(parent[3])
+        tags.add(tag)
+        if (tag in ('td', 'th') or self.heading_re.match(tag)):
+            tags.add('_inline')
+        if (tag in ('pre', 'code', 'kbd', 'samp')):
+            tags.add('_noformat')
+        if (tag in self.preserve_whitespace):
+            self.preserve += 1
+        self.stack.append([tag, attributes, [], frozenset(tags), parent[3], None])
+
+
+    def _start_end_tag(self, tag, attrs):
+        self._start_tag(tag, attrs, closed = True)
+        if (tag not in self.empty_elements):
+            self._end_tag(tag)
+
+
+    def _end_tag(self, tag):
+        if (tag in self.closed_empty_elements):
+            # like BeautifulSoup, this doesn't even end the text
+            self.closed_empty_elements.remove(tag)
+            return
+        self._end_data()
+        # close all elements up to the most recent one with this name,
+        # end tags without start tag are ignored
+        for i in range(len(self.stack) - 1, 0, -1):
+            if (self.stack[i][0] == tag):
+                while (len(self.stack) > i):
+                    self._close_element()
+                return
+
+
+    def _close_element(self):
+        element = self.stack.pop()
+        if (element[0] in self.preserve_whitespace):
+            self.preserve -= 1
+        self._add_element(element[0], element[1], element[2], self.stack[-1], element)
+
+
+    # _add_element()
+    #
+    # convert an element and add it to the parent
+    #
+    # parameter:
+    #  - self
+    #  - tag name
+    #  - attributes
+    #  - children
+    #  - parent element
+    #  - the element itself (None for empty elements)
+    # return:
+    #  none
+    def _add_element(self, tag, attributes, children, parent, element = None):
+        if (element is None):
+            element = [tag, attributes, children, parent[3] | frozenset([tag]), parent[3], None]
+        text = self._children_text(element) if (len(children) > 0) else ''
+
+        deferred = False
+        if (tag not in self.convert_functions):
+            self.convert_functions[tag] = self._convert_function(tag)
+        convert_function = self.convert_functions[tag]
+        if (convert_function is not None):
+            text = convert_function(element, text, parent)
+            if (tag in ('ul', 'ol') and 'li' not in element[4]):
+                # the list needs the next sibling, see _children_text()
+                deferred = True
+
+        if (tag in ('td', 'th')):
+            # every row needs all its cells
+            colspan = attributes.get('colspan', '')
+            colspan = max(1, min(1000, int(colspan))) if (colspan.isdigit()) else 1
+            for e in self.stack:
+                if (e[0] == 'tr'):
+                    if (e[5] is None):
+                        e[5] = []
+                    e[5].append((tag, colspan))
+        elif (tag == 'source' and 'src' in attributes):
+            for e in self.stack:
+                if (e[0] == 'video' and e[5] is None):
+                    e[5] = attributes['src']
+
+        parent[2].append((tag, text, deferred))
+
+
+    def _convert_function(self, tag):
+        if (tag in self.inline_markup):
+            return self._convert_inline
+        if (tag in self.convert_methods):
+            return getattr(self, self.convert_methods[tag])
+        if (self.heading_re.match(tag)):
+            return self._convert_heading
+        # no conversion, only the content is used
+        return None
+
+
+    # _children_text()
+    #
+    # process the text children of an element, and join the children
+    # (markdownify: process_tag(), process_text())
+    #
+    # parameter:
+    #  - self
+    #  - element
+    # return:
+    #  - Markdown of all children
+    def _children_text(self, element):
+        tag = element[0]
+        children = element[2]
+        tags = element[3]
+        inside = tag in self.block_elements or (tag[0:1] == 'h' and self.heading_re.match(tag) is not None)
+        outside = self.block_outside_elements
+        in_pre = 'pre' in tags
+        noformat = '_noformat' in tags
+
+        strings = []
+        last = len(children) - 1
+        for i, (name, text, deferred) in enumerate(children):
+            if (name == '#comment'):
+                continue
+            previous_name = children[i - 1][0] if (i > 0) else None
+            next_name = children[i + 1][0] if (i < last) else None
+            if (name == '#text'):
+                if (text.strip() == ''):
+                    # whitespace next to block elements is ignored
+                    if (inside and (previous_name is None or next_name is None)):
+                        continue
+                    if (previous_name in outside or next_name in outside):
+                        continue
+                if (not in_pre):
+                    text = self.newline_whitespace_re.sub('\n', text)
+                    text = self.whitespace_re.sub(' ', text)
+                if (not noformat):
+                    text = text.replace('*', '\\*').replace('_', '\\_')
+                if (previous_name in outside or (inside and previous_name is None)):
+                    text = text.lstrip(' \t\r\n')
+                if (next_name in outside or (inside and next_name is None)):
+                    text = text.rstrip()
+            elif (deferred):
+                text = '\n\n' + text + ('\n' if (self._before_paragraph(children, i)) else '')
+            if (text):
+                strings.append(text)
+
+        if (in_pre):
+            return ''.join(strings)
+
+        # collapse the newlines between the children, at most two
+        result = ['']
+        for s in strings:
+            content = s.lstrip('\n')
+            leading = len(s) - len(content)
+            stripped = content.rstrip('\n')
+            trailing = len(content) - len(stripped)
+            if (result[-1] and leading):
+                leading = min(2, max(len(result.pop()), leading))
+            result.append('\n' * leading)
+            result.append(stripped)
+            result.append('\n' * trailing)
+
+        return ''.join(result)
+
+
+    # a list is followed by a newline if the next content is not a list
+    def _before_paragraph(self, children, i):
+        for name, text, deferred in children[i + 1:]:
+            if (name == '#comment' or (name == '#text' and text.strip() == '')):
+                continue
+            return name not in ('ul', 'ol')
+
+        return False
+
+
+    def _chomp(self, text):
+        prefix = ' ' if (text and text[0] == ' ') else ''
+        suffix = ' ' if (text and text[-1] == ' ') else ''
+
+        return prefix, suffix, text.strip()
+
+
+    def _convert_script(self, element, text, parent):
+        return ''
+
+
+    def _convert_inline(self, element, text, parent):
+        if ('_noformat' in element[4]):
+            return text
+        prefix, suffix, text = self._chomp(text)
+        if (not text):
+            return ''
+        markup = self.inline_markup[element[0]]
+
+        return prefix + markup + text + markup + suffix
+
+
+    def _convert_a(self, element, text, parent):
+        if ('_noformat' in element[4]):
+            return text
+        prefix, suffix, text = self._chomp(text)
+        if (not text):
+            return ''
+        href = element[1].get('href')
+        title = element[1].get('title')
+        if (text.replace('\\_', '_') == href and not title):
+            return '<{href}>'.format(href = href)
+        title_part = ' "{t}"'.format(t = title.replace('"', '\\"')) if (title) else ''
+
+        return '{p}[{text}]({href}{t}){s}'.format(p = prefix, text = text, href = href, t = title_part, s = suffix) if (href) else text
+
+
+    def _convert_blockquote(self, element, text, parent):
+        text = text.strip(' \t\r\n')
+        if ('_inline' in element[4]):
+            return ' ' + text + ' '
+        if (not text):
+            return '\n'
+        text = self.line_with_content_re.sub(lambda m: '> ' + m.group(1) if (m.group(1)) else '>', text)
+
+        return '\n' + text + '\n\n'
+
+
+    def _convert_br(self, element, text, parent):
+        if ('_inline' in element[4]):
+            return text + ' ' if (text) else ' '
+
+        return '  \n' + text
+
+
+    def _convert_code(self, element, text, parent):
+        if ('_noformat' in element[4]):
+            return text
+        prefix, suffix, text = self._chomp(text)
+        if (not text):
+            return ''
+        max_backticks = max((len(m) for m in self.backtick_runs_re.findall(text)), default = 0)
+        delimiter = '`' * (max_backticks + 1)
+        if (max_backticks > 0):
+            text = ' ' + text + ' '
+
+        return prefix + delimiter + text + delimiter + suffix
+
+
+    def _convert_div(self, element, text, parent):
+        if ('_inline' in element[4]):
+            return ' ' + text.strip() + ' '
+        text = text.strip()
+
+        return '\n\n' + text + '\n\n' if (text) else ''
+
+
+    def _convert_dd(self, element, text, parent):
+        text = text.strip()
+        if ('_inline' in element[4]):
+            return ' ' + text + ' '
+        if (not text):
+            return '\n'
+        text = self.line_with_content_re.sub(lambda m: '    ' + m.group(1) if (m.group(1)) else '', text)
+
+        return ':' + text[1:] + '\n'
+
+
+    def _convert_dt(self, element, text, parent):
+        text = self.all_whitespace_re.sub(' ', text.strip())
+        if ('_inline' in element[4]):
+            return ' ' + text + ' '
+        if (not text):
+            return '\n'
+
+        return '\n\n' + text + '\n'
+
+
+    def _convert_heading(self, element, text, parent):
+        if ('_inline' in element[4]):
+            return text
+        n = max(1, min(6, int(self.heading_re.match(element[0]).group(1))))
+        text = text.strip()
+        if (n <= 2):
+            # underlined
+            text = text.rstrip()
+            return '\n\n{text}\n{line}\n\n'.format(text = text, line = ('=' if (n == 1) else '-') * len(text)) if (text) else ''
+        text = self.all_whitespace_re.sub(' ', text)
+
+        return '\n\n{h} {text}\n\n'.format(h = '#' * n, text = text)
+
+
+    def _convert_hr(self, element, text, parent):
+        return '\n\n---\n\n'
+
+
+    def _convert_img(self, element, text, parent):
+        alt = element[1].get('alt') or ''
+        src = element[1].get('src') or ''
+        title = element[1].get('title') or ''
+        if ('_inline' in element[4]):
+            return alt
+        title_part = ' "{t}"'.format(t = title.replace('"', '\\"')) if (title) else ''
+
+        return '![{alt}]({src}{t})'.format(alt = alt, src = src, t = title_part)
+
+
+    def _convert_video(self, element, text, parent):
+        if ('_inline' in element[4]):
+            return text
+        src = element[1].get('src') or element[5] or ''
+        poster = element[1].get('poster') or ''
+        if (src and poster):
+            return '[![{t}]({p})]({s})'.format(t = text, p = poster, s = src)
+        if (src):
+            return '[{t}]({s})'.format(t = text, s = src)
+        if (poster):
+            return '![{t}]({p})'.format(t = text, p = poster)
+
+        return text
+
+
+    def _convert_list(self, element, text, parent):
+        if ('li' in element[4]):
+            # nested list
+            return '\n' + text.rstrip()
+
+        # the newline after the list is added by _children_text()
+        return text
+
+
+    def _convert_li(self, element, text, parent):
+        text = text.strip()
+        if (not text):
+            return '\n'
+        if (parent[0] == 'ol'):
+            start = parent[1].get('start', '')
+            start = int(start) if (start.isnumeric()) else 1
+            bullet = '{n}.'.format(n = start + len([c for c in parent[2] if c[0] == 'li']))
+        else:
+            depth = len([e for e in self.stack if e[0] == 'ul']) - 1
+            bullet = self.bullets[depth % len(self.bullets)]
+        bullet += ' '
+        indent = ' ' * len(bullet)
+        text = self.line_with_content_re.sub(lambda m: indent + m.group(1) if (m.group(1)) else '', text)
+
+        return bullet + text[len(bullet):] + '\n'
+
+
+    def _convert_p(self, element, text, parent):
+        if ('_inline' in element[4]):
+            return ' ' + text.strip(' \t\r\n') + ' '
+        text = text.strip(' \t\r\n')
+
+        return '\n\n' + text + '\n\n' if (text) else ''
+
+
+    def _convert_pre(self, element, text, parent):
+        if (not text):
+            return ''
+        text = self.pre_lstrip_re.sub('', text)
+        text = self.pre_rstrip_re.sub('', text)
+
+        return '\n\n```\n' + text + '\n```\n\n'
+
+
+    def _convert_q(self, element, text, parent):
+        return '"' + text + '"'
+
+
+    def _convert_table(self, element, text, parent):
+        return '\n\n' + text.strip() + '\n\n'
+
+
+    def _convert_caption(self, element, text, parent):
+        return text.strip() + '\n\n'
+
+
+    def _convert_figcaption(self, element, text, parent):
+        return '\n\n' + text.strip() + '\n\n'
+
+
+    def _convert_td(self, element, text, parent):
+        colspan = element[1].get('colspan', '')
+        colspan = max(1, min(1000, int(colspan))) if (colspan.isdigit()) else 1
+
+        return ' ' + text.strip().replace('\n', ' ') + ' |' * colspan
+
+
+    # _convert_tr()
+    #
+    # a table row, the first row gets the header line
+    # (markdownify: convert_tr(), the following rows of the table are not known yet)
+    def _convert_tr(self, element, text, parent):
+        cells = element[5] or []
+        is_first_row = len([c for c in parent[2] if c[0][0:1] != '#']) == 0
+        is_headrow = (all([c[0] == 'th' for c in cells]) or
+                      (parent[0] == 'thead' and len([c for c in parent[2] if c[0] == 'tr']) == 0))
+        if (parent[0] == 'tbody'):
+            grandparent = self.stack[-2] if (len(self.stack) > 1 and self.stack[-1] is parent) else None
+            has_thead = grandparent is not None and len([c for c in grandparent[2] if c[0] == 'thead']) > 0
+            tbody_first = grandparent is None or len([c for c in grandparent[2] if c[0][0:1] != '#']) == 0
+            is_head_row_missing = is_first_row and not has_thead
+        else:
+            tbody_first = False
+            is_head_row_missing = is_first_row
+        full_colspan = sum([c[1] for c in cells])
+
+        overline = ''
+        underline = ''
+        if (is_headrow and is_first_row):
+            underline = '| ' + ' | '.join(['---'] * full_colspan) + ' |\n'
+        elif (is_head_row_missing or (is_first_row and (parent[0] == 'table' or (parent[0] == 'tbody' and tbody_first)))):
+            overline = '| ' + ' | '.join([''] * full_colspan) + ' |\n'
+            overline += '| ' + ' | '.join(['---'] * full_colspan) + ' |\n'
+
+        return overline + '|' + text + '\n' + underline
+
+
+# end HtmlConverterStreaming class
+#######################################################################
+
+
+
+
+#######################################################################
+# HtmlConverter class
+
+class HtmlConverter:
+    # selects the engine for converting the HTML of the postings into Markdown
+    #  - markdownify: markdownify on a BeautifulSoup tree (html.parser or lxml)
+    #  - streaming: converts while parsing with html.parser, faster, with
+    #    small differences in the output (see HtmlConverterStreaming)
+    # the results are kept in the conversion cache, if one is used
+
+    def __init__(self, config, profiler, cache = None):
+        self.config = config
+        self.profiler = profiler
+        self.cache = cache
+        self.engine_name = self.config.arguments.html_converter
+
+        if (self.engine_name == "markdownify"):
+            logging.debug("Selecting markdownify HTML converter")
+            self.engine = HtmlConverterMarkdownify(config, profiler)
+        elif (self.engine_name == "streaming"):
+            logging.debug("Selecting streaming HTML converter")
+            self.engine = HtmlConverterStreaming(config, profiler)
+        else:
+            logging.error("Unknown HTML converter")
+            sys.exit(1)
+        # identifies the converter and the version, the output can change with the version
+        self.version = self.engine.version
+
+
+    # convert()
+    #
+    # convert HTML into Markdown, or take the Markdown from the cache
+    #
+    # parameter:
+    #  - self
+    #  - HTML
+    #  - flag if the prettified HTML is needed (--write-html)
+    # return:
+    #  - Markdown
+    #  - prettified HTML, or None
+    def convert(self, body, pretty = False):
+        if (self.cache is None):
+            return self.engine.convert(body, pretty)
+
+        with self.profiler.stage('conversion cache'):
+            key = self.cache.key(self.version, body)
+            md = self.cache.get(key)
+        if (md is None):
+            md, pretty_body = self.engine.convert(body, pretty)
+            with self.profiler.stage('conversion cache'):
+                self.cache.put(key, md)
+            return md, pretty_body
+
+        pretty_body = None
+        if (pretty):
+            pretty_body = self.engine.prettify(body)
+
+        return md, pretty_body
+
+
+# end HtmlConverter class
+#######################################################################
+
+
+
+
+#######################################################################
+# Profiler class
+
+class Profiler:
+    # collects the time spent in the migration phases, and in the stages
+    # of the posting conversion
+    # the stages are collected in every process (also in the workers), and
+    # handed over with take_stages(), like the image statistics
+    # when profiling is disabled, stage() returns a shared no-op context
+
+    null_timer = contextlib.nullcontext()
+
+
+    def __init__(self, config):
+        self.config = config
+        self.enabled = (config.arguments.profile is True or config.arguments.profile_json != '')
+        # phase name -> seconds, in the order the phases run
+        self.phases = {}
+        # stage name -> [calls, seconds], collected since the last take_stages()
+        self.stages = {}
+        # stage name -> [calls, seconds], merged from all processes
+        self.total_stages = {}
+        # heap with the slowest postings: (seconds, id, link, body size)
+        self.slowest_posts = []
+
+
+    # phase()
+    #
+    # time a migration phase
+    #
+    # parameter:
+    #  - self
+    #  - name of the phase
+    # return:
+    #  - context manager
+    def phase(self, name):
+        if (not self.enabled):
+            return self.null_timer
+        return ProfilerTimer(self.phases, name, False)
+
+
+    # stage()
+    #
+    # time a stage, it can run many times
+    #
+    # parameter:
+    #  - self
+    #  - name of the stage
+    # return:
+    #  - context manager
+    def stage(self, name):
+        if (not self.enabled):
+            return self.null_timer
+        return ProfilerTimer(self.stages, name, True)
+
+
+    def take_stages(self):
+        stages = self.stages
+        self.stages = {}
+        return stages
+
+
+    def add_stages(self, stages):
+        for name, (calls, seconds) in stages.items():
+            total = self.total_stages.setdefault(name, [0, 0.0])
+            total[0] += calls
+            total[1] += seconds
+
+
+    # add_post()
+    #
+    # remember the conversion time of a posting, only the slowest are kept
+    #
+    # parameter:
+    #  - self
+    #  - seconds
+    #  - S9y ID of the posting
+    #  - link of the posting
+    #  - size of the body in bytes
+    # return:
+    #  none
+    def add_post(self, seconds, id, link, body_size):
+        if (not self.enabled or self.config.arguments.profile_top < 1):
+            return
+        item = (seconds, id, link, body_size)
+        if (len(self.slowest_posts) < self.config.arguments.profile_top):
+            heapq.heappush(self.slowest_posts, item)
+        elif (item > self.slowest_posts[0]):
+            heapq.heapreplace(self.slowest_posts, item)
+
+
+    # results()
+    #
+    # all collected timings, including the stages not yet handed over
+    #
+    # parameter:
+    #  - self
+    # return:
+    #  - dictionary with phases, stages and slowest postings
+    def results(self):
+        self.add_stages(self.take_stages())
+        return {'jobs': self.config.arguments.jobs,
+                'phases': dict(self.phases),
+                'total': sum(self.phases.values()),
+                'stages': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.total_stages.items()},
+                'slowest_posts': [{'seconds': p[0], 'id': p[1], 'link': p[2], 'body_size': p[3]} for p in sorted(self.slowest_posts, reverse = True)]}
+
+
+    def report(self):
+        if (not self.enabled):
+            return
+        results = self.results()
+
+        total = results['total']
+        print("")
+        print("{n:<24}{s:>12}{p:>8}".format(n = 'phase', s = 'seconds', p = '%'))
+        for name, seconds in results['phases'].items():
+            print("{n:<24}{s:>12.3f}{p:>7.1f}%".format(n = name, s = seconds, p = seconds * 100 / total if (total > 0) else 0))
+        print("{n:<24}{s:>12.3f}".format(n = 'total', s = total))
+
+        if (len(results['stages']) > 0):
+            print("")
+            if (results['jobs'] > 1):
+                print("stages of entries(), summed over all {j} worker processes:".format(j = results['jobs']))
+            print("{n:<24}{c:>10}{s:>12}{a:>10}".format(n = 'stage', c = 'calls', s = 'seconds', a = 'avg ms'))
+            for name, stage in sorted(results['stages'].items(), key = lambda s: s[1]['seconds'], reverse = True):
+                print("{n:<24}{c:>10}{s:>12.3f}{a:>10.3f}".format(n = name,
+                                                                   c = stage['calls'],
+                                                                   s = stage['seconds'],
+                                                                   a = stage['seconds'] * 1000 / stage['calls']))
+
+        if (len(results['slowest_posts']) > 0):
+            print("")
+            print("slowest postings:")
+            print("{s:>10}{b:>12}{i:>8}  {l}".format(s = 'seconds', b = 'body bytes', i = 'id', l = 'link'))
+            for p in results['slowest_posts']:
+                print("{s:>10.3f}{b:>12}{i:>8}  {l}".format(s = p['seconds'], b = p['body_size'], i = p['id'], l = p['link']))
+
+        if (self.config.arguments.profile_json != ''):
+            with open(self.config.arguments.profile_json, 'w') as f:
+                json.dump(results, f, indent = 2)
+            logging.info("Profile written to {f}".format(f = self.config.arguments.profile_json))
+
+
+    # only the settings go into worker processes, every worker collects its own timings
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['phases'] = {}
+        state['stages'] = {}
+        state['total_stages'] = {}
+        state['slowest_posts'] = []
+        return state
+
+
+# end Profiler class
+#######################################################################
+
+
+
+#######################################################################
+# ProfilerTimer class
+
+class ProfilerTimer:
+    # context manager for Profiler, adds the elapsed time to a dictionary
+
+    __slots__ = ('timings', 'name', 'count', 'start')
+
+
+    def __init__(self, timings, name, count):
+        self.timings = timings
+        self.name = name
+        self.count = count
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        if (self.count):
+            timing = self.timings.get(self.name)
+            if (timing is None):
+                self.timings[self.name] = [1, elapsed]
+            else:
+                timing[0] += 1
+                timing[1] += elapsed
+        else:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+# end ProfilerTimer class
+#######################################################################
+
+
+
+#######################################################################
+# EntryRecord class
+
+class EntryRecord:
+    # a blog posting, with the columns of the entries table which are used
+    # for the migration
+    # the body columns are only loaded when the posting is converted,
+    # until then they are None
+
+    __slots__ = ('id', 'title', 'timestamp', 'authorid', 'isdraft', 'last_modified', 'body', 'extended')
+
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.title = row['title']
+        self.timestamp = row['timestamp']
+        self.authorid = row['authorid']
+        self.isdraft = row['isdraft']
+        self.last_modified = row['last_modified']
+        self.body = None
+        self.extended = None
+
+
+# end EntryRecord class
+#######################################################################
+
+
+
+#######################################################################
+# PermalinkRecord class
 
+class PermalinkRecord:
+    # the permalink of a blog posting
 
-    def permalinks(self):
-        return self.connection.permalinks()
+    __slots__ = ('entry_id', 'permalink')
 
 
-    def entries(self):
-        return self.connection.entries()
+    def __init__(self, entry_id, permalink):
+        self.entry_id = entry_id
+        self.permalink = permalink
 
 
-    def number_entries_by_author(self, authorid):
-        return self.connection.number_entries_by_author(authorid)
+# end PermalinkRecord class
+#######################################################################
+
 
 
-    def number_entries_by_category(self, categoryid):
-        return self.connection.number_entries_by_category(categoryid)
+#######################################################################
+# TaxonomyLinks class
 
+class TaxonomyLinks:
+    # the categories and tags of a blog posting
+    # tuples, the tag names are shared between the postings
 
-    def number_entries_by_tag(self, tag):
-        return self.connection.number_entries_by_tag(tag)
+    __slots__ = ('categories', 'tags')
 
 
-    def s9y_config_entry(self, entry):
-        return self.connection.s9y_config_entry(entry)
+    def __init__(self):
+        self.categories = ()
+        self.tags = ()
 
 
-# end Database class
+# end TaxonomyLinks class
 #######################################################################
 
 
 
-
 #######################################################################
 # Migration class
 
 class Migration:
+    # precompiled patterns for fixing the Markdown output, see _fix_markdown()
+    blank_lines_re = re.compile(r'\n\s*\n')
+    image_re = re.compile(r'!\[(.*?)\]\((.*?)\)')
+    # image comment in the path: /path/to/picture.jpg "This is the comment"
+    image_title_re = re.compile(r'^(.*?\.[a-zA-Z0-9]+) "(.*)"$')
+    # <strike> is replaced, <u> is only detected
+    unsupported_html_re = re.compile(r'<(/?)strike>|<u>')
 
-    def __init__(self, config, db):
+
+    def __init__(self, config, db, profiler = None):
+        import_conversion_modules()
         self.config = config
         self.db = db
+        if (profiler is None):
+            profiler = Profiler(config)
+        self.profiler = profiler
 
         self.authors_by_id = {}
         self.authors_by_username = {}
         self.categories_by_id = {}
         self.categories_by_name = {}
         self.categories_by_id_new = {}
-        self.entry_categories_by_category = {}
-        self.entry_categories_by_entry = {}
-        self.tags_by_id = {}
-        self.tags_by_name = {}
-        self.tags_by_id_new = {}
+        # categories and tags of every posting
+        self.taxonomy_links_by_entry = {}
         self.permalinks_by_id = {}
         self.seen_new_urls = {}
         self.parsed_hugo_config = {}
         self.use_categories = False
         self.use_tags = False
         self.use_authors = False
-        self.redirect_links_seen = {}
+        self.redirects = RedirectWriter(config)
+        self.redirect_links_seen = self.redirects.seen
+        self.archetype = HugoArchetype(config)
+        if (self.config.arguments.conversion_cache):
+            self.conversion_cache = ConversionCache(self.state_path('conversion-cache.sqlite'), self.config.arguments.conversion_cache_size * 1024 * 1024)
+        else:
+            self.conversion_cache = None
+        self.html_converter = HtmlConverter(config, self.profiler, self.conversion_cache)
+
+        self.s9y_config = S9yConfig(db)
+        # number of entries per page
+        self.fetchlimit = self.s9y_config.get_int('fetchLimit', minimum = 1)
 
         self.calculate_tz_offset()
         self._get_hugo_config()
 
+        if (self.config.arguments.imagedir != ""):
+            self.images = ImageIndex(self.config.arguments.imagedir, self.config.arguments.image_index)
+        else:
+            # images are resolved relative to the current directory
+            self.images = None
+        # image targets which are known to exist
+        self.existing_images = set()
+        self.image_placer = ImagePlacer(self.config.arguments.image_link_mode, self.state_path('images'))
+        if (self.config.arguments.incremental):
+            self.state = MigrationState(self.state_path('state.json'))
+        else:
+            self.state = None
+
         if (self.config.arguments.httpsexitlist != ""):
             with open(self.config.arguments.httpsexitlist, 'r') as file:
                 self.httpsexitreplace = file.readlines()
@@ -745,123 +4238,88 @@ class Migration:
 
         # $serendipity[‘useServerOffset’]: Boolean whether the timezone of the server and the authors differs
         # $serendipity[‘serverOffsetHours’]: How many hours timezone difference are between server and authors
-        q1 = "SELECT value FROM {p}_config where authorid = 0 and name = 'useServerOffset'".format(p = self.db.connection.dbprefix)
-        r1 = self.db.execute_query(q1, [])
-        if (r1[0]['value'] == 'true'):
-            self.useServerOffset = True
-        elif (r1[0]['value'] == 'false'):
-            self.useServerOffset = False
-        else:
-            self.useServerOffset = False
-
-        q2 = "SELECT value FROM {p}_config where authorid = 0 and name = 'serverOffsetHours'".format(p = self.db.connection.dbprefix)
-        r2 = self.db.execute_query(q2, [])
-        self.useServerOffset = r2[0]['value']
+        self.useServerOffset = self.s9y_config.get_bool('useServerOffset', default = False)
+        self.serverOffsetHours = self.s9y_config.get_int('serverOffsetHours', default = 0)
 
 
     # this emulates parts of the serendipity_makeFilename() function from S9Y
     # https://github.com/s9y/Serendipity/blob/master/include/functions_permalinks.inc.php
+    # S9y replaces the characters in several passes, but no pass changes the
+    # output of a previous pass, therefore all replacements are combined
+    # into a single translation table
+    makeFilename_table = str.maketrans({
+        # emoji flag letters
+        '🇦': 'A',
+        '🇧': 'B',
+        '🇨': 'C',
+        '🇩': 'D',
+        '🇪': 'E',
+        '🇫': 'F',
+        '🇬': 'G',
+        '🇭': 'H',
+        '🇮': 'I',
+        '🇯': 'J',
+        '🇰': 'K',
+        '🇱': 'L',
+        '🇲': 'M',
+        '🇳': 'N',
+        '🇴': 'O',
+        '🇵': 'P',
+        '🇶': 'Q',
+        '🇷': 'R',
+        '🇸': 'S',
+        '🇹': 'T',
+        '🇺': 'U',
+        '🇻': 'V',
+        '🇼': 'W',
+        '🇽': 'X',
+        '🇾': 'Y',
+        '🇿': 'Z',
+        ' ': '-',
+        '%': '%25',
+        '&': '%25',
+        'Ä': 'AE',
+        'ä': 'ae',
+        'Ö': 'OE',
+        'ö': 'oe',
+        'Ü': 'UE',
+        'ü': 'ue',
+        'ß': 'ss',
+        'é': 'e',
+        'è': 'e',
+        'ê': 'e',
+        'í': 'i',
+        'ì': 'i',
+        'î': 'i',
+        'á': 'a',
+        'à': 'a',
+        'â': 'a',
+        'å': 'a',
+        'ó': 'o',
+        'ò': 'o',
+        'ô': 'o',
+        'õ': 'o',
+        'ú': 'u',
+        'ù': 'u',
+        'û': 'u',
+        'ç': 'c',
+        'Ç': 'C',
+        'ñ': 'n',
+        'ý': 'y',
+        '/': '',
+        # that's buried somewhere in serendipity_makeFilename() in S9y
+        "'": ''})
+
+
     def _serendipity_makeFilename(self, string):
-        replacements = {'🇦': 'A',
-                        '🇧': 'B',
-                        '🇨': 'C',
-                        '🇩': 'D',
-                        '🇪': 'E',
-                        '🇫': 'F',
-                        '🇬': 'G',
-                        '🇭': 'H',
-                        '🇮': 'I',
-                        '🇯': 'J',
-                        '🇰': 'K',
-                        '🇱': 'L',
-                        '🇲': 'M',
-                        '🇳': 'N',
-                        '🇴': 'O',
-                        '🇵': 'P',
-                        '🇶': 'Q',
-                        '🇷': 'R',
-                        '🇸': 'S',
-                        '🇹': 'T',
-                        '🇺': 'U',
-                        '🇻': 'V',
-                        '🇼': 'W',
-                        '🇽': 'X',
-                        '🇾': 'Y',
-                        '🇿': 'Z'}
-        replaced = [replacements.get(char, char) for char in str(string)]
-        string = ''.join(replaced)
-
-        replacements = {' ': '-',
-                        '%': '%25',
-                        'Ä': 'AE',
-                        'ä': 'ae',
-                        'Ö': 'OE',
-                        'ö': 'oe',
-                        'Ü': 'UE',
-                        'ü': 'ue',
-                        'ß': 'ss',
-                        'é': 'e',
-                        'è': 'e',
-                        'ê': 'e',
-                        'í': 'i',
-                        'ì': 'i',
-                        'î': 'i',
-                        'á': 'a',
-                        'à': 'a',
-                        'â': 'a',
-                        'å': 'a',
-                        'ó': 'o',
-                        'ò': 'o',
-                        'ô': 'o',
-                        'õ': 'o',
-                        'ú': 'u',
-                        'ù': 'u',
-                        'û': 'u',
-                        'ç': 'c',
-                        'Ç': 'C',
-                        'ñ': 'n',
-                        'ý': 'y'}
-        replaced = [replacements.get(char, char) for char in string]
-        string = ''.join(replaced)
-
-        replacements = {' ': '_',
-                        '&': '%25',
-                        'Ä': 'AE',
-                        'ä': 'ae',
-                        'Ö': 'OE',
-                        'ö': 'oe',
-                        'Ü': 'UE',
-                        'ü': 'ue',
-                        'ß': 'ss',
-                        'é': 'e',
-                        'è': 'e',
-                        'ê': 'e',
-                        'í': 'i',
-                        'ì': 'i',
-                        'î': 'i',
-                        'á': 'a',
-                        'à': 'a',
-                        'â': 'a',
-                        'å': 'a',
-                        'ó': 'o',
-                        'ò': 'o',
-                        'ô': 'o',
-                        'õ': 'o',
-                        'ú': 'u',
-                        'ù': 'u',
-                        'û': 'u',
-                        'ç': 'c',
-                        'Ç': 'C',
-                        'ñ': 'n',
-                        'ý': 'y',
-                        '/': ''}
-        replaced = [replacements.get(char, char) for char in string]
-        string = ''.join(replaced)
+        return self._makeFilename(str(string))
 
-        # that's buried somewhere in serendipity_makeFilename() in S9y
-        string = string.replace("'", "")
 
-        return string
+    # the same names are used for the main URL, the feed and every listing page
+    @staticmethod
+    @functools.lru_cache(maxsize = 8192)
+    def _makeFilename(string):
+        return string.translate(Migration.makeFilename_table)
 
 
     def hugo_path(self, *names):
@@ -871,6 +4329,19 @@ class Migration:
         return path
         
 
+    # state_path()
+    #
+    # path in the directory where the migration keeps its own files
+    #
+    # parameter:
+    #  - self
+    #  - path components
+    # return:
+    #  - path
+    def state_path(self, *names):
+        return self.hugo_path('.s9y-to-hugo', *names)
+
+
     def ensure_directory_exists(self, name):
         logging.debug("Ensure directory exists: {d}".format(d = name))
         os.makedirs(name, exist_ok = True)
@@ -887,11 +4358,8 @@ class Migration:
         self.ensure_directory_exists(authorsdir)
         authors = self.db.authors()
 
-        # number of entries per page
-        fetchlimit = int(self.db.s9y_config_entry('fetchLimit'))
-        if (fetchlimit < 1):
-            logging.error("fetchLimit in S9y is invalid!")
-            sys.exit(1)
+        # number of entries for every author
+        entries_by_author = self.db.count_entries_by_author()
 
         #print(authors)
         for a in authors:
@@ -917,24 +4385,27 @@ class Migration:
                                                           name = author_name_new)
 
             if (self.use_authors):
-                self._write_rewrite_file(author_url_old, author_url_new, '')
+                self._write_rewrite_file(author_url_old, author_url_new, '', family_base = True)
             else:
                 # author taxonomy is not used, but the old URLs exist
                 # redirect this to the main page
-                self._write_rewrite_file(author_url_old, self.config.arguments.webprefix, '')
+                self._write_rewrite_file(author_url_old, self.config.arguments.webprefix, '', family_base = True)
 
             # S9y creates listing pages for all author postings in the format:
             # /authors/<author>/P<number>.html
             # need to know how many of such pages exist
-            number_entries = self.db.number_entries_by_author(a['authorid'])
-            number_pages = int(number_entries / fetchlimit) + 1
+            number_entries = entries_by_author.get(a['authorid'], 0)
+            number_pages = int(number_entries / self.fetchlimit) + 1
+            # all listing pages of all authors are one family for --compact-redirects
+            family = ("{owp}authors/".format(owp = self.config.arguments.oldwebprefix),
+                      r'[^/]+/P\d+\.html', self.config.arguments.webprefix)
             for n in range(1, number_pages + 1):
                 author_url_old = "{owp}authors/{id}-{name}/P{n}.html".format(owp = self.config.arguments.oldwebprefix,
                                                                              id = a['authorid'],
                                                                              name = self._serendipity_makeFilename(a['realname']),
                                                                              n = n)
                 # redirect everything to the main page
-                self._write_rewrite_file(author_url_old, self.config.arguments.webprefix, '')
+                self._write_rewrite_file(author_url_old, self.config.arguments.webprefix, '', family = family)
 
 
     def _sanitize_url_string(self, string):
@@ -948,11 +4419,8 @@ class Migration:
         categories = self.db.categories()
         #print(categories)
 
-        # number of entries per page
-        fetchlimit = int(self.db.s9y_config_entry('fetchLimit'))
-        if (fetchlimit < 1):
-            logging.error("fetchLimit in S9y is invalid!")
-            sys.exit(1)
+        # number of entries for every category
+        entries_by_category = self.db.count_entries_by_category()
 
         for c in categories:
             if (c['category_name'] == '/'):
@@ -972,11 +4440,11 @@ class Migration:
                                                                name = category_name_new)
 
             if (self.use_categories):
-                self._write_rewrite_file(category_url_old, category_url_new, '')
+                self._write_rewrite_file(category_url_old, category_url_new, '', family_base = True)
             else:
                 # category taxonomy is not used, but the old URLs exist
                 # redirect this to the main page
-                self._write_rewrite_file(category_url_old, self.config.arguments.webprefix, '')
+                self._write_rewrite_file(category_url_old, self.config.arguments.webprefix, '', family_base = True)
 
             # generate redirects for the RSS feed
             # it's ".rss" in S9y, and "index.xml" in Hugo, plus different pathnames
@@ -1001,19 +4469,28 @@ class Migration:
             # S9y creates listing pages for all categories in the format:
             # /categories/<category>/P<number>.html
             # need to know how many of such pages exist
-            number_entries = self.db.number_entries_by_category(c['categoryid'])
-            number_pages = int(number_entries / fetchlimit) + 1
+            number_entries = entries_by_category.get(c['categoryid'], 0)
+            number_pages = int(number_entries / self.fetchlimit) + 1
+            # the listing pages are one family for --compact-redirects
+            if (self.use_categories):
+                family = ("{owp}categories/{id}-{name}".format(owp = self.config.arguments.oldwebprefix,
+                                                               id = c['categoryid'],
+                                                               name = category_name_old),
+                          r'/P\d+\.html', category_url_new)
+            else:
+                family = ("{owp}categories/".format(owp = self.config.arguments.oldwebprefix),
+                          r'[^/]+/P\d+\.html', self.config.arguments.webprefix)
             for n in range(1, number_pages + 1):
                 category_url_old = "{owp}categories/{id}-{name}/P{n}.html".format(owp = self.config.arguments.oldwebprefix,
                                                                                   id = c['categoryid'],
                                                                                   name = category_name_old,
                                                                                   n = n)
                 if (self.use_categories):
-                    self._write_rewrite_file(category_url_old, category_url_new, '')
+                    self._write_rewrite_file(category_url_old, category_url_new, '', family = family)
                 else:
                     # category taxonomy is not used, but the old URLs exist
                     # redirect this to the main page
-                    self._write_rewrite_file(category_url_old, self.config.arguments.webprefix, '')
+                    self._write_rewrite_file(category_url_old, self.config.arguments.webprefix, '', family = family)
 
 
     def entry_categories(self):
@@ -1021,13 +4498,14 @@ class Migration:
         entry_categories = self.db.entry_categories()
         #print(entry_categories)
         for e in entry_categories:
-            if (e['entryid'] not in self.entry_categories_by_entry):
-                self.entry_categories_by_entry[e['entryid']] = []
-            self.entry_categories_by_entry[e['entryid']].append(e['categoryid'])
+            links = self._taxonomy_links(e['entryid'])
+            links.categories += (e['categoryid'],)
 
-            if (e['categoryid'] not in self.entry_categories_by_category):
-                self.entry_categories_by_category[e['categoryid']] = []
-            self.entry_categories_by_category[e['categoryid']].append(e['entryid'])
+        # most postings share a few combinations of categories, keep every
+        # combination only once
+        combinations = {}
+        for links in self.taxonomy_links_by_entry.values():
+            links.categories = combinations.setdefault(links.categories, links.categories)
 
 
     def tags(self):
@@ -1035,21 +4513,19 @@ class Migration:
         tags = self.db.tags()
         #print(tags)
 
-        # number of entries per page
-        fetchlimit = int(self.db.s9y_config_entry('fetchLimit'))
-        if (fetchlimit < 1):
-            logging.error("fetchLimit in S9y is invalid!")
-            sys.exit(1)
+        # number of entries for every tag
+        entries_by_tag = self.db.count_entries_by_tag()
 
+        # the tags table has one row for every (entry, tag) pair
+        # every tag name is kept only once, in the order of the first use
+        tag_names = {}
         for t in tags:
-            if (t['entryid'] not in self.tags_by_id):
-                self.tags_by_id[t['entryid']] = []
-            self.tags_by_id[t['entryid']].append(t['tag'])
-            if (t['tag'] not in self.tags_by_name):
-                self.tags_by_name[t['tag']] = []
-            self.tags_by_name[t['tag']].append(t['entryid'])
-
-            tag_name = t['tag']
+            tag_name = tag_names.setdefault(t['tag'], t['tag'])
+            links = self._taxonomy_links(t['entryid'])
+            links.tags += (tag_name,)
+
+        # redirects are only needed once for every tag
+        for tag_name in tag_names:
             tag_name_old = self._serendipity_makeFilename(tag_name)
             tag_url_old = "{owp}plugin/tag/{name}".format(owp = self.config.arguments.oldwebprefix,
                                                           name = tag_name_old)
@@ -1059,40 +4535,61 @@ class Migration:
                                                           name = tag_name_new)
 
             if (self.use_tags):
-                self._write_rewrite_file(tag_url_old, tag_url_new, '')
+                self._write_rewrite_file(tag_url_old, tag_url_new, '', family_base = True)
             else:
                 # tag taxonomy is not used, but the old URLs exist
                 # redirect this to the main page
-                self._write_rewrite_file(tag_url_old, self.config.arguments.webprefix, '')
-
-            if (t['entryid'] not in self.tags_by_id_new):
-                self.tags_by_id_new[t['entryid']] = []
-            self.tags_by_id_new[t['entryid']].append(tag_name_new)
+                self._write_rewrite_file(tag_url_old, self.config.arguments.webprefix, '', family_base = True)
 
             # S9y creates listing pages for all tags in the format:
             # /plugin/tag/<tag>/P<number>.html
             # need to know how many of such pages exist
-            number_entries = self.db.number_entries_by_tag(t['tag'])
-            number_pages = int(number_entries / fetchlimit) + 1
+            number_entries = entries_by_tag.get(tag_name, 0)
+            number_pages = int(number_entries / self.fetchlimit) + 1
+            # the listing pages are one family for --compact-redirects
+            if (self.use_tags):
+                family = ("{owp}plugin/tag/{name}".format(owp = self.config.arguments.oldwebprefix,
+                                                          name = tag_name_old),
+                          r'/P\d+\.html', tag_url_new)
+            else:
+                family = ("{owp}plugin/tag/".format(owp = self.config.arguments.oldwebprefix),
+                          r'[^/]+/P\d+\.html', self.config.arguments.webprefix)
             for n in range(1, number_pages + 1):
                 tag_url_old = "{owp}plugin/tag/{name}/P{n}.html".format(owp = self.config.arguments.oldwebprefix,
                                                                         name = tag_name_old,
                                                                         n = n)
                 if (self.use_tags):
-                    self._write_rewrite_file(tag_url_old, tag_url_new, '')
+                    self._write_rewrite_file(tag_url_old, tag_url_new, '', family = family)
                 else:
                     # tag taxonomy is not used, but the old URLs exist
                     # redirect this to the main page
-                    self._write_rewrite_file(tag_url_old, self.config.arguments.webprefix, '')
+                    self._write_rewrite_file(tag_url_old, self.config.arguments.webprefix, '', family = family)
 
 
     def permalinks(self):
         logging.debug("Reading permalinks")
-        permalinks = self.db.permalinks()
+        permalinks = self.db.entry_permalinks()
         #print(permalinks)
         for p in permalinks:
-            if (p['type'] == 'entry'):
-                self.permalinks_by_id[p['entry_id']] = p
+            self.permalinks_by_id[p['entry_id']] = PermalinkRecord(p['entry_id'], p['permalink'])
+
+
+    # _taxonomy_links()
+    #
+    # categories and tags of a blog posting, the record is created on first use
+    #
+    # parameter:
+    #  - self
+    #  - S9y ID of the posting
+    # return:
+    #  - TaxonomyLinks
+    def _taxonomy_links(self, entry_id):
+        links = self.taxonomy_links_by_entry.get(entry_id)
+        if (links is None):
+            links = TaxonomyLinks()
+            self.taxonomy_links_by_entry[entry_id] = links
+
+        return links
 
 
 
@@ -1154,7 +4651,7 @@ class Migration:
             new_url = re.sub(r'^[0-9]+\-', '', new_url)
 
         if (self.config.arguments.add_date_to_url):
-            ts_time, ts_date = self._date_and_time_for_entry(entry['timestamp'])
+            ts_time, ts_date = self._date_and_time_for_entry(entry.timestamp)
             new_url = ts_date + '_' + new_url
 
         # urlize() in Hugo makes all URLs lowercase
@@ -1188,7 +4685,7 @@ class Migration:
         return new_url, new_file
 
 
-    def _write_rewrite_file(self, old_url, new_url, entry, keep_hashtag_in_new = False, quote_urls = True, extern_url_allowed = False, place_in_quotes = False):
+    def _write_rewrite_file(self, old_url, new_url, entry, keep_hashtag_in_new = False, quote_urls = True, extern_url_allowed = False, place_in_quotes = False, redirects = None, family = None, family_base = False):
         if (old_url[0:1] != '/'):
             logging.error("Old URL for redirect must be absolute!")
             logging.error("URL: {u}".format(u = old_url))
@@ -1199,186 +4696,210 @@ class Migration:
                 logging.error("URL: {u}".format(u = new_url))
                 sys.exit(1)
 
-        if (old_url in self.redirect_links_seen):
-            # seen this URL before, don't write another entry'
-            return
-
-        if (place_in_quotes):
-            quotes = '"'
-        else:
-            quotes = ''
-
-        if (self.config.arguments.rewritetype == "apache2"):
-            if (quote_urls):
-                # this is the default
-                old_entry = urllib.parse.quote(old_url)
-                new_entry = urllib.parse.quote(new_url)
-            else:
-                old_entry = old_url
-                new_entry = new_url
-            if (keep_hashtag_in_new):
-                # mainly used for archive links redirecting to the correct year
-                new_entry = new_entry.replace('%23', '#', 1)
-            with open(self.config.arguments.rewritefile, 'a') as f:
-                # all URLs are absolute, this allows placing the redirect
-                # file anywhere
-                f.write("Redirect 301 {q}{old}{q} {q}{new}{q}\n".format(old = old_entry,
-                                                                        new = new_entry,
-                                                                        q = quotes))
-                # some search engines might come around with '+' when there was a space
-                old_entry_plus = old_entry.replace('-', '+')
-                if (old_entry_plus != old_entry):
-                    f.write("Redirect 301 {q}{old}{q} {q}{new}{q}\n".format(old = old_entry_plus,
-                                                                            new = new_entry,
-                                                                            q = quotes))
-            logging.debug("Writing redirect: {old} -> {new}".format(old = old_entry,
-                                                                    new = new_entry))
-
-        if (self.config.arguments.rewritejson != ""):
-            with open(self.config.arguments.rewritejson, 'a') as f:
-                f.write("{{'orig': '{old}',\n 'replace': '{new}'}},\n".format(old = old_entry,
-                                                                               new = new_entry))
-
-        # store entry to avoid writing it again next time
-        self.redirect_links_seen[old_url] = new_url
+        if (redirects is None):
+            redirects = self.redirects
+        redirects.add(old_url, new_url,
+                      keep_hashtag_in_new = keep_hashtag_in_new,
+                      quote_urls = quote_urls,
+                      place_in_quotes = place_in_quotes,
+                      family = family,
+                      family_base = family_base)
 
 
     def _move_image(self, source, target):
-        if (os.path.exists(target)):
+        if (target in self.existing_images or os.path.exists(target)):
             logging.debug("Image already exists: {target}".format(target = target))
+            self.existing_images.add(target)
             return
         targetdir = os.path.dirname(target)
         self.ensure_directory_exists(targetdir)
         logging.debug("Move image: {source} -> {target}".format(source = source, target = target))
-        shutil.copyfile(source, target)
-
-
-    def _rewrite_images(self, body, link, new_link, new_file, new_full_file):
-        img = re.findall(r'\!\[(.*?)\]\((.*?)\)', body, re.MULTILINE)
-        #print(img)
-        for i in img:
-            img_comment = i[0]
-            img_path = i[1]
-            # can only work on local images, not something which is linked from other websites
-            # also only works on images with absolute path, however S9y should have
-            # added all images with absolute path anyway
-            if (img_path[0] == "/"):
-                # if the path starts with "/", the full local path can't be calculated
-                img_realpath = os.path.realpath(os.path.join(self.config.arguments.imagedir, img_path[1:]))
-                if (not os.path.exists(img_realpath)):
-                    if (type(self.config.arguments.ignore_picture_errors) is list and link in self.config.arguments.ignore_picture_errors):
-                        # picture errors are to be ignored
-                        # add a comment to the picture
-                        original_text = '![{comment}]({path})'.format(comment = img_comment, path = img_path)
-                        if (img_comment == ""):
-                            replace_text = '![PICTUREISMISSING]({path})'.format(path = img_path)
-                        else:
-                            replace_text = '![{comment} - PICTUREISMISSING]({path})'.format(comment = img_comment, path = img_path)
-                        body = body.replace(original_text, replace_text)
-                    else:
-                        # picture errors are a problem, raise it
-                        logging.error("Linked image doesn't exist: {img}".format(img = img_path))
-                        logging.error("Local image: {img}".format(img = img_realpath))
-                        sys.exit(1)
-                else:
-                    if (self.config.arguments.use_bundles):
-                        # Hugo bundles are being used, place all images in the bundle directory as resource
-                        new_image_filename = new_full_file.removesuffix('index.md') + os.path.basename(img_realpath)
-                        self._move_image(img_realpath, new_image_filename)
-                        original_text = '![{comment}]({path})'.format(comment = img_comment, path = img_path)
-                        replace_text = '![{comment}]({path})'.format(comment = img_comment, path = os.path.basename(img_realpath))
-                        body = body.replace(original_text, replace_text)
-                        self._write_rewrite_file(img_path, new_link + os.path.basename(img_realpath), '')
-                    else:
-                        # the image path has the $webprefix already included
-                        # needs to be rewritten for old and new webroot
-                        # the img_path is relative, need to complete it first
-                        # this might pose the problem that the old webprefix appears more than once
-                        target_filename = os.path.realpath(os.path.join(self.config.arguments.targetdir, 'static', img_path[1:]))
-                        target_filename = target_filename.replace(self.config.arguments.oldwebprefix, self.config.arguments.webprefix)
-                        self._move_image(img_realpath, target_filename)
-                        original_text = '![{comment}]({path})'.format(comment = img_comment, path = img_path)
-                        replace_text = '![{comment}]({path})'.format(comment = img_comment, path = img_path.replace(self.config.arguments.oldwebprefix, self.config.arguments.webprefix))
-                        body = body.replace(original_text, replace_text)
+        self.image_placer.place(source, target)
+        self.existing_images.add(target)
+
 
-        return body
+    # _resolve_image()
+    #
+    # find the local file for an image in a posting
+    #
+    # parameter:
+    #  - self
+    #  - image path from the posting (absolute)
+    # return:
+    #  - real path of the image, or None if the image does not exist
+    def _resolve_image(self, img_path):
+        if (self.images is not None):
+            return self.images.resolve(img_path[1:])
 
+        img_realpath = os.path.realpath(os.path.join(self.config.arguments.imagedir, img_path[1:]))
+        if (not os.path.exists(img_realpath)):
+            return None
 
-    # some of the comments look like this:
-    # ![](/path/to/picture.jpg "This is the comment")
-    def _fix_image_comments(self, body, link):
-        img = re.findall(r'\!\[(.*?)\]\((.*?)\)', body, re.MULTILINE)
-        #print(img)
-        for i in img:
-            img_comment = i[0]
-            img_path = i[1]
-            # can only work on local images, not something which is linked from other websites
-            if (img_path[0] == "/"):
-                img_parts = re.search(r'^(.*?\.[a-zA-Z0-9]+) "(.*)"$', img_path)
-                if (img_parts):
-                    # now there's a chance that the original comment is not empty
-                    if (img_comment == ""):
-                        new_comment = "TEXTREPLACED: {text}".format(text = img_parts.group(2))
-                    else:
-                        new_comment = "{oldtext} - TEXTREPLACED: {text}".format(oldtext = img_comment, text = img_parts.group(2))
-                    original_text = '![{comment}]({path})'.format(comment = img_comment, path = img_path)
-                    replace_text = '![{comment}]({path})'.format(comment = new_comment, path = img_parts.group(1))
-                    #print(original_text)
-                    #print(replace_text)
-                    body = body.replace(original_text, replace_text)
+        return img_realpath
 
-        return body
 
+    # _rewrite_image()
+    #
+    # rewrite a single image in the Markdown output, and place the image file
+    #
+    # parameter:
+    #  - self
+    #  - image comment (alt text)
+    #  - image path
+    #  - old link of the posting
+    #  - new link of the posting
+    #  - full filename of the new posting
+    #  - RedirectWriter for the image redirects (optional)
+    # return:
+    #  - image comment
+    #  - image path
+    def _rewrite_image(self, img_comment, img_path, link, new_link, new_full_file, redirects = None):
+        # can only work on local images, not something which is linked from other websites
+        # also only works on images with absolute path, however S9y should have
+        # added all images with absolute path anyway
+        if (img_path[0:1] != "/"):
+            return img_comment, img_path
+
+        # if the path starts with "/", the full local path can't be calculated
+        img_realpath = self._resolve_image(img_path)
+        if (img_realpath is None):
+            if (type(self.config.arguments.ignore_picture_errors) is list and link in self.config.arguments.ignore_picture_errors):
+                # picture errors are to be ignored
+                # add a comment to the picture
+                if (img_comment == ""):
+                    return 'PICTUREISMISSING', img_path
+                return '{comment} - PICTUREISMISSING'.format(comment = img_comment), img_path
+
+            # picture errors are a problem, raise it
+            logging.error("Linked image doesn't exist: {img}".format(img = img_path))
+            logging.error("Local image: {img}".format(img = os.path.join(self.config.arguments.imagedir, img_path[1:])))
+            sys.exit(1)
 
-    def _fix_unsupported_html(self, body, link, fm):
-        unsupported = False
+        if (self.config.arguments.use_bundles):
+            # Hugo bundles are being used, place all images in the bundle directory as resource
+            new_image_filename = new_full_file.removesuffix('index.md') + os.path.basename(img_realpath)
+            self._move_image(img_realpath, new_image_filename)
+            self._write_rewrite_file(img_path, new_link + os.path.basename(img_realpath), '', redirects = redirects)
+            return img_comment, os.path.basename(img_realpath)
 
-        # <strike> </strike>
-        body = body.replace('<strike>', '<del>')
-        body = body.replace('</strike>', '</del>')
+        # the image path has the $webprefix already included
+        # needs to be rewritten for old and new webroot
+        # the img_path is relative, need to complete it first
+        # this might pose the problem that the old webprefix appears more than once
+        target_filename = os.path.realpath(os.path.join(self.config.arguments.targetdir, 'static', img_path[1:]))
+        target_filename = target_filename.replace(self.config.arguments.oldwebprefix, self.config.arguments.webprefix)
+        self._move_image(img_realpath, target_filename)
 
-        # <s> </s> is recognized by the Markdown parser
+        return img_comment, img_path.replace(self.config.arguments.oldwebprefix, self.config.arguments.webprefix)
 
-        # <u> </u> was "underline" in HTML4, and has a different meaning in HTML5
-        #  it is ignored by the parser
-        if ('<u>' in body):
-            unsupported = True
 
-        return body, unsupported
+    # _fix_image_comment()
+    #
+    # some of the image paths have the comment in there:
+    # ![](/path/to/picture.jpg "This is the comment")
+    # the comment is moved into the alt text
+    #
+    # parameter:
+    #  - self
+    #  - image comment (alt text)
+    #  - image path
+    # return:
+    #  - image comment
+    #  - image path
+    def _fix_image_comment(self, img_comment, img_path):
+        # can only work on local images, not something which is linked from other websites
+        if (img_path[0:1] != "/"):
+            return img_comment, img_path
+
+        img_parts = self.image_title_re.search(img_path)
+        if (not img_parts):
+            return img_comment, img_path
+
+        # now there's a chance that the original comment is not empty
+        if (img_comment == ""):
+            new_comment = "TEXTREPLACED: {text}".format(text = img_parts.group(2))
+        else:
+            new_comment = "{oldtext} - TEXTREPLACED: {text}".format(oldtext = img_comment, text = img_parts.group(2))
+
+        return new_comment, img_parts.group(1)
 
 
-    def _fix_quoted_html(self, fm):
-        fm_new = fm
-        fm_new = fm_new.replace('\\\\*', '*')
-        fm_new = fm_new.replace('\\*', '*')
+    def _fix_unsupported_html(self, body, link, fm):
+        unsupported = False
+
+        def replace_tag(m):
+            nonlocal unsupported
+            if (m.group(0) == '<u>'):
+                # <u> </u> was "underline" in HTML4, and has a different meaning in HTML5
+                #  it is ignored by the parser
+                unsupported = True
+                return m.group(0)
+            # <strike> </strike>
+            return '<{slash}del>'.format(slash = m.group(1))
 
-        changed = False
-        if (fm_new != fm):
-            changed = True
+        # <s> </s> is recognized by the Markdown parser
+        body = self.unsupported_html_re.sub(replace_tag, body)
 
-        return fm_new, changed
+        return body, unsupported
 
 
-    def _rewrite_html(self, body, link, fm, new_link, new_file, new_full_file):
+    # _fix_markdown()
+    #
+    # rewrite the Markdown output of markdownify:
+    #  - collapse blank lines
+    #  - move image comments into the alt text, rewrite the image paths and place the images
+    #  - remove unnecessary backslashes before stars
+    #  - escape "{{" and "}}", Hugo doesn't like when these tags are not escaped
+    #
+    # every image is rewritten in place, in a single pass over the Markdown
+    #
+    # parameter:
+    #  - self
+    #  - Markdown
+    #  - old link of the posting
+    #  - new link of the posting
+    #  - full filename of the new posting
+    #  - RedirectWriter for the image redirects (optional)
+    # return:
+    #  - Markdown
+    #  - flag if quotes were changed
+    def _fix_markdown(self, md, link, new_link, new_full_file, redirects = None):
+        def replace_image(m):
+            img_comment, img_path = self._fix_image_comment(m.group(1), m.group(2))
+            img_comment, img_path = self._rewrite_image(img_comment, img_path, link, new_link, new_full_file, redirects)
+            return '![{comment}]({path})'.format(comment = img_comment, path = img_path)
+
+        md = self.blank_lines_re.sub('\n\n', md)
+        if ('![' in md):
+            md = self.image_re.sub(replace_image, md)
+
+        # the checks are much faster than replacing, most postings have neither
+        quotes_changed = False
+        if ('\\*' in md):
+            md = md.replace('\\\\*', '*')
+            md = md.replace('\\*', '*')
+            quotes_changed = True
+        if ('{{' in md):
+            md = md.replace('{{', '\\{\\{')
+        if ('}}' in md):
+            md = md.replace('}}', '\\}\\}')
+
+        return md, quotes_changed
+
+
+    def _rewrite_html(self, body, link, fm, new_link, new_file, new_full_file, redirects = None):
         body, unsupported = self._fix_unsupported_html(body, link, fm)
         parsed_body = body
 
-        md = markdownify.markdownify(body)
+        md, pretty_body = self.html_converter.convert(body, self.config.arguments.write_html)
         #md = markdown.replace('```\n\n', '```\n')
         #md = re.sub(r"```[\n]+", "```", md, flags = re.MULTILINE)
-        md = re.sub(r'\n\s*\n', '\n\n', md)
-        #print(md)
-        md = self._fix_image_comments(md, link)
-        md = self._rewrite_images(md, link, new_link, new_file, new_full_file)
-        md, quotes_changed = self._fix_quoted_html(md)
-
-        md = "{md}\n".format(md = md.strip())
+        # fixing the Markdown includes placing the images
+        with self.profiler.stage('fix markdown'):
+            md, quotes_changed = self._fix_markdown(md, link, new_link, new_full_file, redirects)
+            md = "{md}\n".format(md = md.strip())
 
-        # Hugo doesn't like when these tags are not escaped
-        md = md.replace('{{', '\\{\\{')
-        md = md.replace('}}', '\\}\\}')
-
-        return md, parsed_body, unsupported, quotes_changed
+        return md, parsed_body, pretty_body, unsupported, quotes_changed
 
 
     def _date_and_time_for_entry(self, ts):
@@ -1398,31 +4919,33 @@ class Migration:
         tz_match = re.match(r'^([\+\-])(\d\d)(\d\d)$', orig_tz)
         if (not tz_match):
             logging.error("Error extracting TZ information from timestamp!")
-            logging.error("TS: {ts}".format(ts = entry['timestamp']))
-            logging.error("TZ: {tz}".format(tz = tz))
+            logging.error("TS: {ts}".format(ts = ts))
+            logging.error("TZ: {tz}".format(tz = orig_tz))
+            sys.exit(1)
         ts += "{prefix}{hours}:{minutes}".format(prefix = tz_match.group(1), hours = tz_match.group(2), minutes = tz_match.group(3))
 
         return ts, td
 
 
     def _generate_frontmatter(self, fm, id, entry, body):
-        ts_time, ts_date = self._date_and_time_for_entry(entry['timestamp'])
-        fm['title'] = entry['title']
+        ts_time, ts_date = self._date_and_time_for_entry(entry.timestamp)
+        fm['title'] = entry.title
         # S9y only knows one author, Hugo allows multiple authors
-        fm['authors'] = self.authors_by_id[entry['authorid']]['username']
-        if (entry['isdraft'] is False):
+        fm['authors'] = self.authors_by_id[entry.authorid]['username']
+        if (entry.isdraft is False):
             fm['draft'] = False
         else:
             fm['draft'] = True
         fm['date'] = ts_time
         fm['s9yID'] = id
-        fm['s9yTS'] = entry['timestamp']
+        fm['s9yTS'] = entry.timestamp
+        links = self.taxonomy_links_by_entry.get(id)
 
         # handle categories
         if (fm.get('categories') == None):
             fm['categories'] = []
-        if (id in self.entry_categories_by_entry):
-            for e in self.entry_categories_by_entry[id]:
+        if (links is not None):
+            for e in links.categories:
                 # if no category is assigned, S9y uses '0'
                 if (e == 0):
                     continue
@@ -1443,8 +4966,8 @@ class Migration:
         # handle tags
         if (fm.get('tags') == None):
             fm['tags'] = []
-        if (id in self.tags_by_id):
-            for t in self.tags_by_id[id]:
+        if (links is not None):
+            for t in links.tags:
                 # if the file is updated (instead of newly generated), the tags
                 # might already be in there
                 t_name = self._sanitize_url_string(t)
@@ -1461,75 +4984,21 @@ class Migration:
 
 
     # this extracts the Hugo configuration for the targetdir
-    # and stores it in the class
+    # the configuration files are read directly, "hugo config" is only used if necessary
     def _get_hugo_config(self):
-        logging.debug("Extracting Hugo configuration")
-        p = subprocess.Popen([self.config.arguments.hugo_bin, 'config'],
-                             stdout = subprocess.PIPE,
-                             stderr = subprocess.PIPE,
-                             universal_newlines = True,
-                             cwd = self.config.arguments.targetdir)
-        stdout, stderr = p.communicate()
-
-        if (p.returncode != 0):
-            logging.error("Something went wrong extracting the Hugo configuration")
-            logging.error("RC: {rc}".format(rc = p.returncode))
-            logging.error("stdout:\n{s}".format(s = stdout))
-            logging.error("stderr:\n{s}".format(s = stderr))
-            sys.exit(1)
-
-        for l in stdout.splitlines():
-            k = l.split(' = ', 1)[0]
-            v = l.split(' = ', 1)[1]
-            if (v.startswith('map[') and v.endswith(']')):
-                # Note: this only extracts the first level of maps
-                #       fields like 'params' have multiple levels
-                self.parsed_hugo_config[k] = v[4:-1]
-            else:
-                self.parsed_hugo_config[k] = v.strip('"')
+        hugo_config = HugoConfig(self.config, self.state_path('hugo-config.json'))
+        self.parsed_hugo_config = hugo_config.load()
 
-        taxonomies = self.parsed_hugo_config['taxonomies']
+        taxonomies = self.parsed_hugo_config.get('taxonomies', {})
         # set taxonomy flags which are relevant for migration
-        if ('category:categories' in taxonomies):
+        if (taxonomies.get('category') == 'categories'):
             self.use_categories = True
-        if ('tag:tags' in taxonomies):
+        if (taxonomies.get('tag') == 'tags'):
             self.use_tags = True
-        if ('author:authors' in taxonomies):
+        if (taxonomies.get('author') == 'authors'):
             self.use_authors = True
 
 
-    def _generate_hugo_file(self, new_file, new_full_file):
-        logging.debug("Creating Hugo posting: {f}".format(f = new_file))
-        p = subprocess.Popen([self.config.arguments.hugo_bin, 'new', new_file],
-                             stdout = subprocess.PIPE,
-                             stderr = subprocess.PIPE,
-                             universal_newlines = True,
-                             cwd = self.config.arguments.targetdir)
-        stdout, stderr = p.communicate()
-
-        if (p.returncode != 0):
-            logging.error("Something went wrong creating the Hugo file")
-            logging.error("RC: {rc}".format(rc = p.returncode))
-            logging.error("stdout:\n{s}".format(s = stdout))
-            logging.error("stderr:\n{s}".format(s = stderr))
-            sys.exit(1)
-
-        # verify that the created name is indeed what we
-        # expect (second function parameter)
-        file_match = re.match(r'^Content "(.+)" created$', stdout)
-        if (not file_match):
-            logging.error("Can't find expected string in stdout!")
-            logging.error("stdout:\n{s}".format(s = stdout))
-            logging.error("stderr:\n{s}".format(s = stderr))
-            sys.exit(1)
-
-        if (file_match.group(1) != new_full_file):
-            logging.error("Expected file does not match created file!")
-            logging.error("Expected: {f}".format(f = new_full_file))
-            logging.error(" Created: {f}".format(f = file_match.group(1)))
-            sys.exit(1)
-
-
     # main function, going over all blog postings
     def entries(self):
         found_replacements = False
@@ -1538,82 +5007,58 @@ class Migration:
         number_marked = 0
         unsupported_tags = 0
         quotes_changed = 0
+        number_unchanged = 0
 
         logging.debug("Reading entries")
+        # this is a stream, the blog entries are read in batches, without
+        # the body columns
         entries = self.db.entries()
-        #print(entries)
-        logging.debug("Have {c} blog entries".format(c = len(entries)))
-        for e in entries:
-            #print(e)
-            link = self.permalinks_by_id[e['id']]['permalink']
-            if (type(self.config.arguments.ignore_post) is list and link in self.config.arguments.ignore_post):
-                logging.info("Ignoring post: {link}".format(link = link))
-                number_ignored += 1
-                continue
-            # DEBUG: uncomment and add a link from the S9y blog
-            #if (link != ""):
-            #    continue
-            logging.debug("migrating posting: {link}".format(link = link))
-            # also handles Hugo Bundles
-            new_link, new_file = self._rewrite_url(link, e)
-            new_full_file = self.hugo_path('content', new_file)
-            if (not self.file_exists(new_full_file)):
-                # use the Hugo binary to create this file
-                # this has the advantage that the full template can be used
-                # and we later fill in the details
-                # otherwise we have to fill in the file from scratch, and this
-                # might be plenty of migration work
-                self._generate_hugo_file(new_file, new_full_file)
-            old_url = link
-            if (old_url[0:1] != '/'):
-                # complete the old URL with webroot
-                # required to write a full path into the redirect file
-                old_url = self.config.arguments.oldwebprefix + old_url
-            self._write_rewrite_file(old_url, new_link, e)
-
-            # get the Frontmatter from the content file
-            fm = frontmatter.load(new_full_file)
 
-            body = e['body'] + "\n\n" + e['extended']
-            #print(body)
-            original_body = body
-            body, parsed_body, unsupported, quotes_changed_here = self._rewrite_html(body, link, fm, new_link, new_file, new_full_file)
-            if (unsupported):
+        # planning runs serially, it assigns the new URLs and finds duplicates
+        def plan_entries():
+            nonlocal number_ignored
+            for row in entries:
+                e = EntryRecord(row)
+                with self.profiler.stage('plan'):
+                    task = self._plan_entry(e)
+                if (task is None):
+                    number_ignored += 1
+                    continue
+                yield task
+
+        # postings which are deleted while the migration runs have no bodies
+        def tasks_with_bodies():
+            nonlocal number_ignored
+            for task in self._tasks_with_bodies(plan_entries()):
+                if (task is None):
+                    number_ignored += 1
+                    continue
+                yield task
+
+        # the conversion runs serially or in worker processes, the results
+        # come back in the original order
+        for task, result in self._convert_entries(tasks_with_bodies()):
+            with self.profiler.stage('merge results'):
+                if (self.state is not None):
+                    if (task['unchanged'] is not None):
+                        number_unchanged += 1
+                    self.state.record(task['entry'].id, task['fingerprint'], result)
+                self._write_rewrite_file(task['old_url'], task['new_link'], task['entry'])
+                self.redirects.merge(result['redirects'])
+                self.image_placer.add_stats(result['images'])
+                if ('conversion_cache' in result):
+                    self.conversion_cache.add_stats(result['conversion_cache'])
+            if ('profile' in result):
+                self.profiler.add_stages(result['profile'])
+                self.profiler.add_post(result['seconds'], task['entry'].id, task['link'], result['body_size'])
+
+            if (result['unsupported']):
                 unsupported_tags += 1
-            if (quotes_changed_here):
+            if (result['quotes_changed']):
                 quotes_changed += 1
-            if (self.config.arguments.write_html):
-                html_filename = new_full_file[:-3] + ".html"
-                soup = BeautifulSoup(parsed_body, 'html.parser')
-                with open(html_filename, 'w') as html_fh:
-                    html_fh.write(original_body)
-                    html_fh.write("\n\n\n\n\n\n")
-                    html_fh.write(parsed_body)
-                    html_fh.write("\n\n\n\n\n\n")
-                    html_fh.write(soup.prettify())
-
-            # FIXME: comments
-
-            fm = self._generate_frontmatter(fm, e['id'], e, body)
-
-            if ('TEXTREPLACED' in body or 'PICTUREISMISSING' in body):
+            if (result['marked']):
                 found_replacements = True
                 number_marked += 1
-                if ('TEXTREPLACED' in body):
-                    fm['TextReplaced'] = True
-                if ('PICTUREISMISSING' in body):
-                    fm['PictureMissing'] = True
-            if (unsupported):
-                fm['UnsupportedTags'] = True
-            if (quotes_changed_here):
-                fm['QuotesChanged'] = True
-
-            fm['OriginalLink'] = link
-
-            fh = io.open(new_full_file, 'w', encoding = 'utf8')
-            fh.write(frontmatter.dumps(fm))
-            fh.write("\n")
-            fh.close()
 
             number_migrated += 1
 
@@ -1626,29 +5071,327 @@ class Migration:
             if (not self.config.arguments.write_html):
                 logging.info("And consider using --write-html for writing the S9y source to files")
 
+        if (self.state is not None):
+            self.state.save()
+
         logging.info("{n} postings migrated".format(n = number_migrated))
+        if (self.state is not None):
+            logging.info("{n} postings unchanged since the last run".format(n = number_unchanged))
         logging.info("{n} postings ignored".format(n = number_ignored))
         logging.info("{n} postings with unsupported tags".format(n = unsupported_tags))
         logging.info("{n} postings with changed quotes".format(n = quotes_changed))
         logging.info("{n} postings need additional work".format(n = number_marked))
+        image_stats = self.image_placer.stats
+        if (image_stats['placed'] > 0):
+            logging.info("{n} images placed ({c} copied, {l} linked), {w:.1f} MB written, {s:.1f} MB saved".format(n = image_stats['placed'],
+                                                                                                                    c = image_stats['copied'],
+                                                                                                                    l = image_stats['linked'],
+                                                                                                                    w = image_stats['bytes_written'] / (1024 * 1024),
+                                                                                                                    s = (image_stats['bytes_placed'] - image_stats['bytes_written']) / (1024 * 1024)))
+        if (self.conversion_cache is not None):
+            removed, size = self.conversion_cache.close()
+            cache_stats = self.conversion_cache.stats
+            lookups = cache_stats['hits'] + cache_stats['misses']
+            logging.info("Conversion cache: {h} hits, {m} misses ({r:.1f}% hit rate), {w:.1f} MB written, {e} results removed, {s:.1f} MB in the cache".format(h = cache_stats['hits'],
+                                                                                                                                                             m = cache_stats['misses'],
+                                                                                                                                                             r = 100 * cache_stats['hits'] / lookups if (lookups > 0) else 0,
+                                                                                                                                                             w = cache_stats['bytes_stored'] / (1024 * 1024),
+                                                                                                                                                             e = removed,
+                                                                                                                                                             s = size / (1024 * 1024)))
+        logging.info("Peak memory usage: {m}".format(m = peak_memory_usage()))
+
+
+    # _tasks_with_bodies()
+    #
+    # add the body columns to a stream of planned blog postings
+    # the bodies are loaded by id, in batches, ignored postings are skipped
+    #
+    # parameter:
+    #  - self
+    #  - iterator over tasks from _plan_entry(), without body columns
+    # return:
+    #  - generator with tasks, including body columns, None for deleted postings
+    def _tasks_with_bodies(self, tasks):
+        batch = []
+        for task in tasks:
+            batch.append(task)
+            if (len(batch) >= self.config.arguments.db_itersize):
+                yield from self._load_bodies(batch)
+                batch = []
+        if (len(batch) > 0):
+            yield from self._load_bodies(batch)
+
+
+    def _load_bodies(self, batch):
+        bodies = {}
+        with self.profiler.stage('load bodies'):
+            for b in self.db.entry_bodies([task['entry'].id for task in batch]):
+                bodies[b['id']] = (b['body'], b['extended'])
+        for task in batch:
+            e = task['entry']
+            body = bodies.pop(e.id, None)
+            if (body is None):
+                # the blog can still be live, and the bodies are read with another query
+                logging.warning("Posting was deleted during the migration, skipping: {link}".format(link = task['link']))
+                yield None
+                continue
+            e.body, e.extended = body
+            if (self.state is not None):
+                # the fingerprint needs the bodies
+                with self.profiler.stage('plan'):
+                    self._check_unchanged(task)
+            yield task
 
 
-    def archive(self):
-        oldest_entry = False
+    # _plan_entry()
+    #
+    # assign the new URL and filename for a blog posting
+    #
+    # parameter:
+    #  - self
+    #  - entry
+    # return:
+    #  - task for _convert_entry(), or None if the posting is ignored
+    def _plan_entry(self, e):
+        #print(e)
+        link = self.permalinks_by_id[e.id].permalink
+        if (type(self.config.arguments.ignore_post) is list and link in self.config.arguments.ignore_post):
+            logging.info("Ignoring post: {link}".format(link = link))
+            return None
+        # DEBUG: uncomment and add a link from the S9y blog
+        #if (link != ""):
+        #    return None
+        logging.debug("migrating posting: {link}".format(link = link))
+        # also handles Hugo Bundles
+        new_link, new_file = self._rewrite_url(link, e)
+        new_full_file = self.hugo_path('content', new_file)
+        old_url = link
+        if (old_url[0:1] != '/'):
+            # complete the old URL with webroot
+            # required to write a full path into the redirect file
+            old_url = self.config.arguments.oldwebprefix + old_url
+
+        task = {'entry': e,
+                'link': link,
+                'old_url': old_url,
+                'new_link': new_link,
+                'new_file': new_file,
+                'new_full_file': new_full_file,
+                'unchanged': None}
+
+        return task
+
+
+    # _check_unchanged()
+    #
+    # find out if a planned blog posting changed since the last run (--incremental)
+    #
+    # parameter:
+    #  - self
+    #  - task from _plan_entry(), with the body columns
+    # return:
+    #  none, sets the fingerprint and the stored result in the task
+    def _check_unchanged(self, task):
+        task['fingerprint'] = self._entry_fingerprint(task)
+        task['unchanged'] = self.state.unchanged(task['entry'].id, task['fingerprint'], task['new_full_file'])
+        if (task['unchanged'] is not None):
+            logging.debug("Posting is unchanged: {link}".format(link = task['link']))
+
+
+    # _entry_fingerprint()
+    #
+    # describe all inputs which go into the converted posting
+    #
+    # parameter:
+    #  - self
+    #  - task from _plan_entry()
+    # return:
+    #  - dictionary with last_modified, hash of the content, and hash of the options and metadata
+    def _entry_fingerprint(self, task):
+        e = task['entry']
+        arguments = self.config.arguments
+        links = self.taxonomy_links_by_entry.get(e.id, TaxonomyLinks())
+        content = hashlib.sha256()
+        content.update(e.body.encode('utf8'))
+        content.update(b'\0')
+        content.update(e.extended.encode('utf8'))
+
+        options = {'webprefix': arguments.webprefix,
+                   'oldwebprefix': arguments.oldwebprefix,
+                   'imagedir': arguments.imagedir,
+                   'use_bundles': arguments.use_bundles,
+                   'remove_s9y_id': arguments.remove_s9y_id,
+                   'add_date_to_url': arguments.add_date_to_url,
+                   'use_utc': arguments.use_utc,
+                   'write_html': arguments.write_html,
+                   'image_link_mode': arguments.image_link_mode,
+                   # converter, version and HTML parser
+                   'html_converter': self.html_converter.version,
+                   'ignore_picture_errors': type(arguments.ignore_picture_errors) is list and task['link'] in arguments.ignore_picture_errors,
+                   # the Frontmatter uses these
+                   'new_file': task['new_file'],
+                   'title': e.title,
+                   'timestamp': e.timestamp,
+                   'isdraft': e.isdraft,
+                   'author': self.authors_by_id[e.authorid]['username'],
+                   'categories': [self.categories_by_id[c]['category_name'] if c in self.categories_by_id else c for c in links.categories],
+                   'tags': links.tags}
+        options = hashlib.sha256(json.dumps(options, sort_keys = True, default = str).encode('utf8'))
+
+        return {'last_modified': str(e.last_modified),
+                'content': content.hexdigest(),
+                'options': options.hexdigest()}
+
+
+    # _convert_entries()
+    #
+    # convert all planned blog postings, either serially or in a process pool
+    #
+    # parameter:
+    #  - self
+    #  - iterable with tasks from _plan_entry()
+    # return:
+    #  - generator with (task, result) tuples, in the order of the tasks
+    def _convert_entries(self, tasks):
+        jobs = self.config.arguments.jobs
+        if (jobs < 2):
+            for task in tasks:
+                if (task['unchanged'] is not None):
+                    yield task, task['unchanged']
+                else:
+                    yield task, self._convert_entry(task)
+            return
+
+        if (self.config.arguments.archetype_mode == 'template'):
+            # render the archetype template once, before the workers start
+            self.archetype.prepare()
+
+        logging.debug("Converting postings with {j} worker processes".format(j = jobs))
+        # only keep a limited number of postings in flight, this bounds the memory usage
+        window = jobs * 8
+        pending = collections.deque()
+        with concurrent.futures.ProcessPoolExecutor(max_workers = jobs,
+                                                    initializer = _entries_worker_init,
+                                                    initargs = (self, logging.getLogger().getEffectiveLevel())) as executor:
+            for task in tasks:
+                if (task['unchanged'] is not None):
+                    # nothing to convert, but keep the order
+                    result = concurrent.futures.Future()
+                    result.set_result(task['unchanged'])
+                else:
+                    result = executor.submit(_entries_worker_convert, task)
+                pending.append((task, result))
+                if (len(pending) >= window):
+                    task, future = pending.popleft()
+                    yield task, future.result()
+            while (len(pending) > 0):
+                task, future = pending.popleft()
+                yield task, future.result()
+
+
+    # _convert_entry()
+    #
+    # convert a single blog posting and write the Hugo file
+    # this runs in worker processes when --jobs is used
+    #
+    # parameter:
+    #  - self
+    #  - task from _plan_entry()
+    # return:
+    #  - dictionary with the collected redirects and the markers for the summary
+    def _convert_entry(self, task):
+        start = time.perf_counter()
+        e = task['entry']
+        link = task['link']
+        new_link = task['new_link']
+        new_file = task['new_file']
+        new_full_file = task['new_full_file']
+        redirects = RedirectShard()
+
+        if (not self.file_exists(new_full_file)):
+            # start from the archetype, and fill in the details later
+            with self.profiler.stage('archetype'):
+                fm = self.archetype.new_post(new_file, new_full_file)
+        else:
+            # get the Frontmatter from the content file
+            with self.profiler.stage('load frontmatter'):
+                fm = frontmatter.load(new_full_file)
+
+        body = e.body + "\n\n" + e.extended
+        #print(body)
+        original_body = body
+        body, parsed_body, pretty_body, unsupported, quotes_changed = self._rewrite_html(body, link, fm, new_link, new_file, new_full_file, redirects)
+        if (self.config.arguments.write_html):
+            html_filename = new_full_file[:-3] + ".html"
+            with self.profiler.stage('write html'), open(html_filename, 'w') as html_fh:
+                html_fh.write(original_body)
+                html_fh.write("\n\n\n\n\n\n")
+                html_fh.write(parsed_body)
+                html_fh.write("\n\n\n\n\n\n")
+                html_fh.write(pretty_body)
+
+        # FIXME: comments
+
+        with self.profiler.stage('generate frontmatter'):
+            fm = self._generate_frontmatter(fm, e.id, e, body)
+
+        marked = False
+        if ('TEXTREPLACED' in body or 'PICTUREISMISSING' in body):
+            marked = True
+            if ('TEXTREPLACED' in body):
+                fm['TextReplaced'] = True
+            if ('PICTUREISMISSING' in body):
+                fm['PictureMissing'] = True
+        if (unsupported):
+            fm['UnsupportedTags'] = True
+        if (quotes_changed):
+            fm['QuotesChanged'] = True
+
+        fm['OriginalLink'] = link
+
+        with self.profiler.stage('dump frontmatter'):
+            content = frontmatter.dumps(fm)
+        with self.profiler.stage('write posting'):
+            fh = io.open(new_full_file, 'w', encoding = 'utf8')
+            fh.write(content)
+            fh.write("\n")
+            fh.close()
+
+        result = {'redirects': redirects,
+                  'unsupported': unsupported,
+                  'quotes_changed': quotes_changed,
+                  'marked': marked,
+                  'images': self.image_placer.take_stats()}
+        if (self.conversion_cache is not None):
+            result['conversion_cache'] = self.conversion_cache.take_stats()
+        if (self.profiler.enabled):
+            result['seconds'] = time.perf_counter() - start
+            result['body_size'] = len(original_body.encode('utf-8'))
+            result['profile'] = self.profiler.take_stages()
+
+        return result
 
+
+    # the database connection and the open redirect files can't be
+    # copied into worker processes, the workers only collect redirects
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['db'] = None
+        state['redirects'] = None
+        state['redirect_links_seen'] = {}
+        state['state'] = None
+        return state
+
+
+    def archive(self):
         # find oldest entry
-        entries = self.db.entries()
-        for e in entries:
-            if (oldest_entry is False):
-                oldest_entry = e
-            if (e['timestamp'] < oldest_entry['timestamp']):
-                oldest_entry = e
+        oldest_timestamp = self.db.oldest_entry_timestamp()
 
-        if (oldest_entry is False):
+        if (oldest_timestamp is None):
             # nothing to do here
             return
 
-        oldest_time, oldest_date = self._date_and_time_for_entry(oldest_entry['timestamp'])
+        oldest_time, oldest_date = self._date_and_time_for_entry(oldest_timestamp)
         oldest_year = oldest_date[0:4]
         if (int(oldest_year) < 2000):
             # Serendipity project was started around 2002
@@ -1661,6 +5404,13 @@ class Migration:
         self._write_rewrite_file(old_url, self.config.arguments.archive_link, '')
 
         this_year = datetime.now().year
+        # all month links are one family for --compact-redirects, the year is the first group
+        if (self.config.arguments.add_year_link_to_archive):
+            family_link = "{al}#$1".format(al = self.config.arguments.archive_link)
+        else:
+            family_link = self.config.arguments.archive_link
+        family = ("{owp}archives/".format(owp = self.config.arguments.oldwebprefix),
+                  r'(\d{4})/\d\d(/summary)?\.html', family_link)
         # also generate links for every year and month the blog is active
         for year in range(int(oldest_year), int(this_year) + 1):
             if (self.config.arguments.add_year_link_to_archive):
@@ -1671,10 +5421,10 @@ class Migration:
             for month in range(1, 12 + 1):
                 old_url = "{owp}archives/{year}/{month:02d}.html".format(owp = self.config.arguments.oldwebprefix,
                                                                          year = year, month = month)
-                self._write_rewrite_file(old_url, redirect_link, '', keep_hashtag_in_new = True)
+                self._write_rewrite_file(old_url, redirect_link, '', keep_hashtag_in_new = True, family = family)
                 old_url = "{owp}archives/{year}/{month:02d}/summary.html".format(owp = self.config.arguments.oldwebprefix,
                                                                                  year = year, month = month)
-                self._write_rewrite_file(old_url, redirect_link, '', keep_hashtag_in_new = True)
+                self._write_rewrite_file(old_url, redirect_link, '', keep_hashtag_in_new = True, family = family)
 
 
 # end Migration class
@@ -1682,23 +5432,143 @@ class Migration:
 
 
 
+# worker functions for the process pool in Migration.entries()
+# every worker gets a copy of the Migration object once, at startup
+_worker_migration = None
+
+
+def _entries_worker_init(migration, level):
+    global _worker_migration
+    _worker_migration = migration
+    # the module is imported again if the workers are not forked,
+    # and the log level is reset to the default from basicConfig()
+    logging.getLogger().setLevel(level)
+    import_conversion_modules()
+    # with fork, the object is not pickled, drop the timings of the main process
+    migration.profiler.take_stages()
+
+
+def _entries_worker_convert(task):
+    return _worker_migration._convert_entry(task)
+
+
+
+
+
+# import_conversion_modules()
+#
+# load the libraries for converting the postings, on first use
+#
+# parameter:
+#  none
+# return:
+#  none
+def import_conversion_modules():
+    global markdownify, frontmatter, BeautifulSoup, gettz
+    if (markdownify is not None):
+        return
+
+    import markdownify
+    import frontmatter
+    from bs4 import BeautifulSoup
+    from dateutil.tz import gettz
+
+
+# package_version()
+#
+# version of an installed Python package
+#
+# parameter:
+#  - package name
+# return:
+#  - version, or 'unknown'
+def package_version(name):
+    import importlib.metadata
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+# dbm_module()
+#
+# find a dbm module which Apache can read for RewriteMap
+#
+# parameter:
+#  none
+# return:
+#  - tuple with module and Apache dbm type, or None if no module is available
+def dbm_module():
+    try:
+        import dbm.gnu
+        return (dbm.gnu, 'gdbm')
+    except ImportError:
+        pass
+    try:
+        import dbm.ndbm
+        return (dbm.ndbm, 'ndbm')
+    except ImportError:
+        pass
+
+    return None
+
+
+# peak_memory_usage()
+#
+# peak resident set size of this process, and of the largest child process
+#
+# parameter:
+#  none
+# return:
+#  - string with the memory usage in MB
+def peak_memory_usage():
+    if (resource is None):
+        return "unknown"
+
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS
+    if (sys.platform == 'darwin'):
+        factor = 1024 * 1024
+    else:
+        factor = 1024
+    usage = "{m:.1f} MB".format(m = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / factor)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if (children > 0):
+        usage += " (largest child process: {m:.1f} MB)".format(m = children / factor)
+
+    return usage
 
 
 def main():
     config = Config()
     config.parse_parameters()
+    profiler = Profiler(config)
+
+    with profiler.phase('connect'):
+        database = Database(config)
+
+    if (config.arguments.export_snapshot != ""):
+        database.export_snapshot(config.arguments.export_snapshot)
+        return
 
-    database = Database(config)
-
-    migration = Migration(config, database)
-    migration.archive()
-    migration.authors()
-    migration.categories()
-    migration.entry_categories()
-    migration.tags()
-    migration.permalinks()
-    migration.exits()
-    migration.entries()
+    with profiler.phase('setup'):
+        migration = Migration(config, database, profiler)
+    try:
+        for phase in [migration.archive,
+                      migration.authors,
+                      migration.categories,
+                      migration.entry_categories,
+                      migration.tags,
+                      migration.permalinks,
+                      migration.exits,
+                      migration.entries]:
+            with profiler.phase(phase.__name__):
+                phase()
+    finally:
+        # write out all buffered redirects, even if the migration stops early
+        with profiler.phase('close redirects'):
+            migration.redirects.close()
+
+    profiler.report()
 
 
 if __name__ == '__main__':